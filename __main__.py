@@ -3,13 +3,19 @@ from os import path
 
 sys.path.append(path.dirname(path.abspath(__file__)))  # noqa
 
-from devices.bluelog import *
-from devices.evlink import *
-from devices.powidian import *
-from gen_conf import gen_conf
-from influxdb.config import gen_tasks
-from openhab.modbus import *
-from openhab.ping_check import gen_ping_check
+from pathlib import Path
+from utils.profile import profiler
+from utils.stamps import Stamps
+
+if __name__ == "__main__" and "--profile" in sys.argv:
+    profiler.start()
+
+with profiler.stage("imports"):
+    from devices import BlueLogInverter, BlueLogSensor, EvlinkPro, PowiDian
+    from gen_conf import gen_conf
+    from influxdb.config import gen_tasks
+    from openhab.modbus import *
+    from openhab.ping_check import gen_ping_check
 
 
 files = {
@@ -51,10 +57,49 @@ ignore = set()  # configurations not yet used in openHAB
 
 if __name__ == "__main__":
     args = set(sys.argv)
+    # `--shard=master` or `--shard=location`: one pair of files per master/location, so that a change only reloads its shard
+    sharding = next((arg.split("=", 1)[1] for arg in args if arg.startswith("--shard=")), None)
+    if sharding not in (None, "master", "location"):
+        sys.exit(f"Unknown sharding: {sharding} (expected master or location)")
+
+    if "--watch" in args:
+        from watch import watch
+
+        try:
+            watch(sharding=sharding, push_tasks=not {"-t", "--no-tasks"} & args)
+        except KeyboardInterrupt:
+            pass
+        sys.exit()
+
+    # only the files and tasks whose inputs changed since the previous run are generated and pushed again
+    stamps = Stamps() if "--force" in args else Stamps.load()
+
+    if "--rest" in args:
+        from openhab.rest import RestClient, provision
+        from utils.env import get_env
+
+        with profiler.stage("provision"):
+            plan = provision(RestClient(get_env("OPENHAB_URL"), get_env("OPENHAB_TOKEN")), files, ignore)
+            print(f"openHAB registry: {plan.summary()}")
+    else:
+        with profiler.stage("gen_conf"):
+            for file, masters in files.items():
+                with profiler.stage(file):
+                    written, removed = gen_conf(file, masters, unused=file in ignore, sharding=sharding, stamps=stamps)
+                    for path in written:
+                        print(f"Written conf/{path}")
+                    for path in removed:
+                        print(f"Removed conf/{path}")
+        stamps.save()
 
-    for file, masters in files.items():
-        gen_conf(file, masters, unused=file in ignore)
+    with profiler.stage("gen_tasks"):
+        gen_tasks(files, dry_run={"-t", "--no-tasks"} & args, stamps=stamps)
+        stamps.save()
 
-    gen_tasks(files, dry_run={"-t", "--no-tasks"} & args)
+    with profiler.stage("gen_ping_check"):
+        if gen_ping_check({f: m for f, m in files.items() if f not in ignore}):
+            print("Written ping_check/generated/manifest.json")
 
-    gen_ping_check({f: m for f, m in files.items() if f not in ignore})
\ No newline at end of file
+    if profiler.enabled:
+        profiler.save(Path("profile.json"))
+        print(profiler.summary())
\ No newline at end of file
@@ -0,0 +1,207 @@
+import argparse
+import gc
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from os import path
+from pathlib import Path
+from typing import Callable, Optional
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))  # noqa
+
+from bench.site import stream_site, synthetic_site
+from gen_conf import gen_conf, split_props
+from influxdb.config import gen_tasks
+from openhab.ping_check import gen_ping_check
+from pipeline import stream
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+SIZES = [10, 100, 1000, 10000]
+"""Default site sizes (number of slaves)"""
+THRESHOLD = 0.2
+"""Default relative increase (of time or memory) considered a regression"""
+CALIBRATION_ROUNDS = 10000
+"""Iterations of the calibration workload (about 50 ms)"""
+MIN_TIME = 0.5
+"""Total time, in seconds, the timed runs of a short stage must take (over all the turns)"""
+MAX_REPEAT = 100
+"""Maximum number of timed runs of a stage"""
+
+
+def all_split_props(files):
+    for masters in files.values():
+        for master in masters:
+            for group in master.slaves.values():
+                for slave in group.slaves:
+                    for props in slave.get_prop_groups():
+                        for _ in split_props(props):
+                            pass
+
+
+def stages(files, out: Path, size: int) -> dict[str, Callable[[], None]]:
+    """
+    Returns the benchmarked generation stages, writing to a scratch directory. The `stream` stage runs the whole
+    streaming pipeline, building the site as it goes (its peak memory should not depend on the size).
+    """
+    (out / "things").mkdir(exist_ok=True)
+    (out / "items").mkdir(exist_ok=True)
+    return {
+        "gen_conf": lambda: [gen_conf(file, masters, False, out) for file, masters in files.items()],
+        "split_props": lambda: all_split_props(files),
+        "gen_tasks": lambda: gen_tasks(files, dry_run=True, gen_dir=out),
+        "gen_ping_check": lambda: gen_ping_check(files, out / "manifest.json"),
+        "stream": lambda: stream(stream_site(size), conf_path=out, gen_dir=out, manifest_path=out / "manifest.json"),
+    }
+
+
+def calibration_workload():
+    """
+    Fixed workload of the same kind as the generation stages (string formatting, dict and list operations), whose
+    time measures the speed of the machine
+    """
+    lines = []
+    for i in range(CALIBRATION_ROUNDS):
+        props = {f"prop_{j}": (i * j) % 97 for j in range(8)}
+        lines.append(",".join(f"{name}={value}" for name, value in sorted(props.items())))
+    return lines
+
+
+def calibrate(repeat: int = 3) -> float:
+    """
+    :return: the best wall time of the calibration workload, in seconds
+    """
+    return min(timed(calibration_workload) for _ in range(repeat))
+
+
+def timed(fn: Callable[[], None]) -> float:
+    gc.collect()
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def timed_runs(fn: Callable[[], None], min_time: float) -> list[float]:
+    """
+    Runs a stage at least once, and until it took `min_time` in total (at most `MAX_REPEAT` times)
+
+    :return: the wall time of each run
+    """
+    times = [timed(fn)]
+    while sum(times) < min_time and len(times) < MAX_REPEAT:
+        times.append(timed(fn))
+    return times
+
+
+def peak_memory(fn: Callable[[], None]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def run(sizes: list[int], repeat: int, only: Optional[list[str]] = None) -> dict:
+    """
+    Measures the best wall time of each stage over `repeat` turns, then its peak memory in an additional run. The
+    stages are run in turns, so that a busy period of the machine doesn't slow down all the runs of a stage; within a
+    turn, short stages are run again until they took `MIN_TIME / repeat`.
+
+    :param only: The stages to run (all by default)
+    :return: results by stage, then by size, and the `calibration` time: the best of the calibrations done before each
+             turn (like the stages, its best time is the least affected by the other processes of the machine)
+    """
+    results, calibrations = {}, []
+    for size in sizes:
+        turns = repeat if size < 10000 else 1
+        files = synthetic_site(size)
+        with tempfile.TemporaryDirectory() as tmp:
+            benchmarked = stages(files, Path(tmp), size)
+            if only:
+                if "gen_conf" not in only:
+                    # gen_conf resolves the slave IDs used by the other stages
+                    benchmarked["gen_conf"]()
+                benchmarked = {name: fn for name, fn in benchmarked.items() if name in only}
+            times = {name: [] for name in benchmarked}
+            for _ in range(turns):
+                calibrations.append(calibrate())
+                for name, fn in benchmarked.items():
+                    times[name] += timed_runs(fn, MIN_TIME / turns)
+            for name, fn in benchmarked.items():
+                result = {"time": min(times[name]), "peak": peak_memory(fn)}
+                results.setdefault(name, {})[str(size)] = result
+                print(f"{name:<16} {size:>6} slaves  {result['time'] * 1000:>10.1f} ms  {result['peak'] / 2 ** 20:>8.1f} MiB")
+    results["calibration"] = min(calibrations)
+    return results
+
+
+def stage_results(results: dict) -> dict[str, dict[str, dict[str, float]]]:
+    return {name: sizes for name, sizes in results.items() if name != "calibration"}
+
+
+def compare(results, baseline, threshold: float) -> list[str]:
+    """
+    Prints the difference with the baseline. The times of the baseline are first scaled by the ratio of the calibration
+    times, so that a baseline saved on another machine can be used.
+
+    :return: the list of regressions
+    """
+    regressions = []
+    speed = results["calibration"] / baseline["calibration"] if baseline.get("calibration") else 1
+    print(f"\nCalibration: {results['calibration'] * 1000:.1f} ms, {speed:.2f}x the time of the baseline machine\n")
+    for name, sizes in stage_results(results).items():
+        for size, result in sizes.items():
+            base = baseline.get(name, {}).get(size)
+            if base is None:
+                continue
+            deltas = []
+            for metric in ("time", "peak"):
+                expected = base[metric] * speed if metric == "time" else base[metric]
+                delta = result[metric] / expected - 1 if expected else 0
+                deltas.append(f"{metric} {delta:+.1%}")
+                if delta > threshold:
+                    regressions.append(f"{name} ({size} slaves): {metric} {delta:+.1%}")
+            print(f"{name:<16} {size:>6} slaves  {'  '.join(deltas)}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench",
+                                     description="Benchmarks the generation stages on synthetic sites")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="site sizes, in slaves")
+    parser.add_argument("--repeat", type=int, default=3, help="number of turns of timed runs (best is kept)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="relative increase considered a regression")
+    parser.add_argument("--stages", nargs="+", help="stages to run (all by default)")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat, args.stages)
+
+    if args.save:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        # the times kept from the previous baseline are scaled to this machine
+        speed = results["calibration"] / baseline["calibration"] if baseline.get("calibration") else 1
+        for sizes in stage_results(baseline).values():
+            for result in sizes.values():
+                result["time"] *= speed
+        baseline["calibration"] = results["calibration"]
+        for name, sizes in stage_results(results).items():
+            baseline.setdefault(name, {}).update(sizes)
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print("\nNo baseline, run with --save to create one")
+        return
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+    if regressions:
+        print("\nRegressions:\n" + "\n".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
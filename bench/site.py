@@ -0,0 +1,61 @@
+import random
+from typing import Iterator
+
+from devices import BlueLogInverter, BlueLogSensor, EvlinkPro, PowiDian
+from openhab.modbus import ModbusMaster
+
+LOCATIONS = [f"{building}{floor}" for building in "ABCDP" for floor in range(1, 5)]
+"""Locations the synthetic equipments are spread across"""
+
+MIX = [
+    ("sol", BlueLogInverter, 0.55),
+    ("sol", BlueLogSensor, 0.15),
+    ("ev", EvlinkPro, 0.25),
+    ("h2", PowiDian, 0.05),
+]
+"""File, device type and share of the slaves of a synthetic site"""
+
+SLAVES_PER_MASTER = {
+    BlueLogInverter: 8,
+    BlueLogSensor: 2,
+    EvlinkPro: 1,
+    PowiDian: 1,
+}
+"""Number of slaves of each type behind a single Modbus master"""
+
+
+def synthetic_site(slaves: int, seed: int = 0) -> dict[str, list[ModbusMaster]]:
+    """
+    Builds a site with the given number of slaves, mixing all device types in realistic proportions.
+
+    The site is deterministic for a given number of slaves and seed.
+    """
+    return {file: list(masters) for file, masters in stream_site(slaves, seed).items()}
+
+
+def stream_site(slaves: int, seed: int = 0) -> dict[str, Iterator[ModbusMaster]]:
+    """
+    Same site as `synthetic_site`, whose masters are only built as the files are iterated, in order (for the streaming
+    pipeline)
+    """
+    rng = random.Random(seed)
+    ip = 0
+
+    def masters(file: str) -> Iterator[ModbusMaster]:
+        nonlocal ip
+        for mix_file, device, share in MIX:
+            if mix_file != file:
+                continue
+            count = max(1, round(slaves * share))
+            per_master = SLAVES_PER_MASTER[device]
+            for first in range(0, count, per_master):
+                ip += 1
+                ids = range(1, min(per_master, count - first) + 1)
+                yield ModbusMaster(
+                    f"10.{ip // 65536}.{ip // 256 % 256}.{ip % 256}",
+                    f"{device.__name__[0]}{ip}",
+                    {id_s: device(f"{device.__name__} {first + id_s}", rng.choice(LOCATIONS)) for id_s in ids},
+                    0 if device is PowiDian else 100,
+                )
+
+    return {file: masters(file) for file in dict.fromkeys(file for file, _, _ in MIX)}
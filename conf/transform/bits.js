@@ -0,0 +1,8 @@
+(function(inputData, shift, width) {
+    // extracts a range of bits of a register read as uint16 (bit fields of a `StatusWord`)
+    var value = parseInt(inputData, 10);
+    if (isNaN(value)) {
+        return inputData;
+    }
+    return String(Math.floor(value / Math.pow(2, parseInt(shift, 10))) % Math.pow(2, parseInt(width, 10)));
+})(input, shift, width)
\ No newline at end of file
@@ -0,0 +1,22 @@
+// last published value of each Thing, kept by the script engine from one call to the next
+var published = published || {};
+
+(function(inputData, step, rel, key) {
+    // hysteresis: a value is only published once it moved by at least the step from the last published value of the
+    // Thing. Until then, the last published value is returned again, and the binding (which only sends changed values)
+    // drops it. Slow drifts are published once they add up to the step, and the published values are not rounded.
+    var value = parseFloat(inputData);
+    if (isNaN(value)) {
+        delete published[key];
+        return inputData;
+    }
+    var last = published[key];
+    if (last !== undefined) {
+        var threshold = Math.max(parseFloat(step) || 0, Math.abs(last.value) * (parseFloat(rel) || 0));
+        if (Math.abs(value - last.value) < threshold) {
+            return last.text;
+        }
+    }
+    published[key] = {value: value, text: inputData};
+    return inputData;
+})(input, step, rel, key)
\ No newline at end of file
@@ -1,6 +1,46 @@
-__all__ = [
-    "bluelog",
-    "elec",
-    "evlink",
-    "powidian"
-]
+"""
+Device profiles. The classes are imported on first access (`from devices import EvlinkPro` only imports
+`devices.evlink`), so that the startup time and memory track the devices used by the inventory, not the size of the
+catalog.
+"""
+import importlib
+from functools import lru_cache
+from importlib.metadata import EntryPoint, entry_points
+
+CATALOG = {
+    "BlueLogBase": "devices.bluelog",
+    "BlueLogInverter": "devices.bluelog",
+    "BlueLogSensor": "devices.bluelog",
+    "EvlinkPro": "devices.evlink",
+    "PowiDian": "devices.powidian",
+}
+"""Module defining each built-in device class (checked by `python -m devices --check`)"""
+
+ENTRY_POINT_GROUP = "openhab_config_gen.devices"
+"""Entry point group of the device classes provided by other packages"""
+
+# `from devices import *` imports every built-in profile: inventories should import the classes they use by name
+__all__ = list(CATALOG)
+
+
+@lru_cache(maxsize=None)
+def plugins() -> dict[str, EntryPoint]:
+    """
+    Returns the device classes declared by installed packages in the `openhab_config_gen.devices` entry point group
+    (example: `VendorInverter = "vendor_profiles.inverter:VendorInverter"`), only looked up for names that are not in
+    the catalog, as scanning the installed packages takes a few dozen milliseconds
+    """
+    return {ep.name: ep for ep in entry_points(group=ENTRY_POINT_GROUP)}
+
+
+def __getattr__(name: str):
+    # not cached in the module: `watch` unloads the changed device modules, the next access imports them again
+    if name in CATALOG:
+        return getattr(importlib.import_module(CATALOG[name]), name)
+    if not name.startswith("__") and name in plugins():
+        return plugins()[name].load()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *CATALOG, *plugins()})
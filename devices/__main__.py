@@ -0,0 +1,53 @@
+import argparse
+import importlib
+import inspect
+import pkgutil
+import sys
+from pathlib import Path
+
+import devices
+from openhab.modbus import SlaveBase
+
+
+def scan() -> dict[str, str]:
+    """
+    Imports every module of the `devices` package, and returns the module defining each device class
+    """
+    found = {}
+    for module in pkgutil.iter_modules([str(Path(devices.__file__).parent)]):
+        if module.name.startswith("_"):
+            continue
+        name = f"devices.{module.name}"
+        for cls_name, cls in vars(importlib.import_module(name)).items():
+            if inspect.isclass(cls) and issubclass(cls, SlaveBase) and cls.__module__ == name:
+                found[cls_name] = name
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m devices", description="Lists the device classes of the catalog")
+    parser.add_argument("--check", action="store_true",
+                        help="import every device module, and fail if `devices.CATALOG` is out of date")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        found = scan()
+        problems = [f"{name} is defined in {module} but missing from CATALOG"
+                    for name, module in found.items() if name not in devices.CATALOG]
+        problems += [f"CATALOG maps {name} to {module}, which doesn't define it"
+                     for name, module in devices.CATALOG.items() if found.get(name) != module]
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(1)
+        print(f"{len(found)} device classes, CATALOG is up to date")
+        return
+
+    for name, module in sorted(devices.CATALOG.items()):
+        print(f"{name:<24} {module}")
+    for name, ep in sorted(devices.plugins().items()):
+        print(f"{name:<24} {ep.value} (entry point)")
+
+
+if __name__ == "__main__":
+    main()
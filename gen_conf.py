@@ -1,112 +1,545 @@
+import filecmp
+import io
+import json
 import re
+import sys
+from collections import OrderedDict
 from collections.abc import Iterator
-from typing import TextIO, Union, AnyStr
+from typing import TextIO, Union, AnyStr, Literal, Optional
 
 from openhab.config import *
 from openhab.modbus import *
 from openhab.types import *
 from pathlib import Path
+from utils.profile import profiler
+from utils.stamps import Stamps, digest, source_digest
 import os
 
 CONF_PATH = Path(os.path.dirname(__file__)) / "conf"
 
+MANIFEST_NAME = ".gen_conf.json"
+"""Name of the file listing the generated files, in the configuration directory"""
 
-def gen_conf(file: str, masters: list[ModbusMaster], unused: bool):
+Sharding = Literal["master", "location"]
+"""Output layout: one pair of files per Modbus master, or per location"""
+
+GENERATOR_MODULES = (__name__, "openhab.config", "openhab.modbus", "openhab.types")
+"""Modules whose code the generated Things and Items depend on (along with the device modules)"""
+
+MAX_OPEN_SHARDS = 64
+"""Maximum number of shards whose temporary files are open at the same time"""
+
+
+def master_prefix(file: str, logger: ModbusMaster) -> str:
     """
-    Generates openHAB configuration files for a given list of Modbus masters
+    Returns the identifier prefix of a Modbus master
 
-    :param file: The name of the file to generate
-    :param masters: The list of Modbus masters to generate configuration for
-    :param unused: Whether to append `.unused` to the generated files, so they're not read by openHAB
+    Example: master `Y` of file `sol` will return `SOL_Y`
     """
-    suffix = ""
-    if unused:
-        suffix = ".unused"
+    return logger.custom_id or f"{file.upper()}_{logger.prefix}"
 
-    things = open(CONF_PATH / "things" / f"{file}.things{suffix}", "w", encoding="utf-8", newline="\n")
 
-    items = open(CONF_PATH / "items" / f"{file}.items{suffix}", "w", encoding="utf-8", newline="\n")
-    items.write("Group gModbus (gInfluxDB)\n")
-    items.write("\n")
+def resolve_ids(file: str, masters: list[ModbusMaster]):
+    """
+    Computes the identifiers of all slave groups (`effective_id`) and slaves (`prefix`) of a given list of Modbus masters,
+    without generating anything
 
+    :param file: The name of the file the masters belong to
+    :param masters: The list of Modbus masters
+    """
     for logger in masters:
-        prefix_l = logger.custom_id or f"{file.upper()}_{logger.prefix}"  # example: `SOL_Y`
+        prefix_l = master_prefix(file, logger)
         for id_s, slave_group in logger.slaves.items():
             prefix_s = slave_group.custom_id or f"{prefix_l}{id_s}"  # example: `SOL_Y3`
             slave_group.effective_id = prefix_s
-            name_s = slave_group.custom_name or prefix_s
-            name_bridge = f"{prefix_l}{id_s}: {slave_group.name}"  # example: `SOL_Y3: Inverter Bldg C 90kW (O3)`
-            # example: `Bridge modbus:tcp:SOL_Y3 "SOL_Y3: Inverter Bldg C 90kW (O3)" [ host="192.168.2.12", id="103" ] {`
-            with Block(things, f'Bridge modbus:tcp:{prefix_s} "{name_bridge}" [ host="{logger.ip}", id="{logger.slave_offset + id_s}" ]') as br:
-                for slave in slave_group.slaves:
-                    slave_name_s = slave.custom_name or name_s
-                    slave_prefix_s = "" if slave_group.custom_id == "" else prefix_s
-                    if slave.custom_id:
-                        slave_prefix_s = "_".join(filter(None, (slave_prefix_s, slave.custom_id)))
-                    slave.prefix = slave_prefix_s
-                    group_s = f"g{slave_prefix_s.capitalize()}"  # example: gSOL_Y3
-                    group_s = re.sub(r"_([a-z])", lambda m: m.group(1).upper(), group_s)  # example: gSolY3
-                    group = OHGroup(id=group_s, name=f"{slave_prefix_s}", slave=slave)
-                    # example: `Group gSolY3 "SOL_Y3 (Inverter Bldg C 90kW (O3))" <solarplant> (gModbus,gC3) ["Inverter"]`
-                    items.write(f"{group}\n")
-                    for group in slave.get_prop_groups():
-                        for poller in split_props(group):
-                            id_p = f"{slave_prefix_s}_{poller.id}"  # example: `SOL_Y3_General`
-
-                            # TODO(zdimension): for some reason, if we want to query values starting at A, we need to start at A-1
-                            # this is counterintuitive and should be investigated one day
-                            # till then we're fetching one more register than we need to
-                            # => this is not an inclusive-exclusive problem: if we use incorrect bounds, openHAB complains
-
-                            bridge = OHPollerBridge(
-                                id=id_p,
-                                name=f"{slave_name_s}: {poller.name}",  # example: `SOL_Y3: General`
-                                start=poller.start + slave.offset,
-                                length=poller.length + group.offset,
-                                type_=group.type_
-                            )
-                            # example: `Bridge poller SOL_Y3_General "SOL_Y3: General" [ start="40580", length="3", type="holding", maxTries="1" ] {`
-                            with Block(br, bridge) as po:
-                                for p in poller.props:
-                                    display_name = f"{slave_name_s}: {p.display_name}"  # example: `SOL_Y3: Temperature`
-                                    id_t = f"{slave_prefix_s.lower()}_{p.id}"  # example: `sol_y3_temp`
-
-                                    transforms = []
-                                    if p.valtype.xform:
-                                        transforms.append(
-                                            f"JS:{p.valtype.xform}.js")
-                                    if p.valtype.null:
-                                        transforms.append(
-                                            f"JS:null.js?when={p.valtype.null}")  # example: `JS:null.js?when=32768`
-
-                                    oh_thing = OHThing(
-                                        id=id_t,
-                                        name=display_name,
-                                        group=slave.group,
-                                        address=p.address + slave.offset + group.offset,
-                                        type_=p.valtype,
-                                        transforms=transforms
-                                    )
-                                    # example: `Thing data sol_y3_temp "SOL_Y3: Température" @ "C3" [ readStart="40581", readValueType="float32" ]`
-                                    po.write(f"{oh_thing}\n")
-
-                                    item = OHNumber(
-                                        id=id_t,
-                                        name=display_name,
-                                        format_string=p.get_format_string(),
-                                        quantity=p.quantity,
-                                        icon=p.icon,
-                                        group=group_s,
-                                        prefix=prefix_s,
-                                        bridge=bridge,
-                                        gain_string=p.get_gain_string(),
-                                        location=slave.group
-                                    )
-                                    # example: `Number:Temperature sol_y3_temp "SOL_Y3: Temperature [%.1f °C]" <temperature> (gModbus,
-                                    # gPvT4) ["Measurement", "Temperature"] {channel="modbus:data:SOL_Y3:SOL_Y3_General:sol_y3_temp:number" [
-                                    # profile="modbus:gainOffset", gain="1.0 °C"], influxdb="sol_y3_temp" [location="C3", building="C", floor="3"]}`
-                                    items.write(f"{item}\n")
-                    items.write("\n")
+            for slave in slave_group.slaves:
+                slave_prefix_s = "" if slave_group.custom_id == "" else prefix_s
+                if slave.custom_id:
+                    slave_prefix_s = "_".join(filter(None, (slave_prefix_s, slave.custom_id)))
+                slave.prefix = slave_prefix_s
+
+
+@dataclass
+class ResolvedPoller:
+    """
+    Poller of a slave, with the Things and Items of its properties
+    """
+    bridge: OHPollerBridge
+    things: list[OHThing]
+    items: list[OHNumber]
+    """Items, in the same order as `things`"""
+
+
+@dataclass
+class ResolvedSlave:
+    """
+    Slave, with its item group and pollers
+    """
+    slave: SlaveBase
+    group: OHGroup
+    pollers: list[ResolvedPoller]
+
+
+@dataclass
+class ResolvedBridge:
+    """
+    Modbus TCP bridge of a slave group, with all the objects generated for its slaves
+    """
+    master: ModbusMaster
+    tcp: OHTcpBridge
+    slaves: list[ResolvedSlave]
+
+
+def resolve_bridge(file: str, logger: ModbusMaster, id_s: int, slave_group: SlaveGroup) -> ResolvedBridge:
+    """
+    Builds the openHAB objects of a slave group. The identifiers must have been computed (`resolve_ids`).
+
+    :param file: The name of the file the master belongs to
+    :param logger: The Modbus master
+    :param id_s: The ID of the slave group on the master
+    :param slave_group: The slave group
+    """
+    prefix_l = master_prefix(file, logger)  # example: `SOL_Y`
+    prefix_s = slave_group.effective_id  # example: `SOL_Y3`
+    name_s = slave_group.custom_name or prefix_s
+    name_bridge = f"{prefix_l}{id_s}: {slave_group.name}"  # example: `SOL_Y3: Inverter Bldg C 90kW (O3)`
+    tcp = OHTcpBridge(id=prefix_s, name=name_bridge, host=logger.ip, slave_id=logger.slave_offset + id_s)
+    resolved = ResolvedBridge(logger, tcp, [])
+    for slave in slave_group.slaves:
+        slave_name_s = slave.custom_name or name_s
+        slave_prefix_s = slave.prefix
+        group_s = f"g{slave_prefix_s.capitalize()}"  # example: gSOL_Y3
+        group_s = re.sub(r"_([a-z])", lambda m: m.group(1).upper(), group_s)  # example: gSolY3
+        resolved_slave = ResolvedSlave(slave, OHGroup(id=group_s, name=f"{slave_prefix_s}", slave=slave), [])
+        resolved.slaves.append(resolved_slave)
+        profiler.count("slaves")
+        for group in slave.get_prop_groups():
+            with profiler.stage("split_props"):
+                pollers = list(split_props(group))
+            for poller in pollers:
+                id_p = f"{slave_prefix_s}_{poller.id}"  # example: `SOL_Y3_General`
+
+                # TODO(zdimension): for some reason, if we want to query values starting at A, we need to start at A-1
+                # this is counterintuitive and should be investigated one day
+                # till then we're fetching one more register than we need to
+                # => this is not an inclusive-exclusive problem: if we use incorrect bounds, openHAB complains
+
+                bridge = OHPollerBridge(
+                    id=id_p,
+                    name=f"{slave_name_s}: {poller.name}",  # example: `SOL_Y3: General`
+                    start=poller.start + slave.offset,
+                    length=poller.length + group.offset,
+                    type_=group.type_
+                )
+                resolved_poller = ResolvedPoller(bridge, [], [])
+                resolved_slave.pollers.append(resolved_poller)
+                profiler.count("pollers")
+                profiler.count("registers", bridge.length)
+                for p in poller.props:
+                    display_name = f"{slave_name_s}: {p.display_name}"  # example: `SOL_Y3: Temperature`
+                    id_t = f"{slave_prefix_s.lower()}_{p.id}"  # example: `sol_y3_temp`
+                    update_unchanged = round(p.get_deadband().max_silence * 1000)
+
+                    if group.type_ in BIT_POLLER_TYPES:
+                        # coil or discrete input: a single bit, no scaling nor rounding
+                        resolved_poller.things.append(OHThing(
+                            id=id_t,
+                            name=display_name,
+                            group=slave.group,
+                            address=slave.register_address(group, p),
+                            type_=p.valtype,
+                            transforms=[],
+                            update_unchanged=update_unchanged
+                        ))
+                        resolved_poller.items.append(OHFlag(
+                            id=id_t,
+                            name=display_name,
+                            icon=p.icon,
+                            group=group_s,
+                            bridge=bridge,
+                            location=slave.group,
+                            prefix=prefix_s,
+                            type_=FLAG_TYPES[group.type_]
+                        ))
+                        profiler.count("items")
+                        continue
+
+                    transforms = []
+                    if p.valtype.xform:
+                        transforms.append(
+                            f"JS:{p.valtype.xform}.js")
+                    if p.valtype.null:
+                        transforms.append(
+                            f"JS:null.js?when={p.valtype.null}")  # example: `JS:null.js?when=32768`
+                    if deadband_transform := p.get_deadband_transform(id_t):
+                        transforms.append(deadband_transform)  # example: `JS:deadband.js?step=0.1&rel=0&key=sol_y3_temp`
+
+                    resolved_poller.things.append(OHThing(
+                        id=id_t,
+                        name=display_name,
+                        group=slave.group,
+                        address=slave.register_address(group, p),
+                        type_=p.valtype,
+                        transforms=transforms,
+                        update_unchanged=update_unchanged
+                    ))
+
+                    resolved_poller.items.append(OHNumber(
+                        id=id_t,
+                        name=display_name,
+                        format_string=p.get_format_string(),
+                        quantity=p.quantity,
+                        icon=p.icon,
+                        group=group_s,
+                        prefix=prefix_s,
+                        bridge=bridge,
+                        gain_string=p.get_gain_string(),
+                        location=slave.group
+                    ))
+                    profiler.count("items")
+
+                    for bits in p.fields if isinstance(p, StatusWord) else ():
+                        # the fields are decoded from the register of the word, which the poller already reads
+                        register, bit = p.field_register(bits)
+                        id_f = f"{slave_prefix_s.lower()}_{bits.id}"  # example: `sol_y3_fault`
+                        name_f = f"{slave_name_s}: {bits.display_name}"
+                        resolved_poller.things.append(OHThing(
+                            id=id_f,
+                            name=name_f,
+                            group=slave.group,
+                            address=slave.register_address(group, p) + register,
+                            type_=BIT if bits.width == 1 else U16,
+                            transforms=[transform] if (transform := p.field_transform(bits)) else [],
+                            update_unchanged=update_unchanged,
+                            bit=bit if bits.width == 1 else None
+                        ))
+                        if bits.item == "Number":
+                            item = OHNumber(id=id_f, name=name_f, format_string="%d", quantity=None, icon=p.icon,
+                                            group=group_s, prefix=prefix_s, bridge=bridge, gain_string="1.0",
+                                            location=slave.group)
+                        else:
+                            item = OHFlag(id=id_f, name=name_f, icon=p.icon, group=group_s, bridge=bridge,
+                                          location=slave.group, prefix=prefix_s, type_=bits.item)
+                        resolved_poller.items.append(item)
+                        profiler.count("items")
+    return resolved
+
+
+def resolve(file: str, masters: list[ModbusMaster]) -> Iterator[ResolvedBridge]:
+    """
+    Builds the openHAB objects of a given list of Modbus masters, one slave group at a time
+
+    :param file: The name of the file the masters belong to
+    :param masters: The list of Modbus masters
+    """
+    resolve_ids(file, masters)
+
+    for logger in masters:
+        for id_s, slave_group in logger.slaves.items():
+            yield resolve_bridge(file, logger, id_s, slave_group)
+
+
+def write_things(things: TextIO, bridge: ResolvedBridge):
+    """
+    Writes the Things of a Modbus TCP bridge, in the openHAB DSL format
+    """
+    # example: `Bridge modbus:tcp:SOL_Y3 "SOL_Y3: Inverter Bldg C 90kW (O3)" [ host="192.168.2.12", id="103" ] {`
+    with Block(things, bridge.tcp) as br:
+        for slave in bridge.slaves:
+            for poller in slave.pollers:
+                # example: `Bridge poller SOL_Y3_General "SOL_Y3: General" [ start="40580", length="3", type="holding", maxTries="1" ] {`
+                with Block(br, poller.bridge) as po:
+                    for oh_thing in poller.things:
+                        # example: `Thing data sol_y3_temp "SOL_Y3: Température" @ "C3" [ readStart="40581", readValueType="float32" ]`
+                        po.write(f"{oh_thing}\n")
+
+
+def write_items(items: TextIO, bridge: ResolvedBridge):
+    """
+    Writes the Items of a Modbus TCP bridge, in the openHAB DSL format
+    """
+    for slave in bridge.slaves:
+        # example: `Group gSolY3 "SOL_Y3 (Inverter Bldg C 90kW (O3))" <solarplant> (gModbus,gC3) ["Inverter"]`
+        items.write(f"{slave.group}\n")
+        for poller in slave.pollers:
+            for item in poller.items:
+                # example: `Number:Temperature sol_y3_temp "SOL_Y3: Temperature [%.1f °C]" <temperature> (gModbus,
+                # gPvT4) ["Measurement", "Temperature"] {channel="modbus:data:SOL_Y3:SOL_Y3_General:sol_y3_temp:number" [
+                # profile="modbus:gainOffset", gain="1.0 °C"], influxdb="sol_y3_temp" [location="C3", building="C", floor="3"]}`
+                items.write(f"{item}\n")
+        items.write("\n")
+
+
+def shard_name(file: str, logger: ModbusMaster, slave_group: SlaveGroup, sharding: Optional[Sharding]) -> str:
+    """
+    Returns the name of the files a Modbus TCP bridge is written to. Shard names only depend on the IP address of the
+    master or on the location of the (first) slave, so they don't change when devices are added or removed elsewhere.
+
+    Example: `sol` without sharding, `sol.192.168.2.12` by master, `sol.C3` by location
+    """
+    if sharding == "master":
+        key = logger.ip
+    elif sharding == "location":
+        key = slave_group.slaves[0].group
+    else:
+        return file
+    return f"{file}.{re.sub(r'[^A-Za-z0-9_.-]', '_', key)}"
+
+
+def temp_path(path: Path) -> Path:
+    """
+    Returns the temporary file a file is generated to. Its name doesn't end with `.things`/`.items`, so openHAB ignores it.
+    """
+    return path.with_name(f".{path.name}.tmp")
+
+
+def replace_if_changed(path: Path) -> bool:
+    """
+    Replaces a file with its newly generated temporary file, unless they have the same content: openHAB reloads a file
+    (and reprovisions all its things and items) whenever it is written. The file is replaced atomically, so openHAB
+    never reads it partially written.
+
+    :return: whether the file was replaced
+    """
+    tmp = temp_path(path)
+    if path.exists() and filecmp.cmp(tmp, path, shallow=False):
+        tmp.unlink()
+        return False
+    os.replace(tmp, path)
+    return True
+
+
+class ShardWriter:
+    """
+    Temporary files of the shards of a file, opened when a shard is first written. Only the `MAX_OPEN_SHARDS` most
+    recently written shards are kept open, the other ones are closed and reopened in append mode, so that sharding
+    thousands of masters doesn't exhaust the file descriptors.
+    """
+
+    def __init__(self, conf_path: Path, suffix: str = ""):
+        """
+        :param conf_path: The openHAB configuration directory, containing the `things` and `items` directories
+        :param suffix: Suffix of the generated files (`.unused` or nothing)
+        """
+        self.conf_path = conf_path
+        self.suffix = suffix
+        self.names: dict[str, None] = {}
+        """Shards written so far, in order"""
+        self.open_files: OrderedDict[str, tuple[TextIO, TextIO]] = OrderedDict()
+        """Open temporary files, from the least to the most recently written shard"""
+
+    def paths(self, name: str) -> tuple[str, str]:
+        """
+        Returns the paths of the Things and Items files of a shard, relative to the configuration directory
+        """
+        return f"things/{name}.things{self.suffix}", f"items/{name}.items{self.suffix}"
+
+    def open(self, name: str) -> tuple[TextIO, TextIO]:
+        """
+        Returns the Things and Items temporary files of a shard, valid until another shard is opened
+        """
+        files = self.open_files.get(name)
+        if files is not None:
+            self.open_files.move_to_end(name)
+            return files
+        if len(self.open_files) >= MAX_OPEN_SHARDS:
+            for f in self.open_files.popitem(last=False)[1]:
+                f.close()
+        started = name in self.names
+        things, items = (open(temp_path(self.conf_path / path), "a" if started else "w", encoding="utf-8", newline="\n")
+                         for path in self.paths(name))
+        if not started:
+            items.write("Group gModbus (gInfluxDB)\n")
+            items.write("\n")
+            self.names[name] = None
+        self.open_files[name] = (things, items)
+        return things, items
+
+    def close(self) -> tuple[list[str], list[str]]:
+        """
+        Closes the temporary files, and replaces the shards whose content changed
+
+        :return: the files of all the shards, and the ones that were replaced, relative to the configuration directory
+        """
+        for files in self.open_files.values():
+            for f in files:
+                f.close()
+        self.open_files.clear()
+        generated, changed = [], []
+        for name in self.names:
+            for path in self.paths(name):
+                generated.append(path)
+                if replace_if_changed(self.conf_path / path):
+                    changed.append(path)
+        return generated, changed
+
+
+def read_manifest(conf_path: Path) -> dict[str, list[str]]:
+    """
+    Returns the files generated for each file of the inventory, relative to the configuration directory
+    """
+    manifest_path = conf_path / MANIFEST_NAME
+    return json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+
+def update_manifest(conf_path: Path, file: str, generated: list[str]) -> list[str]:
+    """
+    Records the files generated for a file of the inventory, and removes the ones generated by the previous run that
+    weren't generated again (removed shards, `.unused` toggled, sharding changed). Only files listed in the manifest
+    (or the unsharded files) are ever removed.
+
+    :param generated: paths of the generated files, relative to the configuration directory
+    :return: the removed files
+    """
+    manifest_path = conf_path / MANIFEST_NAME
+    manifest = read_manifest(conf_path)
+    previous = set(manifest.get(file, []))
+    previous.update(f"{kind}/{file}.{kind}{suffix}" for kind in ("things", "items") for suffix in ("", ".unused"))
+    removed = [name for name in sorted(previous - set(generated)) if (conf_path / name).exists()]
+    for name in removed:
+        (conf_path / name).unlink()
+    manifest[file] = generated
+    temp_path(manifest_path).write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n")
+    replace_if_changed(manifest_path)
+    return removed
+
+
+def group_signature(logger: ModbusMaster, id_s: int, slave_group: SlaveGroup) -> tuple:
+    """
+    Returns everything the generated Things and Items of a slave group depend on: the master, the slave group and its
+    slaves, and their device classes (compared by identity, as reloading a device module creates new classes)
+    """
+    return (
+        logger.ip, logger.prefix, logger.slave_offset, logger.custom_id, id_s,
+        slave_group.name, slave_group.custom_id, slave_group.custom_name,
+        tuple((type(slave), repr(sorted((k, v) for k, v in vars(slave).items() if k not in ("slaves", "prefix"))))
+              for slave in slave_group.slaves),
+    )
+
+
+def conf_inputs(file: str, masters: list[ModbusMaster], unused: bool, conf_path: Path,
+                sharding: Optional[Sharding]) -> str:
+    """
+    Returns the digest of everything the configuration files of a file depend on: the generator code, the source of
+    the device classes, the masters and their slave groups, and the generation options
+    """
+    classes = {type(slave) for logger in masters for slave_group in logger.slaves.values() for slave in slave_group.slaves}
+    return digest(
+        source_digest(sys.modules[name] for name in GENERATOR_MODULES),
+        source_digest(sorted(classes, key=lambda c: (c.__module__, c.__qualname__))),
+        file, unused, str(conf_path), sharding,
+        [group_signature(logger, id_s, slave_group) for logger in masters for id_s, slave_group in logger.slaves.items()],
+    )
+
+
+@dataclass
+class RenderCache:
+    """
+    Rendered Things and Items of each slave group, reused as long as the slave group doesn't change. Used by the watch
+    mode, to only resolve the slave groups affected by a change, and to only write the shards containing them.
+
+    The slave groups are keyed by their signature (see `group_signature`), that is by everything their output depends
+    on: two slave groups with the same key (the same IP and slave ID on two masters, for example) are rendered the same.
+    """
+    files: dict[str, dict[tuple, tuple[str, str]]] = field(default_factory=dict)
+    """By file, then by slave group signature: Things and Items of the slave group"""
+    layouts: dict[str, dict[str, list[tuple]]] = field(default_factory=dict)
+    """By file, then by shard: the slave groups written to the shard, by the previous call"""
+    hits: int = 0
+    misses: int = 0
+
+    def render(self, file: str, logger: ModbusMaster, id_s: int, slave_group: SlaveGroup,
+               rendered: dict[tuple, tuple[str, str]]) -> tuple[tuple, bool]:
+        """
+        Renders the Things and Items of a slave group, unless they are in the cache
+
+        :param rendered: The new cache entries of the file, where the slave group is added
+        :return: the key of the slave group in `rendered`, and whether it was in the cache
+        """
+        key = group_signature(logger, id_s, slave_group)
+        entry = self.files.get(file, {}).get(key)
+        hit = entry is not None
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+            bridge = resolve_bridge(file, logger, id_s, slave_group)
+            things, items = io.StringIO(), io.StringIO()
+            write_things(things, bridge)
+            write_items(items, bridge)
+            entry = (things.getvalue(), items.getvalue())
+        rendered[key] = entry
+        return key, hit
+
+
+def gen_conf(file: str, masters: list[ModbusMaster], unused: bool, conf_path: Path = CONF_PATH,
+             sharding: Optional[Sharding] = None, cache: Optional[RenderCache] = None,
+             stamps: Optional[Stamps] = None) -> tuple[list[str], list[str]]:
+    """
+    Generates openHAB configuration files for a given list of Modbus masters
+
+    :param file: The name of the file to generate
+    :param masters: The list of Modbus masters to generate configuration for
+    :param unused: Whether to append `.unused` to the generated files, so they're not read by openHAB
+    :param conf_path: The openHAB configuration directory, containing the `things` and `items` directories
+    :param sharding: Split the output into one pair of files per master or per location, instead of one per file
+    :param cache: Reuse the output of the slave groups that didn't change since the previous call, and don't even
+                  compare the shards made only of those
+    :param stamps: Don't generate anything if the inputs of the file (see `conf_inputs`) didn't change since the
+                   previous run and its files still exist
+    :return: the files that were written (unchanged files are not) and the files that were removed, relative to
+             `conf_path`
+    """
+    shards = ShardWriter(conf_path, ".unused" if unused else "")
+
+    resolve_ids(file, masters)
+    if stamps is not None:
+        inputs = conf_inputs(file, masters, unused, conf_path, sharding)
+        outputs = read_manifest(conf_path).get(file)
+        if outputs is not None and stamps.fresh(f"conf:{file}", inputs, (conf_path / path for path in outputs)):
+            return [], []
+
+    generated = []
+    if cache is None:
+        if sharding is None:
+            # an empty file still gets its (empty) configuration files
+            shards.open(file)
+        for logger in masters:
+            for id_s, slave_group in logger.slaves.items():
+                bridge = resolve_bridge(file, logger, id_s, slave_group)
+                things, items = shards.open(shard_name(file, logger, slave_group, sharding))
+                write_things(things, bridge)
+                write_items(items, bridge)
+    else:
+        rendered, layout, dirty = {}, {}, set()
+        if sharding is None:
+            layout[file] = []
+        for logger in masters:
+            for id_s, slave_group in logger.slaves.items():
+                name = shard_name(file, logger, slave_group, sharding)
+                key, hit = cache.render(file, logger, id_s, slave_group, rendered)
+                layout.setdefault(name, []).append(key)
+                if not hit:
+                    dirty.add(name)
+        previous = cache.layouts.get(file, {})
+        for name, keys in layout.items():
+            if name not in dirty and previous.get(name) == keys \
+                    and all((conf_path / path).exists() for path in shards.paths(name)):
+                generated += shards.paths(name)
+                continue
+            things, items = shards.open(name)
+            for key in keys:
+                things.write(rendered[key][0])
+                items.write(rendered[key][1])
+        cache.files[file] = rendered
+        cache.layouts[file] = layout
+
+    written, changed = shards.close()
+    generated += written
+    removed = update_manifest(conf_path, file, generated)
+    if stamps is not None:
+        stamps.record(f"conf:{file}", inputs)
+    return changed, removed
 
 
 class Block:
@@ -140,6 +573,13 @@ class Block:
 MAX_POLLER_LEN = 120
 """Maximum length of a Modbus poller (in reality, this is supposed to be around 125, but we round down to 120 to make sure it always works)"""
 
+MAX_POLLER_BITS = 1990
+"""Maximum length of a coil or discrete input poller (a single read request returns at most 2000 bits, we round down to
+1990 for the same reasons as MAX_POLLER_LEN)"""
+
+FLAG_TYPES: dict[OHPollerType, FlagType] = {"coil": "Switch", "discrete": "Contact"}
+"""Item type of the properties of the bit pollers"""
+
 
 @dataclass
 class SplitProps:
@@ -166,21 +606,23 @@ def proplist_len(plist: list[ModbusProp], start: int, end: int) -> int:
 
 def split_props(group: PropGroup) -> Iterator[SplitProps]:
     """
-    Split a group of properties into multiple groups of at most MAX_POLLER_LEN properties.
+    Split a group of properties into multiple groups of at most MAX_POLLER_LEN registers (MAX_POLLER_BITS bits for coils
+    and discrete inputs).
     """
 
     start = 0
     sub_id = 1
+    max_len = MAX_POLLER_BITS if group.type_ in BIT_POLLER_TYPES else MAX_POLLER_LEN
 
     # How the algorithm works:
     # 1. We start at the beginning of the list of properties
-    # 2. We find the last property such as all properties up to it fit in a poller of length MAX_POLLER_LEN
+    # 2. We find the last property such as all properties up to it fit in a poller of length max_len
     # 3. We yield a poller with the properties from the start to the last property
     # 4. We keep on going with the properties after the last property
     # In other words, we greedily try to fit as many properties as possible in a poller, and when it's full, we start a new one.
     while start < len(group.props):
         last = len(group.props) - 1
-        while proplist_len(group.props, start, last) > MAX_POLLER_LEN:
+        while proplist_len(group.props, start, last) > max_len:
             last -= 1
         real_props = group.props[start:last + 1]
         id_p_real = group.id
@@ -0,0 +1,147 @@
+import argparse
+import difflib
+import shutil
+import sys
+import tempfile
+from os import path
+from pathlib import Path
+from typing import Callable, get_args
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))  # noqa
+
+from gen_conf import gen_conf, MANIFEST_NAME
+from golden.cases import edge_cases
+from influxdb.config import gen_tasks
+from openhab.config import FlagType
+from pipeline import stream
+from utils.inventory import load_inventory
+
+EXPECTED_PATH = Path(__file__).parent / "expected"
+
+CASES: dict[str, Callable[[], tuple[dict, set]]] = {
+    "reference": load_inventory,
+    "edge": lambda: (edge_cases(), set()),
+}
+"""Golden cases: functions returning an inventory (`files` and `ignore`)"""
+
+
+def generate(files, ignore, out: Path):
+    """
+    Generates the openHAB configuration and Flux tasks of an inventory, like `__main__.py` does
+    """
+    for directory in ("things", "items", "flux"):
+        (out / directory).mkdir(parents=True, exist_ok=True)
+    for file, masters in files.items():
+        gen_conf(file, masters, unused=file in ignore, conf_path=out)
+    gen_tasks(files, dry_run=True, gen_dir=out / "flux")
+
+
+def generate_streamed(files, ignore, out: Path):
+    """
+    Generates the same files with the streaming pipeline (`python -m pipeline`)
+    """
+    for directory in ("things", "items", "flux"):
+        (out / directory).mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        stream(files, ignore, conf_path=out, gen_dir=out / "flux", manifest_path=Path(tmp) / "manifest.json")
+
+
+def entry_id(line: str) -> str:
+    """
+    Returns the identifier of a generated line, used to match lines between two versions of a file
+
+    >>> entry_id('    Thing data sol_y1_temp "SOL_Y1: Temperature" @ "A4" [ readStart="40581" ]')
+    'Thing data sol_y1_temp'
+    >>> entry_id('Number:Temperature sol_y1_temp "SOL_Y1: Temperature [%.1f °C]" <temperature>')
+    'Item sol_y1_temp'
+    >>> entry_id('Switch edge_s1_running "EDGE_S1: Running" <alarm> (gModbus,gEdgeS1) ["Status"]')
+    'Item edge_s1_running'
+    """
+    words = line.split()
+    if not words or words[0] == "}":
+        return ""
+    if words[0] in ("Bridge", "Thing"):
+        return " ".join(words[:3])
+    if len(words) > 1 and (words[0] in ("Group", *get_args(FlagType)) or words[0].split(":")[0] == "Number"):
+        return f"{'Group' if words[0] == 'Group' else 'Item'} {words[1]}"
+    return ""
+
+
+def structured_diff(expected: str, actual: str) -> list[str]:
+    """
+    Compares two versions of a .things or .items file entry by entry
+
+    :return: one line per added, removed or changed entry
+    """
+    def entries(text):
+        return {entry_id(line): line.strip() for line in text.splitlines() if entry_id(line)}
+
+    old, new = entries(expected), entries(actual)
+    report = [f"  + {key}" for key in new if key not in old]
+    report += [f"  - {key}" for key in old if key not in new]
+    for key in old:
+        if key in new and old[key] != new[key]:
+            report.append(f"  ~ {key}\n      expected: {old[key]}\n      actual:   {new[key]}")
+    if not report:
+        # same entries, so the difference is in the ordering or the layout
+        report = ["  " + line for line in difflib.unified_diff(expected.splitlines(), actual.splitlines(), lineterm="", n=1)]
+    return report
+
+
+def compare(expected_dir: Path, actual_dir: Path) -> list[str]:
+    """
+    Compares generated files byte for byte with the expected ones (the manifest of the generated files is ignored)
+
+    :return: a report of the differences (empty if there are none)
+    """
+    report = []
+    expected = {p.relative_to(expected_dir) for p in expected_dir.rglob("*") if p.is_file()}
+    actual = {p.relative_to(actual_dir) for p in actual_dir.rglob("*") if p.is_file() and p.name != MANIFEST_NAME}
+    for name in sorted(expected | actual):
+        if name not in actual:
+            report.append(f"{name}: missing")
+        elif name not in expected:
+            report.append(f"{name}: unexpected file")
+        else:
+            old, new = (expected_dir / name).read_bytes(), (actual_dir / name).read_bytes()
+            if old != new:
+                report.append(f"{name}: differs")
+                report += structured_diff(old.decode("utf-8"), new.decode("utf-8"))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m golden",
+                                     description="Checks that the generated files are identical to the golden corpus")
+    parser.add_argument("cases", nargs="*", help=f"cases to check: {', '.join(CASES)} (default: all)")
+    parser.add_argument("--update", action="store_true", help="replace the expected files with the generated ones")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.cases) - CASES.keys()
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    failed = False
+    for case in args.cases or CASES:
+        # the streaming pipeline must generate the same files
+        for name, gen in ((case, generate), (f"{case} (stream)", generate_streamed)):
+            files, ignore = CASES[case]()
+            with tempfile.TemporaryDirectory() as tmp:
+                gen(files, ignore, Path(tmp))
+                if args.update:
+                    shutil.rmtree(EXPECTED_PATH / case, ignore_errors=True)
+                    shutil.copytree(tmp, EXPECTED_PATH / case, ignore=shutil.ignore_patterns(MANIFEST_NAME))
+                    print(f"{case}: updated")
+                    break
+                report = compare(EXPECTED_PATH / case, Path(tmp))
+            if report:
+                failed = True
+                print(f"{name}: FAILED")
+                print("\n".join(report))
+            else:
+                print(f"{name}: OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
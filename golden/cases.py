@@ -0,0 +1,144 @@
+from influxdb.types import *
+from openhab.modbus import *
+from openhab.types import *
+
+
+class GapDevice(SlaveBase):
+    """
+    Device with sparse registers, so that the pollers have holes and have to be split
+    """
+
+    icon: ClassVar = "energy"
+    tags: ClassVar = ["Sensor"]
+    props: ClassVar = PropGroup("Sparse", "Sparse registers", [
+        (10, U16, I_ENER, "a", "First", None, "%d", None),
+        (60, U16(scale=10), I_ENER, "b", "After a gap", VOLTAGE, "%.1f", "V"),
+        (129, F32, I_TEMP, "c", "Crossing the poller limit", TEMP, "%.1f", "°C"),
+        (131, U16(null=65535), I_ENER, "d", "Nullable", None, "%d", None),
+        (400, U16, I_ENER, "e", "Far away", None, "%d", None),
+    ])
+    deadman: ClassVar = "a"
+
+
+class WideDevice(GapDevice):
+    """
+    Device with 64-bit and word-swapped types, in a second property group
+    """
+
+    props: ClassVar = PropGroup("Wide", "Wide types", [
+        (1000, U64, I_ENER, "u64", "Unsigned 64-bit", ENERGY, "%d", "Wh"),
+        (1004, I64, I_ENER, "i64", "Signed 64-bit", ENERGY, "%d", "Wh"),
+        (1008, U32s, I_ENER, "u32s", "Unsigned 32-bit swapped", POWER, "%d", "W"),
+        (1010, I32s(null=-1), I_ENER, "i32s", "Signed 32-bit swapped", POWER, "%d", "W"),
+        (1012, U16s, I_ENER, "u16s", "Unsigned 16-bit swapped", None, "%d", None),
+        *seq(2, (1013, I16(scale=100), I_TEMP, "t%d", "Temperature %d", TEMP, "%.2f", "°C")),
+    ])
+    alerts: ClassVar = [
+        RangeAlert("t1", None, 90),
+        RangeAlert("t2", -10, None),
+    ]
+
+
+class InputDevice(SlaveBase):
+    """
+    Device read with input registers and no address offset
+    """
+
+    icon: ClassVar = "battery"
+    tags: ClassVar = ["Battery"]
+    props: ClassVar = PropGroup("Input", "Input registers", [
+        (0, U16, I_ENER, "soc", "State of charge", None, "%.1f", "%"),
+        (1, I16(null=-32768, scale=10), I_TEMP, "temp", "Temperature", TEMP, "%.1f", "°C"),
+    ], "input", 0)
+
+
+class DeadbandDevice(SlaveBase):
+    """
+    Device with explicit and derived deadbands
+    """
+
+    icon: ClassVar = "energy"
+    tags: ClassVar = ["Sensor"]
+    props: ClassVar = PropGroup("Deadband", "Deadbands", [
+        (0, F32, I_ENER, "derived", "Derived from the format", POWER, "%.2f", "W"),
+        (2, F32, I_ENER, "absolute", "Absolute", POWER, "%.1f", "W", Deadband(5, max_silence=60)),
+        (4, F32, I_ENER, "relative", "Relative", ENERGY, "%.1f", "Wh", Deadband(relative=0.001)),
+        (6, F32, I_ENER, "disabled", "Disabled", POWER, "%.1f", "W", Deadband(0, max_silence=1)),
+        (8, U16(scale=10), I_ENER, "coarse", "Coarser than a raw unit", VOLTAGE, "%d", "V"),
+        (9, U16(null=65535), I_ENER, "nullable", "Nullable", None, "%d", None, Deadband(10)),
+    ])
+
+
+class StatusDevice(SlaveBase):
+    """
+    Device with status words, whose flags and bit ranges are read from the registers of the words
+    """
+
+    icon: ClassVar = "alarm"
+    tags: ClassVar = ["Sensor"]
+    props: ClassVar = PropGroup("Status", "Status words", [
+        (0, F32, I_ENER, "p", "Power", POWER, "%.1f", "W"),
+        StatusWord(2, U16, "alarm", "status", "Status word", None, "%d", None, fields=[
+            BitField(0, "running", "Running", "Switch"),
+            BitField(1, "door", "Door open"),
+            BitField(4, "mode", "Operating mode", "Number", 3),
+            BitField(15, "fault", "Fault"),
+        ]),
+        StatusWord(3, U32s, "alarm", "alarms", "Alarm word", None, "%d", None, fields=[
+            BitField(17, "overheat", "Overheating"),
+            BitField(20, "errors", "Error count", "Number", 4),
+        ]),
+    ])
+    deadman: ClassVar = "status"
+
+
+class IoDevice(SlaveBase):
+    """
+    Device with coils and discrete inputs, too far apart for a single discrete input poller
+    """
+
+    icon: ClassVar = "switch"
+    tags: ClassVar = ["Switch"]
+    props: ClassVar = PropGroup("Coils", "Coils", [
+        (0, BIT, "switch", "relay1", "Relay 1", None, "%d", None),
+        (1, BIT, "switch", "relay2", "Relay 2", None, "%d", None),
+        (500, BIT, "switch", "pump", "Pump", None, "%d", None),
+    ], "coil")
+
+
+class IoSensorDevice(IoDevice):
+    """
+    `IoDevice` with discrete inputs, in a second property group
+    """
+
+    props: ClassVar = PropGroup("Inputs", "Discrete inputs", [
+        *seq(3, (10, BIT, "contact", "door%d", "Door %d", None, "%d", None)),
+        (2500, BIT, "contact", "tamper", "Tamper", None, "%d", None),
+    ], "discrete", 0)
+
+
+def edge_cases() -> dict[str, list[ModbusMaster]]:
+    """
+    Inventory exercising the corner cases of the generator
+    """
+    return {
+        "edge": [
+            ModbusMaster("10.0.0.1", "G", {
+                1: GapDevice("Gaps", "A1"),
+                2: WideDevice("Wide types", "A2", custom_name="Wide"),
+                3: WideDevice("Shifted", "A3", offset=100),
+            }),
+            ModbusMaster("10.0.0.2", "", {
+                1: InputDevice("No prefix", "B1", custom_id=""),
+                2: InputDevice("Custom ID", "B2", custom_id="BATT"),
+            }, 0),
+            ModbusMaster("10.0.0.3", "H", {
+                4: InputDevice("Custom master ID", "C1"),
+                5: DeadbandDevice("Deadbands", "C2"),
+            }, custom_id="CUSTOM"),
+            ModbusMaster("10.0.0.4", "S", {
+                1: StatusDevice("Status", "D1"),
+                2: IoSensorDevice("I/O", "D2"),
+            }),
+        ],
+    }
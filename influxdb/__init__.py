@@ -1,4 +1,6 @@
 __all__ = [
+    "backtest",
+    "capacity",
     "config",
     "types"
 ]
@@ -0,0 +1,223 @@
+import argparse
+import json
+import re
+import sys
+from dataclasses import dataclass, asdict, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from gen_conf import resolve
+from openhab.modbus import ModbusMaster
+from utils.inventory import load_inventory, DEFAULT_INVENTORY
+
+DAY = 86400
+
+DATA_BUCKET = "demobucket"
+"""Bucket the openHAB items are persisted to, and read by the generated tasks"""
+MONITORING_BUCKET = "_monitoring"
+"""System bucket the check statuses are written to"""
+
+ALERTS_EVERY = 30
+"""Period of the "Python alerts task" (custom_alerts.flux), in seconds"""
+DEADMAN_EVERY = 10
+"""Period of the "Global deadman task" (global_deadman.flux), in seconds"""
+
+TASK_PATH = Path(__file__).parent / "tasks"
+"""Flux task templates (`influxdb.config.TASK_PATH`, without requiring the InfluxDB client)"""
+CHECK = re.compile(r"^check = \{(.*?)\}\}$", re.DOTALL | re.MULTILINE)
+"""Extracts the `check` record of a task"""
+CHECK_TAG = re.compile(r'(\w+): "([^"{]*)"')
+"""Extracts the tags of the statuses written by a check from the `check` record of its task"""
+
+
+@dataclass
+class PlannerConfig:
+    """
+    Assumptions of the capacity estimation
+    """
+    poll_interval: float = 0.5
+    """Poller refresh interval in seconds (the generated pollers use the binding's default, 500 ms)"""
+    persist_interval: Optional[float] = None
+    """Persistence interval in seconds (`everyMinute`: 60), or None for the `everyChange` strategy"""
+    change_ratio: float = 0.2
+    """With `everyChange`, share of the polls that produce a different value"""
+    bytes_per_point: float = 2.5
+    """Disk usage of a point once compacted (TSM compression is very efficient on regularly spaced floats)"""
+    bytes_per_series: int = 200
+    """Index overhead of a series"""
+    retention_days: dict[str, float] = field(default_factory=lambda: {DATA_BUCKET: 365, MONITORING_BUCKET: 7})
+    """Retention period of each bucket, in days"""
+    status_fields: int = 2
+    """Number of fields of a check status (`_message` and the checked value)"""
+
+
+@dataclass
+class BucketLoad:
+    """
+    Estimated load of a bucket
+    """
+    series: int = 0
+    """Series cardinality"""
+    points_per_s: float = 0
+    """Written points per second"""
+    bytes_per_day: float = 0
+    """Ingested line protocol per day, in bytes"""
+    storage: float = 0
+    """Disk usage once the retention period is reached, in bytes"""
+
+
+def line_size(measurement: str, tags: dict[str, str], fields: dict[str, str]) -> int:
+    """
+    Size of a point in line protocol, with a nanosecond timestamp
+
+    >>> line_size("sol_y1_temp", {"location": "A4"}, {"value": "21.5"})
+    55
+    """
+    key = ",".join([measurement, *(f"{k}={v}" for k, v in sorted(tags.items()))])
+    values = ",".join(f"{k}={v}" for k, v in fields.items())
+    return len(f"{key} {values} 0000000000000000000\n")
+
+
+@lru_cache(maxsize=None)
+def check_tags(template: str) -> dict[str, str]:
+    """
+    Tags of the statuses written by the check of a task template (except `_check_id`, `_level` and the tags of the
+    checked data)
+
+    >>> check_tags("global_deadman.flux")
+    {'_check_name': 'Global deadman', '_type': 'deadman', 'deadman': 'deadman'}
+    """
+    check = CHECK.search((TASK_PATH / template).read_text())
+    return dict(CHECK_TAG.findall(check.group(1))) if check else {}
+
+
+def plan(files: dict[str, list[ModbusMaster]], config: PlannerConfig) -> dict[str, dict[str, BucketLoad]]:
+    """
+    Estimates the InfluxDB load caused by an inventory
+
+    :return: the load of each bucket, by file
+    """
+    rate = 1 / config.persist_interval if config.persist_interval else config.change_ratio / config.poll_interval
+    loads = {}
+    for file, masters in files.items():
+        data, monitoring = BucketLoad(), BucketLoad()
+        for bridge in resolve(file, masters):
+            for slave in bridge.slaves:
+                for poller in slave.pollers:
+                    for item in poller.items:
+                        # every item of gModbus is persisted (cf `Group gModbus (gInfluxDB)`), in its own measurement
+                        measurement, tags = item.binding_conf()["influxdb"]
+                        data.series += 1
+                        data.points_per_s += rate
+                        data.bytes_per_day += rate * DAY * line_size(measurement, tags, {"value": "-1234.5678"})
+
+                # one status per run of each check, with `ok` and `crit` levels as separate series
+                measures = [f"{slave.slave.prefix.lower()}_{alert.field}" for alert in slave.slave.get_alerts()]
+                checks = [(measure, "custom_alerts.flux", ALERTS_EVERY) for measure in measures]
+                if slave.slave.deadman is not None:
+                    checks.append((f"{slave.slave.prefix.lower()}_{slave.slave.deadman}", "global_deadman.flux", DEADMAN_EVERY))
+                for measure, template, every in checks:
+                    monitoring.series += 2 * config.status_fields
+                    monitoring.points_per_s += config.status_fields / every
+                    tags = {**check_tags(template), "_check_id": "0" * 16, "_level": "crit",
+                            "_source_measurement": measure, "location": slave.slave.group}
+                    monitoring.bytes_per_day += DAY / every * line_size("statuses", tags, {"_message": f'"{"x" * 100}"', "value": "0"})
+
+        for bucket, load in ((DATA_BUCKET, data), (MONITORING_BUCKET, monitoring)):
+            points = load.points_per_s * DAY * config.retention_days.get(bucket, 0)
+            load.storage = points * config.bytes_per_point + load.series * config.bytes_per_series
+        loads[file] = {DATA_BUCKET: data, MONITORING_BUCKET: monitoring}
+    return loads
+
+
+def totals(loads: dict[str, dict[str, BucketLoad]]) -> dict[str, BucketLoad]:
+    """
+    Sums the load of every file, by bucket
+    """
+    result = {}
+    for buckets in loads.values():
+        for bucket, load in buckets.items():
+            total = result.setdefault(bucket, BucketLoad())
+            total.series += load.series
+            total.points_per_s += load.points_per_s
+            total.bytes_per_day += load.bytes_per_day
+            total.storage += load.storage
+    return result
+
+
+def human(n: float) -> str:
+    """
+    >>> human(1536)
+    '1.5 KiB'
+    """
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n:.0f} B"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+
+def report(current: dict[str, dict[str, BucketLoad]], proposed: Optional[dict[str, dict[str, BucketLoad]]] = None,
+           out=sys.stdout):
+    """
+    Prints the load of each file and bucket, and the difference with a proposed inventory if given
+    """
+    rows = [("file", "bucket", "series", "points/s", "ingest/day", "storage")]
+
+    def add(name, cur: Optional[BucketLoad], new: Optional[BucketLoad], bucket):
+        cur, new = cur or BucketLoad(), new
+        if new is None:
+            rows.append((name, bucket, f"{cur.series}", f"{cur.points_per_s:.1f}", human(cur.bytes_per_day), human(cur.storage)))
+        else:
+            rows.append((name, bucket, f"{cur.series} -> {new.series} ({new.series - cur.series:+d})",
+                         f"{cur.points_per_s:.1f} -> {new.points_per_s:.1f}",
+                         f"{human(cur.bytes_per_day)} -> {human(new.bytes_per_day)}",
+                         f"{human(cur.storage)} -> {human(new.storage)} ({'+' if new.storage >= cur.storage else '-'}{human(abs(new.storage - cur.storage))})"))
+
+    names = list(current) + [f for f in (proposed or {}) if f not in current]
+    for name in names:
+        for bucket in (DATA_BUCKET, MONITORING_BUCKET):
+            cur = current.get(name, {}).get(bucket)
+            new = (proposed.get(name, {}).get(bucket) or BucketLoad()) if proposed is not None else None
+            add(name, cur, new, bucket)
+    for bucket, load in totals(current).items():
+        add("TOTAL", load, totals(proposed).get(bucket) if proposed is not None else None, bucket)
+
+    widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        out.write("  ".join(x.ljust(w) for x, w in zip(row, widths)).rstrip() + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m influxdb.capacity",
+                                     description="Estimates the InfluxDB series cardinality, write load and storage of the inventory")
+    parser.add_argument("--inventory", type=Path, default=DEFAULT_INVENTORY, help="current inventory script")
+    parser.add_argument("--proposed", type=Path, help="proposed inventory script, to compare with the current one")
+    parser.add_argument("--poll-interval", type=float, default=PlannerConfig.poll_interval, help="poller refresh (s)")
+    parser.add_argument("--persist-interval", type=float, help="persistence interval (s), default: everyChange")
+    parser.add_argument("--change-ratio", type=float, default=PlannerConfig.change_ratio,
+                        help="share of polls producing a new value (everyChange)")
+    parser.add_argument("--retention", type=float, default=365, help=f"retention of {DATA_BUCKET} (days)")
+    parser.add_argument("--json", action="store_true", help="output JSON")
+    args = parser.parse_args(argv)
+
+    config = PlannerConfig(args.poll_interval, args.persist_interval, args.change_ratio)
+    config.retention_days[DATA_BUCKET] = args.retention
+
+    def load(path):
+        files, ignore = load_inventory(path)
+        return plan({f: m for f, m in files.items() if f not in ignore}, config)
+
+    current = load(args.inventory)
+    proposed = load(args.proposed) if args.proposed else None
+    if args.json:
+        def as_dict(loads):
+            return {f: {b: asdict(l) for b, l in buckets.items()} for f, buckets in loads.items()}
+        json.dump({"current": as_dict(current), "proposed": as_dict(proposed) if proposed else None}, sys.stdout, indent=2)
+    else:
+        report(current, proposed)
+
+
+if __name__ == "__main__":
+    main()
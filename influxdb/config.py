@@ -1,15 +1,22 @@
 import os
 import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
 
 import influxdb_client
 from utils.env import get_env
-from influxdb_client import TaskCreateRequest
+from influxdb_client import TaskCreateRequest, TaskUpdateRequest
 
-from openhab.modbus import ModbusMaster
+from gen_conf import replace_if_changed, temp_path
+from openhab.modbus import ModbusMaster, SlaveBase
+from utils.profile import profiler
+from utils.stamps import Stamps, digest
 
-org = get_env("INFLUX_ORG")
-token = get_env("INFLUX_TOKEN")
-url = get_env("INFLUX_URL")
+TASK_PATH = Path(os.path.dirname(__file__)) / "tasks"
+GEN_PATH = Path(os.path.dirname(__file__)) / "generated"
+TEMPLATE_CACHE_PATH = TASK_PATH / "__pycache__"
+"""Compiled templates, keyed by template name and source checksum"""
 
 id_count = 0
 
@@ -25,54 +32,215 @@ def check_id():
     return f"55555555{id_count:08x}"
 
 
-def gen_tasks(files: dict[str, list[ModbusMaster]], dry_run=False):
-    if not dry_run:
-        client = influxdb_client.InfluxDBClient(url=url, token=token, org=org, debug=False)
+TASK_NAME = re.compile(r'option task = \{\s*name:\s*"([^"]+)"')
+"""Extracts the name of a task from its Flux code"""
 
-        labels_api = client.labels_api()
-        lbl = [l for l in labels_api.find_labels() if l.name == "generated"]
-        if len(lbl) == 0:
-            label = labels_api.create_label("generated", org)
-        else:
-            label = lbl[0]
 
-        tasks_api = client.tasks_api()
-        existing = [t for t in tasks_api.find_tasks(type="basic") if label in t.labels]
-        for task in existing:
-            tasks_api.delete_task(task.id)
+@lru_cache(maxsize=None)
+def task_environment():
+    """
+    Returns the Jinja environment of the Flux templates. Each template is compiled once per process (and reloaded when
+    its file changes, for the watch mode), and its compiled code is kept in `TEMPLATE_CACHE_PATH` for the next runs.
 
-    from jinja2 import environment
+    Block tags don't output any whitespace (`trim_blocks` and `lstrip_blocks`): the templates control the layout of
+    the generated code.
+    """
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
-    jinja_env = environment.Environment()
+    TEMPLATE_CACHE_PATH.mkdir(exist_ok=True)
+    jinja_env = Environment(loader=FileSystemLoader(TASK_PATH), bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_PATH),
+                            trim_blocks=True, lstrip_blocks=True)
     jinja_env.globals["check_id"] = check_id
 
     def surround_by_quote(x):
         return f'"{x}"'
 
     jinja_env.filters["quote"] = surround_by_quote
+    return jinja_env
+
+
+def task_entries(slave: SlaveBase, class_alerts: dict[type, list[tuple[str, str, str]]]) -> tuple[tuple, list[tuple]]:
+    """
+    Returns the `deadman` entry and the `alerts` entries of a slave (see `task_context`)
 
-    jinja_env.globals["files"] = files
+    :param class_alerts: Rendered alerts of each device class, filled as new classes are seen
+    """
+    prefix = slave.prefix.lower()
+    device = type(slave)
+    deadman = (f"{prefix}_{slave.deadman}" if slave.deadman is not None else None, slave.name, device.__name__)
+    rendered = class_alerts.get(device)
+    if rendered is None:
+        rendered = class_alerts[device] = [(alert.field, alert.flux(), alert.message()) for alert in slave.get_alerts()]
+    return deadman, [(f"{prefix}_{field}", slave.name, crit, message) for field, crit, message in rendered]
+
+
+def task_context(files: dict[str, list[ModbusMaster]]) -> dict:
+    """
+    Returns the variables of the Flux templates, computed in a single pass over the inventory so that the templates
+    only loop over flat lists:
+    - `deadman`: `(measurement, equipment, device)` of every slave, in inventory order (`measurement` is None for the
+      devices without a deadman field)
+    - `alerts`: `(measurement, equipment, crit, message)` of every alert of every slave, in inventory order. The Flux code of the
+      alerts is rendered once per device class, as the alerts are class attributes.
+    """
+    class_alerts: dict[type, list[tuple[str, str, str]]] = {}
+    deadman = []
+    alerts = []
+    for masters in files.values():
+        for master in masters:
+            for group in master.slaves.values():
+                for slave in group.slaves:
+                    entry, slave_alerts = task_entries(slave, class_alerts)
+                    deadman.append(entry)
+                    alerts += slave_alerts
+    return {"deadman": deadman, "alerts": alerts}
+
+
+def render_tasks(files: dict[str, list[ModbusMaster]]) -> dict[str, str]:
+    """
+    Renders the Flux task templates of `TASK_PATH`. The slave prefixes must have been resolved (`gen_conf` or
+    `resolve_ids`).
+
+    The check IDs are numbered from 1, so rendering the same inventory always gives the same code.
 
-    from pathlib import Path
-    task_dir = Path(os.path.dirname(__file__)) / "tasks"
-    gen_dir = Path(os.path.dirname(__file__)) / "generated"
-    for file in os.listdir(task_dir):
+    :return: the Flux code of each template, by file name
+    """
+    global id_count
+    id_count = 0
+
+    jinja_env = task_environment()
+    context = task_context(files)
+    tasks = {}
+    for file in sorted(os.listdir(TASK_PATH)):
         if file.endswith(".flux"):
-            path = task_dir / file
-            # jinja2 the code
-            with open(path, "r", encoding="utf-8") as f:
-                # render the template
-                flux = jinja_env.from_string(f.read()).render()
-            flux = re.sub(r"\n\s*\n", "\n", flux)
+            with profiler.stage(file):
+                tasks[file] = jinja_env.get_template(file).render(context)
+            profiler.count("tasks")
+    return tasks
 
-            with open((gen_dir / file), "w", encoding="utf-8") as f:
-                f.write(flux)
 
-            if dry_run:
-                continue
+def write_tasks(context: dict, gen_dir: Path = GEN_PATH) -> dict[str, bool]:
+    """
+    Renders the Flux task templates of `TASK_PATH` to `gen_dir` chunk by chunk, without building their code in memory,
+    so `context` can hold iterables read lazily (the templates may iterate them several times). Files are only replaced
+    when their content changes.
 
-            # create the task
-            task_request = TaskCreateRequest(flux=flux, org_id=org, status="active")
-            task = tasks_api.create_task(task_create_request=task_request)
+    :param context: The variables of the templates (see `task_context`)
+    :return: whether each file was replaced, by file name
+    """
+    global id_count
+    id_count = 0
 
-            tasks_api.add_label(label.id, task.id)
+    jinja_env = task_environment()
+    written = {}
+    for file in sorted(os.listdir(TASK_PATH)):
+        if file.endswith(".flux"):
+            with profiler.stage(file):
+                with open(temp_path(gen_dir / file), "w", encoding="utf-8") as f:
+                    for chunk in jinja_env.get_template(file).generate(context):
+                        f.write(chunk)
+                written[file] = replace_if_changed(gen_dir / file)
+            profiler.count("tasks")
+    return written
+
+
+def sync_tasks(tasks: dict[str, str]) -> dict[str, list[str]]:
+    """
+    Makes the tasks labeled `generated` in InfluxDB match the given Flux code: tasks are matched by name, and only the
+    new ones are created, the changed ones updated and the ones that aren't generated anymore deleted. Running it twice
+    doesn't change anything.
+
+    :param tasks: Flux code, by file name
+    :return: the names of the created, updated and deleted tasks
+    """
+    org = get_env("INFLUX_ORG")
+    token = get_env("INFLUX_TOKEN")
+    url = get_env("INFLUX_URL")
+    client = influxdb_client.InfluxDBClient(url=url, token=token, org=org, debug=False)
+    changes = {"created": [], "updated": [], "deleted": []}
+
+    with profiler.stage("api"):
+        labels_api = client.labels_api()
+        lbl = [l for l in labels_api.find_labels() if l.name == "generated"]
+        profiler.count("api_calls")
+        if len(lbl) == 0:
+            label = labels_api.create_label("generated", org)
+            profiler.count("api_calls")
+        else:
+            label = lbl[0]
+
+        tasks_api = client.tasks_api()
+        existing = {}
+        for task in tasks_api.find_tasks(type="basic"):
+            if label in task.labels:
+                if task.name in existing:
+                    # duplicate left by a previous version of the generator
+                    tasks_api.delete_task(task.id)
+                    profiler.count("api_calls")
+                    changes["deleted"].append(task.name)
+                else:
+                    existing[task.name] = task
+        profiler.count("api_calls")
+
+        for file, flux in tasks.items():
+            match = TASK_NAME.search(flux)
+            if match is None:
+                raise ValueError(f"{file}: no `option task = {{name: ...}}`")
+            name = match.group(1)
+            task = existing.pop(name, None)
+            if task is None:
+                task_request = TaskCreateRequest(flux=flux, org_id=org, status="active")
+                task = tasks_api.create_task(task_create_request=task_request)
+                tasks_api.add_label(label.id, task.id)
+                profiler.count("api_calls", 2)
+                changes["created"].append(name)
+            elif task.flux != flux:
+                tasks_api.update_task_request(task.id, TaskUpdateRequest(flux=flux))
+                profiler.count("api_calls")
+                changes["updated"].append(name)
+
+        for name, task in existing.items():
+            tasks_api.delete_task(task.id)
+            profiler.count("api_calls")
+            changes["deleted"].append(name)
+    return changes
+
+
+def gen_tasks(files: dict[str, list[ModbusMaster]], dry_run=False, gen_dir: Path = GEN_PATH,
+              stamps: Optional[Stamps] = None) -> dict[str, str]:
+    """
+    Renders the Flux tasks to `gen_dir` and, unless `dry_run` is set, synchronizes them with InfluxDB
+
+    :param stamps: Only synchronize the tasks if one of them changed (or was removed) since the last synchronization
+    :return: the Flux code of each task, by file name
+    """
+    tasks = render_tasks(files)
+    for file, flux in tasks.items():
+        with open((gen_dir / file), "w", encoding="utf-8") as f:
+            f.write(flux)
+
+    if not dry_run:
+        push_tasks(tasks, stamps)
+    return tasks
+
+
+def push_tasks(tasks: dict[str, str], stamps: Optional[Stamps] = None):
+    """
+    Synchronizes the tasks with InfluxDB and prints the changes
+
+    :param tasks: Flux code, by file name
+    :param stamps: Only synchronize the tasks if one of them changed (or was removed) since the last synchronization
+    """
+    artifacts = {f"task:{file}": digest(flux) for file, flux in tasks.items()}
+    if stamps is not None and stamps.names("task:") == artifacts.keys() \
+            and all(stamps.fresh(name, inputs) for name, inputs in artifacts.items()):
+        return
+    # credentials are only needed when actually pushing the tasks, so that the inventory can be loaded offline
+    changes = sync_tasks(tasks)
+    for action, names in changes.items():
+        for name in names:
+            print(f"Task {action}: {name}")
+    if stamps is not None:
+        stamps.forget("task:", artifacts)
+        for name, inputs in artifacts.items():
+            stamps.record(name, inputs)
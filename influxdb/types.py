@@ -12,6 +12,12 @@ class Alert:
     def flux(self) -> str:
         raise NotImplementedError
 
+    def crit(self, value):
+        """
+        Python equivalent of `flux()`, evaluated on a single value or a NumPy array of values
+        """
+        raise NotImplementedError
+
     def message(self) -> str:
         raise NotImplementedError
 
@@ -37,6 +43,14 @@ class RangeAlert(Alert):
             crit.append(f"r.value > {self.max}")
         return " or ".join(crit)
 
+    def crit(self, value):
+        crit = False
+        if self.min is not None:
+            crit = crit | (value < self.min)
+        if self.max is not None:
+            crit = crit | (value > self.max)
+        return crit
+
     def message(self) -> str:
         bounds = [
             self.min if self.min is not None else "-inf",
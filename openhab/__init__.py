@@ -1,6 +1,11 @@
 __all__ = [
     "config",
+    "decode",
     "modbus",
+    "partition",
     "ping_check",
+    "rest",
+    "rest_standin",
+    "simulator",
     "types"
 ]
@@ -46,8 +46,34 @@ class OHBridge:
         return f'Bridge poller {self.id} "{self.name}" [ {quote_dict(self.params)} ]'
 
 
+@dataclass
+class OHTcpBridge(OHBridge):
+    """
+    openHAB Modbus binding TCP slave Bridge
+    """
+    host: str
+    """IP address of the Modbus master"""
+    slave_id: int
+    """Modbus slave (unit) ID"""
+
+    def __post_init__(self):
+        self.params = {
+            "host": self.host,
+            "id": self.slave_id
+        }
+
+    def __str__(self):
+        return f'Bridge modbus:tcp:{self.id} "{self.name}" [ {quote_dict(self.params)} ]'
+
+
 OHPollerType = Literal["coil", "discrete", "holding", "input"]
 
+BIT_POLLER_TYPES: tuple[OHPollerType, ...] = ("coil", "discrete")
+"""Poller types reading single bits instead of registers"""
+
+FlagType = Literal["Switch", "Contact"]
+"""Item types of single bits"""
+
 
 @dataclass
 class OHPollerBridge(OHBridge):
@@ -85,15 +111,24 @@ class OHThing:
     """Value type"""
     transforms: list[str]
     """Transforms to be applied"""
+    update_unchanged: Optional[int] = None
+    """Interval in milliseconds at which unchanged values are still sent to openHAB (binding default: 1000)"""
+    bit: Optional[int] = None
+    """Bit of the register to read, with `readValueType="bit"` (0: least significant bit)"""
 
-    def __str__(self):
+    def params(self) -> dict[str, Any]:
         params = {
-            "readStart": self.address,
+            "readStart": self.address if self.bit is None else f"{self.address}.{self.bit}",
             "readValueType": self.type_.openhab_full()
         }
         if self.transforms:
             params["readTransform"] = "∩".join(self.transforms)
-        return f'Thing data {self.id} "{self.name}" @ "{self.group}" [ {quote_dict(params)} ]'
+        if self.update_unchanged is not None:
+            params["updateUnchangedValuesEveryMillis"] = self.update_unchanged
+        return params
+
+    def __str__(self):
+        return f'Thing data {self.id} "{self.name}" @ "{self.group}" [ {quote_dict(self.params())} ]'
 
 
 @dataclass
@@ -116,8 +151,18 @@ class OHItem:
     def get_tags(self) -> list[OHTag]:
         raise NotImplementedError()
 
+    def binding_conf(self) -> dict[str, tuple[str, dict[str, Any]]]:
+        """
+        Returns the channel link and the metadata of the item, as (value, configuration) by namespace
+        """
+        return {}
+
     def __str__(self):
         tag_list = "[" + quote_list(self.get_tags()) + "]"
+        binding = ", ".join(
+            f"{key}={quote(val)}" + (f" [{quote_dict(tags)}]" if tags else "")
+            for key, (val, tags)
+            in self.binding_conf().items())
 
         parts = [
             self.type(),
@@ -125,7 +170,8 @@ class OHItem:
             f'"{self.name}"',
             f"<{self.icon}>" if self.icon else None,
             f"(gModbus,{self.group})",
-            tag_list
+            tag_list,
+            "{" + binding + "}" if binding else None
         ]
 
         return " ".join(filter(None, parts))
@@ -176,13 +222,35 @@ class OHNumber(OHItem):
             })
         }
 
-    def __str__(self):
-        binding = "{" + ", ".join(
-            f"{key}={quote(val)} [{quote_dict(tags)}]"
-            for key, (val, tags)
-            in self.binding_conf().items()) + "}"
 
-        return super().__str__() + " " + binding
+@dataclass
+class OHFlag(OHItem):
+    """
+    openHAB "Switch" or "Contact" Item, showing a single bit (coil, discrete input or bit of a status word)
+    """
+    bridge: OHBridge
+    """The openHAB Modbus Bridge this item belongs to."""
+    location: str
+    """Location, with format "A1" where A is a building identifier and 1 is a floor identifier."""
+    prefix: str
+    type_: FlagType
+
+    def type(self):
+        return self.type_
+
+    def get_tags(self) -> list[OHTag]:
+        return ["Status"]
+
+    def binding_conf(self):
+        return {
+            # the `switch` and `contact` channels of a data thing are ON/OPEN when the value is not 0
+            "channel": (f"modbus:data:{self.prefix}:{self.bridge.id}:{self.id}:{self.type_.lower()}", {}),
+            "influxdb": (self.id, {
+                "location": self.location,
+                "building": self.location[0],
+                "floor": self.location[1]
+            })
+        }
 
 
 @dataclass
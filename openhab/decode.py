@@ -0,0 +1,217 @@
+import argparse
+import json
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+
+from gen_conf import resolve_ids, split_props
+from openhab.config import BIT_POLLER_TYPES, OHPollerType
+from openhab.modbus import ModbusProp, SlaveBase
+from openhab.types import STRUCT_FORMATS
+from utils.inventory import load_inventory, DEFAULT_INVENTORY
+
+Dump = Union[bytes, np.ndarray]
+"""Raw register dump: big-endian bytes, or an array of bytes or of register values with one dump per row"""
+
+
+@dataclass
+class DecodeKind:
+    """
+    Properties of a decode plan sharing the same `ValType` layout, decoded with a single gather
+    """
+    dtype: np.dtype
+    """Big-endian NumPy type of the value"""
+    words: np.ndarray
+    """Index of the registers of each value, in most-significant-first order (shape: values × size)"""
+    columns: np.ndarray
+    """Column of each value in the decoded output"""
+
+
+class DecodePlan:
+    """
+    Vectorized decoder for a fixed register layout, such as the registers read by one poller
+    """
+
+    def __init__(self, entries: list[tuple[int, ModbusProp]], length: int):
+        """
+        :param entries: Properties with the index of their first register in the dump
+        :param length: Number of registers of the dump
+        """
+        self.props = [p for _, p in entries]
+        self.length = length
+        self.scale = np.array([p.valtype.scale for p in self.props], dtype=np.float64)
+        self.null_cols = np.array([i for i, p in enumerate(self.props) if p.valtype.null is not None], dtype=np.intp)
+        self.null_vals = np.array([self.props[i].valtype.null for i in self.null_cols], dtype=np.float64)
+
+        kinds: dict[tuple[str, bool], tuple[list, list]] = {}
+        for column, (index, prop) in enumerate(entries):
+            valtype = prop.valtype
+            if index < 0 or index + valtype.size > length:
+                raise ValueError(f"Property {prop.id} at index {index} is outside of the dump ({length} registers)")
+            words = list(range(index, index + valtype.size))
+            if valtype.swap:
+                words.reverse()
+            kind = kinds.setdefault((valtype.openhab, valtype.swap), ([], []))
+            kind[0].append(words)
+            kind[1].append(column)
+        self.kinds = [DecodeKind(np.dtype(">" + STRUCT_FORMATS[openhab]), np.array(words, dtype=np.intp), np.array(columns, dtype=np.intp))
+                      for (openhab, _), (words, columns) in kinds.items()]
+
+    def raw(self, dump: Dump) -> np.ndarray:
+        """
+        Decodes the raw values (before scaling) of a dump, or of many dumps at once
+
+        :return: an array of shape (dumps × properties)
+        """
+        if isinstance(dump, bytes):
+            registers = np.frombuffer(dump, dtype=">u2")
+        else:
+            dump = np.asarray(dump)
+            registers = dump.view(">u2") if dump.dtype.itemsize == 1 else dump.astype(">u2", copy=False)
+        registers = registers.reshape(-1, self.length)
+        out = np.empty((registers.shape[0], len(self.props)), dtype=np.float64)
+        for kind in self.kinds:
+            # gathering the registers in most-significant-first order gives the big-endian bytes of the values
+            gathered = np.ascontiguousarray(registers[:, kind.words])
+            out[:, kind.columns] = gathered.view(kind.dtype)[..., 0]
+        return out
+
+    def decode(self, dump: Dump) -> np.ndarray:
+        """
+        Decodes the physical values of a dump, or of many dumps at once: applies the scale and replaces `null` sentinels by NaN
+
+        :return: an array of shape (dumps × properties)
+        """
+        raw = self.raw(dump)
+        values = raw / self.scale
+        rows, cols = np.nonzero(raw[:, self.null_cols] == self.null_vals)
+        values[rows, self.null_cols[cols]] = np.nan
+        return values
+
+
+@dataclass
+class PollerPlan:
+    """
+    Decode plan of one generated poller
+    """
+    id: str
+    """Poller ID, as generated (example: `SOL_Y1_General`)"""
+    type_: OHPollerType
+    start: int
+    """Generated `start`"""
+    length: int
+    """Generated `length`"""
+    plan: DecodePlan
+
+
+def slave_plans(slave: SlaveBase) -> list[PollerPlan]:
+    """
+    Builds the decode plans of all the register pollers generated for a slave, with the same start, length and
+    `readStart` offsets as `gen_conf` (coils and discrete inputs are left out). The slave's prefix must have been
+    resolved (`resolve_ids`).
+    """
+    plans = []
+    for group in slave.get_prop_groups():
+        if group.type_ in BIT_POLLER_TYPES:
+            continue
+        for poller in split_props(group):
+            start = poller.start + slave.offset
+            length = poller.length + group.offset
+            entries = [(slave.register_address(group, p) - start, p) for p in poller.props]
+            plans.append(PollerPlan(f"{slave.prefix}_{poller.id}", group.type_, start, length, DecodePlan(entries, length)))
+    return plans
+
+
+def decode_slave(slave: SlaveBase, dumps: dict[str, Dump]) -> dict[str, np.ndarray]:
+    """
+    Decodes the dumps of the pollers of a slave (or of many slaves of the same type, one dump per row)
+
+    :param slave: The slave, with its prefix resolved
+    :param dumps: Dumps by poller ID
+    :return: physical values by property ID
+    """
+    values = {}
+    for poller in slave_plans(slave):
+        if poller.id not in dumps:
+            continue
+        decoded = poller.plan.decode(dumps[poller.id])
+        for column, prop in enumerate(poller.plan.props):
+            values[prop.id] = decoded[:, column]
+    return values
+
+
+def verify_capture(slave: SlaveBase, capture: dict, rtol: float = 1e-3) -> list[str]:
+    """
+    Checks a known-good capture against the generated pollers.
+
+    The capture contains, for a poller, the register number the dump starts at, the dump itself and the expected physical
+    values of some properties. When values don't match, the dump is decoded again with the start shifted by one register
+    in both directions, to detect off-by-one offsets.
+
+    :return: the list of problems found (empty if everything matches)
+    """
+    problems = []
+    plans = {p.id: p for p in slave_plans(slave)}
+    poller = plans.get(capture["poller"])
+    if poller is None:
+        return [f"{capture['poller']}: no such poller (expected one of {', '.join(plans)})"]
+    if capture["start"] != poller.start:
+        problems.append(f"{poller.id}: capture starts at {capture['start']}, poller starts at {poller.start}")
+
+    registers = np.frombuffer(bytes.fromhex(capture["registers"]), dtype=">u2")
+    expected = capture["expected"]
+    ids = [p.id for p in poller.plan.props]
+
+    # padding, so that a shifted window never goes out of the dump
+    padded = np.concatenate([np.zeros(poller.length, ">u2"), registers, np.zeros(poller.length, ">u2")])
+
+    def mismatches(shift: int) -> list[str]:
+        begin = poller.length + poller.start - capture["start"] + shift
+        if not 0 <= begin <= len(padded) - poller.length:
+            return list(expected)
+        values = poller.plan.decode(padded[begin:begin + poller.length])[0]
+        return [id_ for id_, value in expected.items()
+                if id_ not in ids or not np.isclose(values[ids.index(id_)], value, rtol=rtol, equal_nan=True)]
+
+    wrong = mismatches(0)
+    if wrong:
+        problems.append(f"{poller.id}: wrong values for {', '.join(wrong)}")
+        for shift in (-1, 1):
+            if not mismatches(shift):
+                problems.append(f"{poller.id}: values match with the start shifted by {shift:+d} register")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m openhab.decode",
+                                     description="Verifies the generated poller offsets against known-good Modbus captures")
+    parser.add_argument("captures", nargs="+", type=Path,
+                        help="JSON files with a list of {slave, poller, start, registers (hex), expected} objects")
+    parser.add_argument("--inventory", type=Path, default=DEFAULT_INVENTORY, help="inventory script defining `files`")
+    args = parser.parse_args(argv)
+
+    files, _ = load_inventory(args.inventory)
+    slaves = {}
+    for file, masters in files.items():
+        resolve_ids(file, masters)
+        for master in masters:
+            for group in master.slaves.values():
+                for slave in group.slaves:
+                    slaves[slave.prefix] = slave
+
+    failed = False
+    for path in args.captures:
+        for capture in json.loads(path.read_text()):
+            problems = [f"{capture['slave']}: unknown slave"] if capture["slave"] not in slaves \
+                else verify_capture(slaves[capture["slave"]], capture)
+            for problem in problems:
+                print(f"{path}: {problem}")
+            failed |= bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,71 @@
 import inspect
-from dataclasses import dataclass, replace, field
-from typing import Optional, ClassVar
+import re
+from dataclasses import dataclass, replace, field, InitVar
+from functools import cached_property, lru_cache
+from typing import Optional, ClassVar, Literal
 
 from influxdb.types import Alert
-from openhab.config import OHPollerType
-from openhab.types import OHIcon, ValType, fix_unit_openhab, OHQuantity
+from openhab.config import OHPollerType, FlagType, BIT_POLLER_TYPES
+from openhab.types import OHIcon, ValType, fix_unit_openhab, OHQuantity, STRUCT_FORMATS, ModbusType
+
+MAX_SILENCE = 10
+"""Default longest time in seconds without update of an unchanged value (well below the 30 s `deadmanDuration` of
+global_deadman.flux; the binding's default is 1 s)"""
+
+
+@dataclass(frozen=True)
+class Deadband:
+    """
+    Change suppression of a property, with hysteresis: a value is only sent to openHAB once it moved by at least the
+    step from the last sent value
+    """
+    absolute: Optional[float] = None
+    """Step, in the unit of the property (0 or None: every change is sent)"""
+    relative: Optional[float] = None
+    """Relative step (0.01: changes smaller than 1 % of the last sent value are not sent)"""
+    max_silence: float = MAX_SILENCE
+    """Longest time in seconds without update of an unchanged value (`updateUnchangedValuesEveryMillis`)"""
+
+
+# the two functions below are called for every generated Thing, but only see a handful of distinct arguments
+
+@lru_cache(maxsize=None)
+def format_deadband(format: str) -> Deadband:
+    """
+    Returns the default deadband of a format string: a step of one unit of its last digit
+
+    >>> format_deadband("%.1f").absolute
+    0.1
+    >>> format_deadband("%d").absolute
+    1
+    >>> format_deadband("%s").absolute is None
+    True
+    """
+    if match := re.fullmatch(r"%(?:\.(\d+))?([df])", format):
+        digits, kind = match.groups()
+        return Deadband(10 ** -int(digits or (0 if kind == "d" else 6)))
+    return Deadband()
+
+
+@lru_cache(maxsize=None)
+def deadband_transform(deadband: Deadband, scale: float, openhab: ModbusType) -> Optional[str]:
+    """
+    Returns the `readTransform` applying a deadband to raw values (without the key of the Thing, see
+    `ModbusProp.get_deadband_transform`), or None if it wouldn't change anything: any change of an integer register
+    is at least one raw unit
+
+    >>> deadband_transform(Deadband(0.1), 1, "float32")
+    'JS:deadband.js?step=0.1&rel=0'
+    >>> deadband_transform(Deadband(0.1), 10, "uint16") is None
+    True
+    >>> deadband_transform(Deadband(1), 10, "uint16")
+    'JS:deadband.js?step=10&rel=0'
+    """
+    step = (deadband.absolute or 0) * scale
+    relative = deadband.relative or 0
+    if not relative and (step <= 0 or (step <= 1 and STRUCT_FORMATS[openhab] not in "fd")):
+        return None
+    return f"JS:deadband.js?step={step:g}&rel={relative:g}"
 
 
 @dataclass
@@ -20,6 +81,8 @@ class ModbusProp:
     """Format string for openHAB state view"""
     unit: str
     """Unit of measure (will be put after format string)"""
+    deadband: Optional[Deadband] = None
+    """Change suppression, derived from the format precision if not set (`%.1f`: changes smaller than 0.1 are not sent)"""
 
     def get_format_string(self) -> str:
         """
@@ -41,6 +104,97 @@ class ModbusProp:
         """
         return f"{1 / self.valtype.scale}" + (f" {fix_unit_openhab(self.unit)}" if self.unit else "")
 
+    def get_deadband(self) -> Deadband:
+        """
+        Returns the deadband of the given property: the one it declares, or a step of one unit of the last displayed digit.
+
+        Example:
+            - a property with format `%.1f` will return a step of `0.1`
+            - a property with format `%d` will return a step of `1`
+            - a property with format `%s` will return no step
+        """
+        return self.deadband if self.deadband is not None else format_deadband(self.format)
+
+    def get_deadband_transform(self, key: str) -> Optional[str]:
+        """
+        Returns the `readTransform` applying the deadband of the given property to its raw value, if it changes
+        anything: any change of an integer register is at least one raw unit.
+
+        :param key: Unique key of the Thing, under which the transform keeps the last sent value
+
+        Example:
+            - a `float32` property with format `%.1f` will return `JS:deadband.js?step=0.1&rel=0&key=...`
+            - a `uint16` property with scale `10` and format `%.1f` will return None (the step is one raw unit)
+            - a `uint16` property with scale `10` and format `%d` will return `JS:deadband.js?step=10&rel=0&key=...`
+        """
+        transform = deadband_transform(self.get_deadband(), self.valtype.scale, self.valtype.openhab)
+        return f"{transform}&key={key}" if transform else None
+
+
+@dataclass
+class BitField:
+    """
+    One bit, or a range of bits, of a status word, exposed as its own Thing and Item
+    """
+    bit: int
+    """Lowest bit, 0 being the least significant bit of the word"""
+    id: str
+    display_name: str
+    item: Literal[FlagType, "Number"] = "Contact"
+    """Item type: Switch or Contact (ON/OPEN when the bit is set) for a single bit, Number for a range of bits"""
+    width: int = 1
+    """Number of bits"""
+
+    def __post_init__(self):
+        if self.width > 1 and self.item != "Number":
+            raise ValueError(f"Bit field {self.id}: a {self.item} item can only show a single bit")
+
+
+@dataclass
+class StatusWord(ModbusProp):
+    """
+    Property whose bits hold flags or small numbers. The word is a Number item like any property, and each of its fields
+    is another Thing reading the same register, so that all of them cost a single register read.
+    """
+    fields: list[BitField] = field(default_factory=list)
+
+    def __post_init__(self):
+        size = 16 * self.valtype.size
+        for bits in self.fields:
+            if not 0 <= bits.bit < bits.bit + bits.width <= size:
+                raise ValueError(f"Bit field {bits.id}: bits {bits.bit} to {bits.bit + bits.width - 1} are outside of "
+                                 f"{self.id} ({size} bits)")
+            if bits.bit // 16 != (bits.bit + bits.width - 1) // 16:
+                raise ValueError(f"Bit field {bits.id}: bits {bits.bit} to {bits.bit + bits.width - 1} span two registers")
+
+    def field_register(self, bits: BitField) -> tuple[int, int]:
+        """
+        Returns the register of a bit field, as an offset from the address of the word, and its lowest bit in that
+        register
+
+        >>> from openhab.types import U32, U32s
+        >>> StatusWord(0, U32, "", "word", "Word", None, "%d", None).field_register(BitField(17, "b", "Bit 17"))
+        (0, 1)
+        >>> StatusWord(0, U32s, "", "word", "Word", None, "%d", None).field_register(BitField(17, "b", "Bit 17"))
+        (1, 1)
+        """
+        index = bits.bit // 16
+        return (index if self.valtype.swap else self.valtype.size - 1 - index), bits.bit % 16
+
+    def field_transform(self, bits: BitField) -> Optional[str]:
+        """
+        Returns the `readTransform` extracting a range of bits from its register (read as `uint16`), or None for a
+        single bit, read with `readValueType="bit"`
+
+        >>> from openhab.types import U16
+        >>> word = StatusWord(0, U16, "", "word", "Word", None, "%d", None)
+        >>> word.field_transform(BitField(4, "mode", "Mode", "Number", 3))
+        'JS:bits.js?shift=4&width=3'
+        """
+        if bits.width == 1:
+            return None
+        return f"JS:bits.js?shift={self.field_register(bits)[1]}&width={bits.width}"
+
 
 @dataclass
 class PropGroup:
@@ -48,31 +202,46 @@ class PropGroup:
     """Identifier"""
     name: str
     """Display name"""
-    props: list[ModbusProp]
-    """List of properties in this group"""
+    templates: InitVar[list]
+    """Properties in this group, as `ModbusProp` or tuples of its fields"""
     type_: OHPollerType = "holding"
     """Modbus function code"""
     offset: int = 1
     """Modbus address offset"""
 
-    def __post_init__(self):
-        self.props = [ModbusProp(*x) if type(x) == tuple else x
-                      for x in self.props]
+    def __post_init__(self, templates):
+        self._templates = templates
+
+    @cached_property
+    def props(self) -> list[ModbusProp]:
+        """
+        List of properties in this group, built on first use: device classes are defined when their module is imported,
+        but only the ones used by the inventory need their properties
+        """
+        props = [ModbusProp(*x) if type(x) == tuple else x
+                 for x in self._templates]
+        bits = self.type_ in BIT_POLLER_TYPES
+        for prop in props:
+            if (prop.valtype.openhab == "bit") != bits:
+                raise ValueError(f"Property {prop.id}: {prop.valtype.openhab} value in a {self.type_} group "
+                                 f"(coil and discrete groups only have bit values)")
+        del self._templates
+        return props
 
 
 def seq(count, *templates):
     """
-    Repeats one or more items a given number of times, formatting the ID and display name with the index.
+    Repeats one or more items a given number of times, formatting the ID and display name with the index. The items
+    are yielded as tuples, so that `PropGroup` only builds the properties when they are used.
+
+    >>> from openhab.types import F32
+    >>> [(address, id, name) for address, _, _, id, name, *_ in seq(2, (100, F32, "energy", "p%d", "Power %d", None, "%.1f", "W"))]
+    [(100, 'p1', 'Power 1'), (102, 'p2', 'Power 2')]
     """
-    props = [ModbusProp(*x) for x in templates]
-    size = sum(p.valtype.size for p in props)
+    size = sum(template[1].size for template in templates)
     for i in range(count):
-        for prop in props:
-            yield replace(prop,
-                          address=prop.address + i * size,
-                          id=prop.id % (i + 1),
-                          display_name=prop.display_name % (i + 1),
-                          )
+        for address, valtype, icon, id, display_name, *rest in templates:
+            yield address + i * size, valtype, icon, id % (i + 1), display_name % (i + 1), *rest
 
 
 def prefix(id="", name=""):
@@ -141,6 +310,12 @@ class SlaveBase(SlaveGroup):
         """
         return [cl.props for cl in inspect.getmro(self.__class__)[-4::-1]]
 
+    def register_address(self, group: PropGroup, prop: ModbusProp) -> int:
+        """
+        Returns the Modbus register number the given property is read from (`readStart` of the generated Thing)
+        """
+        return prop.address + self.offset + group.offset
+
     def get_alerts(self) -> list[Alert]:
         return [alert for cl in inspect.getmro(self.__class__)[-4::-1] for alert
                 in
@@ -164,6 +339,8 @@ class ModbusMaster:
     custom_id: Optional[str] = None
     ignore: bool = False
     """Ignore this master for the openHAB configuration files"""
+    instance: Optional[str] = None
+    """openHAB instance this master must be assigned to, when the site is partitioned across several instances"""
 
 
 class AllowDuplicates:
@@ -0,0 +1,228 @@
+import argparse
+import bisect
+import hashlib
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from gen_conf import Sharding, gen_conf, resolve, update_manifest
+from openhab.modbus import ModbusMaster
+from openhab.ping_check import gen_ping_check
+from utils.inventory import load_inventory, DEFAULT_INVENTORY, ROOT_PATH
+
+INSTANCES_PATH = ROOT_PATH / "instances"
+"""Output directory: one subdirectory per openHAB instance"""
+
+POLL_INTERVAL = 0.5
+"""Poller refresh interval in seconds (the generated pollers use the binding's default, 500 ms)"""
+
+EPSILON = 0.25
+"""Default load imbalance allowed: an instance takes at most (1 + epsilon) times the average load"""
+
+VNODES = 64
+"""Number of points of each instance on the hash ring"""
+
+
+@dataclass
+class Load:
+    """
+    Estimated polling load
+    """
+    transactions: float = 0
+    """Modbus read transactions per second"""
+    registers: float = 0
+    """Registers read per second"""
+    items: int = 0
+    """Number of items updated by the pollers"""
+
+    def add(self, other: "Load"):
+        self.transactions += other.transactions
+        self.registers += other.registers
+        self.items += other.items
+
+
+@dataclass
+class Gateway:
+    """
+    Masters sharing an IP address: they are always assigned to the same instance, as they are behind the same gateway
+    (which serializes their requests) and pinged as a whole by the ping check
+    """
+    ip: str
+    masters: list[tuple[str, ModbusMaster]] = field(default_factory=list)
+    """Masters, with the file they belong to"""
+    load: Load = field(default_factory=Load)
+    pinned: Optional[str] = None
+    """Instance set by `ModbusMaster.instance`"""
+
+
+def gateways(files: dict[str, list[ModbusMaster]], ignore: set[str] = frozenset(),
+             poll_interval: float = POLL_INTERVAL) -> list[Gateway]:
+    """
+    Groups the masters of an inventory by IP address, and estimates their load from the generated pollers. The masters
+    of the files in `ignore` are not polled, so they add no load, but they still get an instance for their `.unused` files.
+    """
+    result: dict[str, Gateway] = {}
+    for file, masters in files.items():
+        for master in masters:
+            gateway = result.setdefault(master.ip, Gateway(master.ip))
+            gateway.masters.append((file, master))
+            if master.instance is not None:
+                if gateway.pinned not in (None, master.instance):
+                    raise ValueError(f"Masters of {master.ip} are pinned to {gateway.pinned} and {master.instance}")
+                gateway.pinned = master.instance
+            if file in ignore:
+                continue
+            for bridge in resolve(file, [master]):
+                for slave in bridge.slaves:
+                    for poller in slave.pollers:
+                        gateway.load.add(Load(1 / poll_interval, poller.bridge.length / poll_interval, len(poller.items)))
+    return list(result.values())
+
+
+def weights(gateways: list[Gateway]) -> dict[str, float]:
+    """
+    Reduces the load of each gateway to a single weight: its mean share of the site's transactions, registers and items
+    """
+    total = Load()
+    for gateway in gateways:
+        total.add(gateway.load)
+    return {g.ip: sum(getattr(g.load, metric) / (getattr(total, metric) or 1) for metric in ("transactions", "registers", "items")) / 3
+            for g in gateways}
+
+
+def ring_hash(key: str) -> int:
+    """
+    Stable hash (unlike `hash`, it doesn't change between runs)
+    """
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], "big")
+
+
+def assign(gateways: list[Gateway], instances: list[str], epsilon: float = EPSILON, vnodes: int = VNODES) -> dict[str, str]:
+    """
+    Assigns the gateways to openHAB instances, with consistent hashing with bounded loads: each gateway goes to the
+    first instance after its position on the hash ring that has room for it, the capacity of an instance being (1 +
+    epsilon) times the average load. Gateways are placed in the order of their position on the ring, so that adding
+    or removing an instance only moves the gateways around its points, and a few because of the capacity bound.
+
+    :return: the instance of each gateway, by IP address
+    """
+    weight = weights(gateways)
+    unknown = {g.pinned for g in gateways if g.pinned is not None} - set(instances)
+    if unknown:
+        raise ValueError(f"Masters pinned to unknown instances: {', '.join(sorted(unknown))}")
+    ring = sorted((ring_hash(f"{instance}#{i}"), instance) for instance in instances for i in range(vnodes))
+    points = [point for point, _ in ring]
+    capacity = max([(1 + epsilon) * sum(weight.values()) / len(instances), *weight.values()])
+
+    loads = dict.fromkeys(instances, 0.0)
+    result = {}
+    for gateway in gateways:
+        if gateway.pinned is not None:
+            result[gateway.ip] = gateway.pinned
+            loads[gateway.pinned] += weight[gateway.ip]
+    for gateway in sorted((g for g in gateways if g.pinned is None), key=lambda g: ring_hash(g.ip)):
+        start = bisect.bisect(points, ring_hash(gateway.ip))
+        for i in range(len(ring)):
+            instance = ring[(start + i) % len(ring)][1]
+            if loads[instance] + weight[gateway.ip] <= capacity * (1 + 1e-9):
+                break
+        else:
+            # only possible when pinned gateways overload the instances
+            instance = min(loads, key=loads.get)
+        result[gateway.ip] = instance
+        loads[instance] += weight[gateway.ip]
+    return result
+
+
+def partition(files: dict[str, list[ModbusMaster]], assignment: dict[str, str], instance: str) -> dict[str, list[ModbusMaster]]:
+    """
+    Returns the part of the inventory assigned to an instance (files without any master on the instance are left out)
+    """
+    result = {}
+    for file, masters in files.items():
+        mine = [master for master in masters if assignment.get(master.ip) == instance]
+        if mine:
+            result[file] = mine
+    return result
+
+
+def write_instances(files: dict[str, list[ModbusMaster]], ignore: set[str], assignment: dict[str, str],
+                    instances: list[str], out: Path = INSTANCES_PATH, sharding: Optional[Sharding] = None) -> list[str]:
+    """
+    Generates, for each instance, its openHAB configuration (`<instance>/conf/things` and `items`) and the manifest of
+    its ping check runner (`<instance>/ping_check/manifest.json`)
+
+    :return: the files that were written or removed
+    """
+    report = []
+    for instance in instances:
+        conf = out / instance / "conf"
+        for directory in ("things", "items"):
+            (conf / directory).mkdir(parents=True, exist_ok=True)
+        mine = partition(files, assignment, instance)
+        for file in files:
+            if file in mine:
+                written, removed = gen_conf(file, mine[file], file in ignore, conf, sharding)
+            else:
+                # the masters of the file were moved to other instances
+                written, removed = [], update_manifest(conf, file, [])
+            report += [f"written {conf / path}" for path in written] + [f"removed {conf / path}" for path in removed]
+        manifest = out / instance / "ping_check" / "manifest.json"
+        if gen_ping_check({f: m for f, m in mine.items() if f not in ignore}, manifest):
+            report.append(f"written {manifest}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m openhab.partition",
+                                     description="Partitions the Modbus masters of the inventory across several openHAB instances")
+    parser.add_argument("instances", nargs="+", help="names of the openHAB instances (a single number N for oh1..ohN)")
+    parser.add_argument("--inventory", type=Path, default=DEFAULT_INVENTORY, help="inventory script defining `files`")
+    parser.add_argument("--out", type=Path, default=INSTANCES_PATH, help="output directory")
+    parser.add_argument("--epsilon", type=float, default=EPSILON, help="load imbalance allowed between instances")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="poller refresh (s)")
+    parser.add_argument("--shard", choices=("master", "location"), help="output layout of each instance")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only print the assignment")
+    args = parser.parse_args(argv)
+
+    instances = args.instances
+    if len(instances) == 1 and instances[0].isdigit():
+        instances = [f"oh{i}" for i in range(1, int(instances[0]) + 1)]
+
+    files, ignore = load_inventory(args.inventory)
+    try:
+        site = gateways(files, ignore, args.poll_interval)
+        assignment = assign(site, instances, args.epsilon)
+    except ValueError as e:
+        parser.error(str(e))
+
+    state_path = args.out / "partition.json"
+    previous = json.loads(state_path.read_text()) if state_path.exists() else {}
+    moved = [ip for ip, instance in assignment.items() if ip in previous and previous[ip] != instance]
+
+    weight = weights(site)
+    print(f"{'instance':<12} {'gateways':>8} {'masters':>8} {'tx/s':>8} {'regs/s':>8} {'items':>7} {'share':>7}")
+    for instance in instances:
+        mine = [g for g in site if assignment[g.ip] == instance]
+        load = Load()
+        for gateway in mine:
+            load.add(gateway.load)
+        print(f"{instance:<12} {len(mine):>8} {sum(len(g.masters) for g in mine):>8} {load.transactions:>8.1f} "
+              f"{load.registers:>8.0f} {load.items:>7} {sum(weight[g.ip] for g in mine):>7.1%}")
+    if previous:
+        print(f"{len(moved)} of {len(assignment)} gateways moved" + (f": {', '.join(moved)}" if moved else ""))
+    if args.dry_run:
+        for ip, instance in sorted(assignment.items()):
+            print(f"{ip} -> {instance}")
+        return
+
+    for line in write_instances(files, ignore, assignment, instances, args.out, args.shard):
+        print(line)
+    for instance in sorted(set(previous.values()) - set(instances)):
+        print(f"{instance} is not used anymore, its directory {args.out / instance} can be removed")
+    state_path.write_text(json.dumps(assignment, indent=2, sort_keys=True) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,131 @@
+import argparse
+import json
+import subprocess
 from pathlib import Path
-from utils.env import get_env
-
-def gen_ping_check(files):
-    
-    cur_dir = Path(__file__).parent
-    with open(cur_dir.parent / "ping_check" / "ping_check_runner.py", "w") as scr:
-        ips = {master.ip: [group.effective_id for group in master.slaves.values()] for group in files.values() for master in group}
-        scr.write(f"""
-#!/usr/bin/env python3
-# AUTOGENERATED FILE, DO NOT EDIT
-
-from multiping import multi_ping
-import time
-import requests
-from datetime import datetime
-import os
-
-ips={ips!r}
-
-def get_env(key):
-    if val := os.getenv(key):
-        return val
-    else:
-        raise ValueError(f"Environment variable {{key}} not set")
-
-OH_ROOT = get_env("OPENHAB_URL")
-OH_TOKEN = get_env("OPENHAB_TOKEN")
-
-cache = {{}}
-
-def send_openhab(id: str, val: bool):
-    if cache.get(id) == val:
-        return
-    cache[id] = val
-    url = f"{{OH_ROOT}}/rest/things/modbus:tcp:{{id}}/enable"
-    (payload, message) = ("true", "Enabling") if val else ("false", "Disabling")
-    print(f"[{{datetime.now()}}] {{message}} {{id}}")
-    headers = {{
-        "Content-Type": "text/plain",
-        "Authorization": "Bearer {{OH_TOKEN}}",
-    }}
-    requests.put(url, data=payload, headers=headers)
-
-while True:
-    good, bad = multi_ping(ips.keys(), timeout=0.2, retry=0)
-    for ip in good:
-        for id in ips[ip]:
-            send_openhab(id, True)
-    for ip in bad:
-        for id in ips[ip]:
-            send_openhab(id, False)
-    time.sleep(5)
-""")
\ No newline at end of file
+from typing import Iterable, Optional
+
+from gen_conf import replace_if_changed, temp_path
+from utils.inventory import ROOT_PATH
+from utils.stamps import Stamps, digest, file_digest
+
+MANIFEST_PATH = ROOT_PATH / "ping_check" / "generated" / "manifest.json"
+"""Manifest read by the ping check runner (`ping_check/ping_check_runner.py`), mounted in its container"""
+
+IMAGE_INPUTS = (ROOT_PATH / "ping_check" / "Dockerfile", ROOT_PATH / "ping_check" / "ping_check_runner.py")
+"""Files the Docker image of the runner is built from"""
+
+ENV_PATH = ROOT_PATH / ".env"
+
+IMAGE = CONTAINER = "ping-check-runner"
+
+RUN_ARGS = ("--env-file", str(ENV_PATH), "-d", "-p", "9108:9108",
+            "-v", f"{MANIFEST_PATH.parent}:/usr/src/app/generated:ro", "--restart", "unless-stopped")
+"""Options of `docker run` for the runner container"""
+
+PROBE_SETTINGS = {"interval": 5, "timeout": 0.2, "retry": 0}
+"""Probe settings of the runner: seconds between cycles, ping timeout in seconds and number of retries"""
+
+
+def ping_map(files) -> dict[str, list[str]]:
+    """
+    Returns the IDs of the Modbus TCP bridges (slave groups) behind each IP address. The IDs must have been resolved.
+    """
+    ips = {}
+    for masters in files.values():
+        for master in masters:
+            ips.setdefault(master.ip, []).extend(group.effective_id for group in master.slaves.values())
+    return ips
+
+
+def gen_ping_check(files, path: Path = MANIFEST_PATH) -> bool:
+    """
+    Generates the manifest of the ping check runner: the probe settings, and the bridges to enable or disable by IP
+    address. The runner reloads it when it changes, so the file is only replaced when its content changes, and
+    atomically.
+
+    :return: whether the manifest was replaced
+    """
+    return write_manifest(ping_map(files).items(), path)
+
+
+def write_manifest(targets: Iterable[tuple[str, list[str]]], path: Path = MANIFEST_PATH) -> bool:
+    """
+    Writes the manifest of the ping check runner one target at a time, in the layout of `json.dumps(manifest,
+    indent=2)`, so that the targets can be read lazily
+
+    :param targets: IP addresses, with the IDs of the Modbus TCP bridges behind each of them (each IP address once)
+    :return: whether the manifest was replaced
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    settings = json.dumps(PROBE_SETTINGS, indent=2).replace("\n", "\n  ")
+    with open(temp_path(path), "w") as f:
+        f.write(f'{{\n  "settings": {settings},\n  "targets": {{')
+        empty = True
+        for ip, ids in targets:
+            # a single `json.dumps` per string: with `indent`, the encoder falls back to its (slow) Python version
+            bridges = "[" + ",".join(f"\n      {json.dumps(bridge)}" for bridge in ids) + "\n    ]" if ids else "[]"
+            f.write(f'{"" if empty else ","}\n    {json.dumps(ip)}: {bridges}')
+            empty = False
+        f.write("}\n}\n" if empty else "\n  }\n}\n")
+    return replace_if_changed(path)
+
+
+def docker_output(*args: str) -> Optional[str]:
+    """
+    Runs a Docker command and returns its output, or None if it failed
+    """
+    result = subprocess.run(["docker", *args], capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def deploy_ping_check(stamps: Stamps, run: bool = True) -> list[str]:
+    """
+    Builds the Docker image of the runner if its inputs changed, and (re)creates its container if the image or the
+    environment changed, or if it isn't running. The targets are not an input: the runner reloads its manifest.
+
+    :param run: Also (re)create the container
+    :return: a description of the actions taken
+    """
+    actions = []
+    image_inputs = digest(*(file_digest(path) for path in IMAGE_INPUTS))
+    if not stamps.fresh("image:ping-check", image_inputs) or docker_output("image", "inspect", IMAGE) is None:
+        subprocess.run(["docker", "build", "-t", IMAGE, "-f", "ping_check/Dockerfile", "."], cwd=ROOT_PATH, check=True)
+        stamps.record("image:ping-check", image_inputs)
+        actions.append(f"built image {IMAGE}")
+    if not run:
+        return actions
+
+    image_id = docker_output("image", "inspect", "--format", "{{.Id}}", IMAGE)
+    container_inputs = digest(image_id, file_digest(ENV_PATH) if ENV_PATH.exists() else None, RUN_ARGS)
+    running = docker_output("ps", "-q", "--filter", f"name=^{CONTAINER}$", "--filter", "status=running")
+    if not stamps.fresh("container:ping-check", container_inputs) or not running:
+        docker_output("rm", "-f", CONTAINER)
+        subprocess.run(["docker", "run", *RUN_ARGS, "--name", CONTAINER, IMAGE], check=True)
+        stamps.record("container:ping-check", container_inputs)
+        actions.append(f"started container {CONTAINER}")
+    return actions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m openhab.ping_check",
+                                     description="Builds the ping check image and starts its container, only if their inputs changed")
+    parser.add_argument("--build-only", action="store_true", help="only build the image")
+    parser.add_argument("--force", action="store_true", help="ignore the recorded stamps")
+    args = parser.parse_args(argv)
+
+    stamps = Stamps.load()
+    if args.force:
+        stamps.forget("image:ping-check")
+        stamps.forget("container:ping-check")
+    try:
+        actions = deploy_ping_check(stamps, run=not args.build_only)
+    finally:
+        stamps.save()
+    for action in actions:
+        print(action.capitalize())
+    if not actions:
+        print("Ping check image and container are up to date")
+
+
+if __name__ == "__main__":
+    main()
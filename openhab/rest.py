@@ -0,0 +1,372 @@
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Literal, Optional, Union
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from gen_conf import ResolvedBridge, resolve
+from openhab.config import OHItem, OHNumber
+from openhab.modbus import ModbusMaster
+from utils.inventory import load_inventory, DEFAULT_INVENTORY
+
+BATCH_SIZE = 500
+"""Maximum number of items sent in a single `PUT /rest/items` request"""
+
+WORKERS = 8
+"""Default number of concurrent requests (and of pooled connections)"""
+
+THING_WORKERS = 4
+"""Maximum number of concurrent thing creations and updates. The REST API has no batch endpoint for things, so each
+one is a request, and openHAB (re)initializes the handler of each thing it receives: a large inventory is sent in a
+bounded stream rather than a burst"""
+
+MANAGED_METADATA = ("influxdb", "stateDescription")
+"""Metadata namespaces set by the generator, the other ones are left untouched"""
+
+THING_DEPTH = {"modbus:tcp": 0, "modbus:poller": 1, "modbus:data": 2}
+"""Nesting level of the generated Thing types: bridges are created before their children and removed after them"""
+
+THING_CONFIG = {
+    "modbus:tcp": {"host": None, "id": None},
+    "modbus:poller": {"start": None, "length": None, "type": None, "maxTries": None},
+    "modbus:data": {"readStart": None, "readValueType": None, "readTransform": None, "updateUnchangedValuesEveryMillis": 1000},
+}
+"""Configuration parameters set by the generator for each Thing type, with the value openHAB gives them when they are
+left out (None: unset). The other parameters are openHAB's, and are left untouched"""
+
+
+@dataclass
+class Registry:
+    """
+    Things, items, links and metadata, as represented by the openHAB REST API
+    """
+    things: dict[str, dict] = field(default_factory=dict)
+    """Things by UID (example: `modbus:poller:SOL_Y3:SOL_Y3_General`)"""
+    items: dict[str, dict] = field(default_factory=dict)
+    """Items by name"""
+    links: dict[str, dict] = field(default_factory=dict)
+    """Item-channel links by `item/channel` path"""
+    metadata: dict[str, dict] = field(default_factory=dict)
+    """Item metadata by `item/namespace` path"""
+
+
+@dataclass
+class Change:
+    """
+    Operation on a registry object
+    """
+    action: Literal["add", "update", "remove"]
+    registry: Literal["things", "items", "links", "metadata"]
+    key: str
+    """UID, name or path of the object in its registry"""
+    payload: Union[dict, list, None] = None
+    """Object to send, for additions and updates (a list of items, for batches)"""
+
+    def __str__(self):
+        return f"{'+~-'[('add', 'update', 'remove').index(self.action)]} {self.registry} {self.key}"
+
+
+@dataclass
+class Plan:
+    """
+    Changes needed to bring the live registry to the desired state
+    """
+    changes: list[Change]
+    readonly: list[str]
+    """Objects that should change but are not editable through the API (defined in `.things`/`.items` files)"""
+
+    def count(self, action: str) -> int:
+        return sum(change.action == action for change in self.changes)
+
+    def summary(self) -> str:
+        return f"{self.count('add')} added, {self.count('update')} updated, {self.count('remove')} removed"
+
+
+def thing_type(uid: str) -> str:
+    """
+    >>> thing_type("modbus:poller:SOL_Y3:SOL_Y3_General")
+    'modbus:poller'
+    """
+    return ":".join(uid.split(":")[:2])
+
+
+def rest_path(change: Change) -> str:
+    """
+    Path of the object of a change, relative to `/rest/`
+    """
+    if change.registry == "metadata":
+        name, namespace = change.key.split("/")
+        return f"items/{name}/metadata/{namespace}"
+    return f"{change.registry}/{change.key}"
+
+
+def thing(uid: str, label: str, configuration: dict, bridge: Optional[str] = None, location: Optional[str] = None) -> dict:
+    return {
+        "UID": uid,
+        "thingTypeUID": thing_type(uid),
+        "label": label,
+        "bridgeUID": bridge,
+        "location": location,
+        "configuration": configuration,
+    }
+
+
+def item(oh_item: OHItem, label: Optional[str]) -> dict:
+    return {
+        "type": oh_item.type(),
+        "name": oh_item.id,
+        "label": label,
+        "category": oh_item.icon or None,
+        "tags": list(oh_item.get_tags()),
+        "groupNames": ["gModbus", oh_item.group],
+    }
+
+
+def add_bridge(registry: Registry, bridge: ResolvedBridge):
+    """
+    Adds the objects generated for a Modbus TCP bridge, the same ones as in the `.things` and `.items` files
+    """
+    tcp_uid = f"modbus:tcp:{bridge.tcp.id}"
+    registry.things[tcp_uid] = thing(tcp_uid, bridge.tcp.name, bridge.tcp.params)
+    for slave in bridge.slaves:
+        registry.items[slave.group.id] = item(slave.group, slave.group.name)
+        for poller in slave.pollers:
+            poller_uid = f"modbus:poller:{bridge.tcp.id}:{poller.bridge.id}"
+            registry.things[poller_uid] = thing(poller_uid, poller.bridge.name, poller.bridge.params, tcp_uid)
+            for oh_thing, oh_item in zip(poller.things, poller.items):
+                uid = f"modbus:data:{bridge.tcp.id}:{poller.bridge.id}:{oh_thing.id}"
+                registry.things[uid] = thing(uid, oh_thing.name, oh_thing.params(), poller_uid, oh_thing.group)
+                add_item(registry, oh_item)
+
+
+def add_item(registry: Registry, oh_item: OHItem):
+    label = oh_item.name
+    if isinstance(oh_item, OHNumber):
+        # in the DSL, the label contains the state pattern: `"SOL_Y3: Temperature [%.1f °C]"`
+        label = oh_item.name.removesuffix(f" [{oh_item.format_string}]")
+        registry.metadata[f"{oh_item.id}/stateDescription"] = {"value": " ", "config": {"pattern": oh_item.format_string}}
+    registry.items[oh_item.id] = item(oh_item, label)
+    for key, (value, config) in oh_item.binding_conf().items():
+        if key == "channel":
+            registry.links[f"{oh_item.id}/{value}"] = {"itemName": oh_item.id, "channelUID": value, "configuration": config}
+        else:
+            registry.metadata[f"{oh_item.id}/{key}"] = {"value": value, "config": config}
+
+
+def desired_state(files: dict[str, list[ModbusMaster]], ignore: set[str] = frozenset()) -> Registry:
+    """
+    Builds the registry objects of an inventory (files in `ignore` are left out, like `.unused` files are not read by
+    openHAB)
+    """
+    registry = Registry()
+    registry.items["gModbus"] = {"type": "Group", "name": "gModbus", "label": None, "category": None, "tags": [],
+                                 "groupNames": ["gInfluxDB"]}
+    for file, masters in files.items():
+        if file in ignore:
+            continue
+        for bridge in resolve(file, masters):
+            add_bridge(registry, bridge)
+    return registry
+
+
+def same(desired: Any, live: Any) -> bool:
+    """
+    Whether a live value matches a desired one. Only the fields of the desired objects are compared, so that the ones
+    added by openHAB (default configuration parameters, state, editable...) don't cause updates; numbers may be returned
+    as strings or floats, and lists in any order.
+
+    >>> same({"id": 103, "tags": ["a", "b"]}, {"id": 103.0, "port": 502, "tags": ["b", "a"]})
+    True
+    >>> same({"readStart": "40581"}, {"readStart": "40582"})
+    False
+    >>> same({"readStart": "40581.0"}, {"readStart": 40581})  # bit 0, not the whole register
+    False
+    """
+    if isinstance(desired, dict):
+        return isinstance(live, dict) and all(same(value, live.get(key)) for key, value in desired.items())
+    if isinstance(desired, list):
+        return isinstance(live, list) and sorted(map(str, desired)) == sorted(map(str, live))
+    if desired is None or desired == "":
+        return live is None or live == ""
+    if str(desired) == str(live):
+        return True
+    if isinstance(desired, str):
+        return False
+    try:
+        return float(desired) == float(live)
+    except (TypeError, ValueError):
+        return False
+
+
+def diff(desired: Registry, live: Registry) -> Plan:
+    """
+    Computes the changes to apply to the live registry. Unchanged objects are not touched.
+
+    `live` must only contain the objects owned by the generator (see `RestClient.fetch`): the live objects missing from
+    the desired state are removed, and so are the parameters of `THING_CONFIG` missing from the desired things.
+    """
+    changes, readonly = [], []
+    for registry in ("things", "items", "links", "metadata"):
+        want, have = getattr(desired, registry), getattr(live, registry)
+        for key, obj in want.items():
+            current = have.get(key)
+            owned = THING_CONFIG.get(thing_type(key), {}) if registry == "things" else {}
+            # the parameters the generator no longer sets must be back to their default
+            expected = {**obj, "configuration": {**owned, **obj["configuration"]}} if owned else obj
+            if current is None:
+                changes.append(Change("add", registry, key, obj))
+            elif not same(expected, current):
+                if current.get("editable") is False:
+                    readonly.append(f"{registry} {key}")
+                elif registry == "things":
+                    # the update replaces the thing, so keep the channels and the default parameters set by openHAB
+                    configuration = {k: v for k, v in current.get("configuration", {}).items() if k not in owned}
+                    merged = {**current, **obj, "configuration": {**configuration, **obj["configuration"]}}
+                    changes.append(Change("update", registry, key, merged))
+                else:
+                    changes.append(Change("update", registry, key, obj))
+        for key, current in have.items():
+            # the links and metadata of a removed item are removed with it
+            if key not in want and not (registry in ("links", "metadata") and key.split("/")[0] not in desired.items):
+                if current.get("editable") is False:
+                    readonly.append(f"{registry} {key}")
+                else:
+                    changes.append(Change("remove", registry, key))
+    return Plan(changes, readonly)
+
+
+class RestClient:
+    """
+    openHAB REST API client, with pooled (keep-alive) connections
+    """
+
+    def __init__(self, url: str, token: Optional[str] = None, workers: int = WORKERS, timeout: float = 30):
+        """
+        :param url: openHAB root URL (example: `http://localhost:8080`)
+        :param token: API token
+        :param workers: Number of concurrent requests
+        """
+        self.url = url.rstrip("/") + "/rest/"
+        self.workers = workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept"] = "application/json"
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def request(self, method: str, path: str, **kwargs) -> Any:
+        response = self.session.request(method, self.url + quote(path, safe="/:"), timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        if response.content and response.headers.get("Content-Type", "").startswith("application/json"):
+            return response.json()
+        return None
+
+    def fetch(self) -> Registry:
+        """
+        Fetches the objects owned by the generator: Modbus things, the items of `gModbus` (and `gModbus` itself), their
+        links and the metadata namespaces set by the generator
+        """
+        registry = Registry()
+        for obj in self.request("GET", "things"):
+            if obj["thingTypeUID"] in THING_DEPTH:
+                registry.things[obj["UID"]] = obj
+        for obj in self.request("GET", "items", params={"recursive": "false", "metadata": ",".join(MANAGED_METADATA)}):
+            if obj["name"] == "gModbus" or "gModbus" in obj.get("groupNames", []):
+                registry.items[obj["name"]] = obj
+                for namespace, metadata in (obj.get("metadata") or {}).items():
+                    if namespace in MANAGED_METADATA:
+                        registry.metadata[f"{obj['name']}/{namespace}"] = {**metadata, "editable": obj.get("editable")}
+        for obj in self.request("GET", "links"):
+            if obj["itemName"] in registry.items and obj["channelUID"].startswith("modbus:"):
+                registry.links[f"{obj['itemName']}/{obj['channelUID']}"] = obj
+        return registry
+
+    def run(self, method: str, changes: list[Change], path: Optional[str] = None, workers: Optional[int] = None):
+        """
+        Sends one request per change, concurrently
+
+        :param path: Path to send the requests to, instead of the path of each object
+        :param workers: Maximum number of concurrent requests, if lower than the number of workers of the client
+        """
+        if not changes:
+            return
+
+        def send(change):
+            self.request(method, path or rest_path(change), json=change.payload)
+
+        with ThreadPoolExecutor(min(self.workers, workers or self.workers)) as executor:
+            # consuming the results raises the first error
+            list(executor.map(send, changes))
+
+    def apply(self, plan: Plan):
+        """
+        Applies the changes of a plan: removals first (links and metadata, items, then things from the innermost),
+        then things (from the outermost, at most `THING_WORKERS` at a time), items in batches, metadata and links
+        """
+        def select(action, registry):
+            return [c for c in plan.changes if c.action == action and c.registry == registry]
+
+        self.run("DELETE", select("remove", "links"))
+        self.run("DELETE", select("remove", "metadata"))
+        self.run("DELETE", select("remove", "items"))
+        for depth in sorted(set(THING_DEPTH.values()), reverse=True):
+            self.run("DELETE", [c for c in select("remove", "things") if THING_DEPTH[thing_type(c.key)] == depth])
+
+        for depth in sorted(set(THING_DEPTH.values())):
+            self.run("POST", [c for c in select("add", "things") if THING_DEPTH[c.payload["thingTypeUID"]] == depth],
+                     "things", THING_WORKERS)
+            self.run("PUT", [c for c in select("update", "things") if THING_DEPTH[c.payload["thingTypeUID"]] == depth],
+                     workers=THING_WORKERS)
+        items = [c.payload for c in plan.changes if c.registry == "items" and c.action != "remove"]
+        batches = [Change("update", "items", "", items[i:i + BATCH_SIZE]) for i in range(0, len(items), BATCH_SIZE)]
+        self.run("PUT", batches, "items")
+        self.run("PUT", [c for c in plan.changes if c.registry == "metadata" and c.action != "remove"])
+        self.run("PUT", [c for c in plan.changes if c.registry == "links" and c.action != "remove"])
+
+
+def provision(client: RestClient, files: dict[str, list[ModbusMaster]], ignore: set[str] = frozenset(),
+              dry_run: bool = False) -> Plan:
+    """
+    Provisions the things and items of an inventory through the REST API, instead of writing `.things` and `.items`
+    files
+
+    :param dry_run: Only compute the changes
+    :return: the applied changes
+    """
+    plan = diff(desired_state(files, ignore), client.fetch())
+    if not dry_run:
+        client.apply(plan)
+    return plan
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m openhab.rest",
+                                     description="Provisions the things and items of the inventory through the openHAB REST API")
+    parser.add_argument("url", help="openHAB root URL (example: http://localhost:8080)")
+    parser.add_argument("--token", help="API token")
+    parser.add_argument("--inventory", type=Path, default=DEFAULT_INVENTORY, help="inventory script defining `files`")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="number of concurrent requests")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only print the changes")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every change")
+    args = parser.parse_args(argv)
+
+    files, ignore = load_inventory(args.inventory)
+    plan = provision(RestClient(args.url, args.token, args.workers), files, ignore, args.dry_run)
+    if args.verbose or args.dry_run:
+        for change in plan.changes:
+            print(change)
+    for key in plan.readonly:
+        print(f"not editable (defined in a file): {key}", file=sys.stderr)
+    print(plan.summary())
+
+
+if __name__ == "__main__":
+    main()
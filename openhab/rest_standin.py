@@ -0,0 +1,213 @@
+import argparse
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+DEFAULT_CONFIG = {
+    "modbus:tcp": {"port": 502, "timeBetweenTransactionsMillis": 60, "timeBetweenReconnectMillis": 0,
+                   "connectMaxTries": 1, "reconnectAfterMillis": 0, "connectTimeoutMillis": 10000,
+                   "enableDiscovery": False, "rtuEncoded": False},
+    "modbus:poller": {"refresh": 500, "cacheMillis": 50},
+    "modbus:data": {"updateUnchangedValuesEveryMillis": 1000, "writeMultipleEvenWithSingleRegisterOrCoil": False},
+}
+"""Default configuration parameters added by openHAB to the Modbus things"""
+
+DATA_CHANNELS = ("number", "switch", "contact", "dimmer", "datetime", "string", "rollershutter",
+                 "lastReadSuccess", "lastReadError", "lastWriteSuccess", "lastWriteError")
+"""Channels of a Modbus data thing"""
+
+
+class Registry:
+    """
+    In-memory thing, item, link and metadata registries, with the behavior of openHAB that matters to the provisioning
+    """
+
+    def __init__(self):
+        self.things: dict[str, dict] = {}
+        self.items: dict[str, dict] = {}
+        self.links: dict[str, dict] = {}
+        self.metadata: dict[str, dict[str, dict]] = {}
+        """Metadata by item name, then by namespace"""
+        self.requests = Counter()
+        """Number of requests received, by `METHOD /path` pattern (example: `PUT /rest/items/{item}/metadata/{ns}`)"""
+        self.lock = threading.Lock()
+
+    def add_thing(self, thing: dict) -> dict:
+        type_uid = thing["thingTypeUID"]
+        thing = {**thing, "configuration": {**DEFAULT_CONFIG.get(type_uid, {}), **thing.get("configuration", {})},
+                 "editable": True, "statusInfo": {"status": "UNINITIALIZED", "statusDetail": "NONE"}}
+        if type_uid == "modbus:data" and not thing.get("channels"):
+            thing["channels"] = [{"uid": f"{thing['UID']}:{channel}", "id": channel} for channel in DATA_CHANNELS]
+        thing.setdefault("channels", [])
+        self.things[thing["UID"]] = thing
+        return thing
+
+    def put_item(self, item: dict):
+        self.items[item["name"]] = {**item, "state": "NULL", "editable": True}
+
+    def remove_item(self, name: str):
+        del self.items[name]
+        # openHAB removes the metadata and the links of a removed item
+        self.metadata.pop(name, None)
+        for key in [key for key, link in self.links.items() if link["itemName"] == name]:
+            del self.links[key]
+
+    def get_items(self, namespaces: Optional[list[str]]) -> list[dict]:
+        items = []
+        for name, item in self.items.items():
+            metadata = {ns: md for ns, md in self.metadata.get(name, {}).items() if namespaces is None or ns in namespaces}
+            items.append({**item, "metadata": metadata} if metadata else item)
+        return items
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves the subset of the openHAB REST API used by `openhab.rest`
+    """
+    server: "StandInServer"
+    protocol_version = "HTTP/1.1"
+    """Keeps the connections alive, like openHAB's Jetty"""
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status: int, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_request(self, method: str):
+        url = urlsplit(self.path)
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        if self.server.token and self.headers.get("Authorization") != f"Bearer {self.server.token}":
+            return self.reply(401)
+        if parts[0] != "rest" or len(parts) < 2:
+            return self.reply(404)
+
+        registry = self.server.registry
+        with registry.lock:
+            status, result, pattern = self.route(registry, method, parts[1:], parse_qs(url.query), body)
+            registry.requests[f"{method} /rest/{pattern}"] += 1
+        self.reply(status, result)
+
+    def route(self, registry: Registry, method: str, path: list[str], query: dict, body):
+        """
+        :return: the HTTP status, the response body and the path pattern of the request
+        """
+        kind, args = path[0], path[1:]
+        if kind == "things":
+            if method == "GET" and not args:
+                return 200, list(registry.things.values()), "things"
+            if method == "POST" and not args:
+                if body["UID"] in registry.things:
+                    return 409, None, "things"
+                return 201, registry.add_thing(body), "things"
+            if len(args) == 1 and args[0] not in registry.things:
+                return 404, None, "things/{uid}"
+            if method == "PUT" and len(args) == 1:
+                return 200, registry.add_thing(body), "things/{uid}"
+            if method == "DELETE" and len(args) == 1:
+                del registry.things[args[0]]
+                return 200, None, "things/{uid}"
+        elif kind == "items":
+            if method == "GET" and not args:
+                namespaces = query["metadata"][0].split(",") if "metadata" in query else None
+                return 200, registry.get_items(namespaces), "items"
+            if method == "PUT" and not args:
+                for item in body:
+                    registry.put_item(item)
+                return 200, None, "items"
+            if args and args[0] not in registry.items:
+                return 404, None, "items/{item}"
+            if method == "DELETE" and len(args) == 1:
+                registry.remove_item(args[0])
+                return 200, None, "items/{item}"
+            if len(args) == 3 and args[1] == "metadata":
+                if method == "PUT":
+                    registry.metadata.setdefault(args[0], {})[args[2]] = body
+                    return 200, None, "items/{item}/metadata/{ns}"
+                if method == "DELETE":
+                    registry.metadata.get(args[0], {}).pop(args[2], None)
+                    return 200, None, "items/{item}/metadata/{ns}"
+        elif kind == "links":
+            if method == "GET" and not args:
+                return 200, list(registry.links.values()), "links"
+            if len(args) == 2 and method == "PUT":
+                registry.links["/".join(args)] = {**body, "itemName": args[0], "channelUID": args[1], "editable": True}
+                return 200, None, "links/{item}/{channel}"
+            if len(args) == 2 and method == "DELETE":
+                return (200 if registry.links.pop("/".join(args), None) else 404), None, "links/{item}/{channel}"
+        return 404, None, "/".join(path)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the openHAB REST API, to test the provisioning without an openHAB instance
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, token: Optional[str] = None):
+        """
+        :param port: Port to listen on, 0 for any free port
+        :param token: API token to require, if any
+        """
+        super().__init__((host, port), Handler)
+        self.registry = Registry()
+        self.token = token
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> threading.Thread:
+        """
+        Serves in a background thread
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m openhab.rest_standin",
+                                     description="Serves a local in-memory stand-in for the openHAB REST API")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--token", help="API token to require")
+    args = parser.parse_args(argv)
+
+    server = StandInServer(args.host, args.port, args.token)
+    print(f"Listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    for pattern, count in sorted(server.registry.requests.items()):
+        print(f"{count:>7} {pattern}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import struct
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from gen_conf import resolve_ids
+from openhab.config import OHPollerType
+from openhab.modbus import ModbusMaster, ModbusProp, PropGroup, SlaveBase
+from openhab.types import *
+from utils.inventory import load_inventory, DEFAULT_INVENTORY
+
+MAX_READ_REGISTERS = 125
+"""Maximum number of registers in a single Modbus read request"""
+MAX_READ_BITS = 2000
+"""Maximum number of coils/discrete inputs in a single Modbus read request"""
+
+FUNCTION_CODES = {1: "coil", 2: "discrete", 3: "holding", 4: "input"}
+"""Supported Modbus function codes, with the openHAB poller type they are used for"""
+
+# Modbus exception codes
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_VALUE = 0x03
+GATEWAY_TARGET_FAILED = 0x0B
+
+PROFILES = {
+    TEMP: (20, 10),
+    POWER: (2000, 1500),
+    VOLTAGE: (230, 5),
+    CURRENT: (10, 8),
+    FREQUENCY: (50, 0.1),
+    RESISTANCE: (1000, 100),
+    ANGLE: (180, 170),
+    SPEED: (5, 4),
+    PRESSURE: (1013, 10),
+    LIGHT: (500, 450),
+    ILLUMINANCE: (20000, 19000),
+    VOLUME_RATE: (100, 50),
+}
+"""Typical value (mean, amplitude) of each quantity, in the unit most devices use"""
+
+UNIT_PROFILES = {
+    "%": (50, 40),
+    "kW": (20, 15),
+    "kWh": (50, 30),
+    "bar": (30, 20),
+}
+"""Typical value (mean, amplitude) for units that don't match the quantity's usual magnitude"""
+
+COUNTER_QUANTITIES = {ENERGY, TIME}
+"""Quantities that are modelled as ever-increasing counters"""
+
+RANGE_MARGIN = 0.05
+"""Share of the range of a register kept free at each end, so that the values are not clamped (nor mistaken for the
+null sentinel, usually an extreme value)"""
+
+
+def fit_profile(mean: float, amplitude: float, low: float, high: float) -> tuple[float, float]:
+    """
+    Restricts a profile (mean, amplitude) to the physical range of a register, minus `RANGE_MARGIN`. If the profile is
+    entirely out of range, the values span the part of the range with the sign of the profile.
+
+    >>> [round(x, 2) for x in fit_profile(2000, 1500, -327.68, 327.67)]  # power in W, int16 register with a scale of 100
+    [147.45, 147.45]
+    >>> fit_profile(20, 10, -3276.8, 3276.7)
+    (20, 10)
+    """
+    margin = RANGE_MARGIN * (high - low)
+    low, high = low + margin, high - margin
+    lo, hi = max(mean - amplitude, low), min(mean + amplitude, high)
+    if lo >= hi:
+        lo, hi = (max(low, 0), high) if mean >= 0 else (low, min(high, 0))
+    if (lo, hi) == (mean - amplitude, mean + amplitude):
+        return mean, amplitude
+    return (lo + hi) / 2, (hi - lo) / 2
+
+
+@dataclass
+class SimConfig:
+    """
+    Simulator settings
+    """
+    host: str = "127.0.0.1"
+    """Address to listen on"""
+    port: int = 5020
+    """Port of the first master; the following masters get the following ports"""
+    loopback: bool = False
+    """Give each master its own loopback address (127.0.x.y) on `port` instead of its own port, so that they can also be pinged"""
+    latency: float = 0.01
+    """Mean response time of a slave, in seconds"""
+    jitter: float = 0.005
+    """Maximum random deviation from `latency`, in seconds"""
+    failure_rate: float = 0.0
+    """Probability of a request not being answered by the slave"""
+    failing: dict[str, float] = field(default_factory=dict)
+    """Failure probability of specific slaves, by ID (example: `{"SOL_Y1": 1.0}` to simulate a dead slave)"""
+    null_rate: float = 0.0
+    """Probability of a property with a `null` sentinel to return that sentinel"""
+    serial: bool = True
+    """Serialize the requests of each master, like a Modbus TCP to RTU gateway on a serial bus"""
+    seed: Optional[int] = None
+    """Random seed, for reproducible runs"""
+
+
+class PropModel:
+    """
+    Generates plausible, slowly varying values for a property
+    """
+
+    def __init__(self, prop: ModbusProp, rng: random.Random):
+        self.prop = prop
+        self.rng = rng
+        self.mean, self.amplitude = UNIT_PROFILES.get(prop.unit) or PROFILES.get(prop.quantity, (10, 5))
+        self.period = rng.uniform(600, 3600)
+        self.phase = rng.uniform(0, 2 * math.pi)
+        self.counter = prop.quantity in COUNTER_QUANTITIES
+        self.raw_range = prop.valtype.raw_range()
+        if self.raw_range is not None and not self.counter:
+            scale = prop.valtype.scale
+            self.mean, self.amplitude = fit_profile(self.mean, self.amplitude, *sorted(b / scale for b in self.raw_range))
+        self.origin = time.time() - rng.uniform(0, 1e6)
+
+    def value(self, now: float) -> float:
+        """
+        Physical value (in the unit of the property) at a given time
+        """
+        if self.counter:
+            return (now - self.origin) * self.mean / 3600
+        wave = math.sin(2 * math.pi * now / self.period + self.phase)
+        return self.mean + self.amplitude * (0.9 * wave + 0.1 * self.rng.uniform(-1, 1))
+
+    def registers(self, now: float, null_rate: float) -> list[int]:
+        valtype = self.prop.valtype
+        if valtype.openhab == "bit":
+            # on for half of the period of the value
+            return valtype.to_registers(self.value(now) > self.mean)
+        if valtype.null is not None and self.rng.random() < null_rate:
+            return valtype.to_registers(valtype.null)
+        raw = self.value(now) * valtype.scale
+        if self.counter and self.raw_range is not None:
+            # counters roll over, like the real ones
+            low, high = self.raw_range
+            raw = low + (raw - low) % (high - low + 1)
+        return valtype.to_registers(raw)
+
+
+@dataclass
+class VirtualSlave:
+    """
+    Simulated Modbus slave, answering for all the properties of the slaves sharing a unit ID
+    """
+    id: str
+    """Identifier of the slave group (example: `SOL_Y1`)"""
+    unit: int
+    """Modbus unit ID"""
+    failure_rate: float
+    registers: dict[OHPollerType, list[tuple[int, PropModel]]] = field(default_factory=dict)
+    """Properties by poller type, as (register number, value model) pairs sorted by register number"""
+
+    def add(self, slave: SlaveBase, group: PropGroup, rng: random.Random):
+        registers = self.registers.setdefault(group.type_, [])
+        registers.extend((slave.register_address(group, p), PropModel(p, rng)) for p in group.props)
+        registers.sort(key=lambda r: r[0])
+
+    def read(self, type_: OHPollerType, start: int, count: int, now: float, null_rate: float) -> list[int]:
+        """
+        Returns the values of `count` registers (or bits) starting at `start`. Unmapped registers read as 0.
+        """
+        values = [0] * count
+        for address, model in self.registers.get(type_, ()):
+            if address >= start + count:
+                break
+            if address + model.prop.valtype.size <= start:
+                continue
+            for i, reg in enumerate(model.registers(now, null_rate), address - start):
+                if 0 <= i < count:
+                    values[i] = reg
+        return values
+
+
+class VirtualGateway:
+    """
+    Simulated Modbus TCP gateway, serving all the slaves of a Modbus master
+    """
+
+    def __init__(self, master: ModbusMaster, host: str, port: int, config: SimConfig, rng: random.Random):
+        self.master = master
+        self.host = host
+        self.port = port
+        self.config = config
+        self.rng = rng
+        self.bus = asyncio.Lock()
+        self.slaves: dict[int, VirtualSlave] = {}
+        self.requests = 0
+        self.failures = 0
+        for id_s, slave_group in master.slaves.items():
+            unit = master.slave_offset + id_s
+            failure_rate = config.failing.get(slave_group.effective_id, config.failure_rate)
+            virtual = self.slaves.setdefault(unit, VirtualSlave(slave_group.effective_id, unit, failure_rate))
+            for slave in slave_group.slaves:
+                for group in slave.get_prop_groups():
+                    virtual.add(slave, group, rng)
+
+    async def start(self) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.serve, self.host, self.port)
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                transaction, protocol, length, unit = struct.unpack(">HHHB", header)
+                pdu = await reader.readexactly(length - 1)
+                response = await self.handle(unit, pdu)
+                writer.write(struct.pack(">HHHB", transaction, protocol, len(response) + 1, unit) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, unit: int, pdu: bytes) -> bytes:
+        """
+        Handles a request PDU and returns the response PDU
+        """
+        self.requests += 1
+        function = pdu[0]
+        if function not in FUNCTION_CODES or len(pdu) < 5:
+            return bytes((function | 0x80, ILLEGAL_FUNCTION))
+        start, count = struct.unpack(">HH", pdu[1:5])
+        type_ = FUNCTION_CODES[function]
+        bits = type_ in ("coil", "discrete")
+        if not 1 <= count <= (MAX_READ_BITS if bits else MAX_READ_REGISTERS):
+            return bytes((function | 0x80, ILLEGAL_DATA_VALUE))
+
+        slave = self.slaves.get(unit)
+        if slave is None:
+            return bytes((function | 0x80, GATEWAY_TARGET_FAILED))
+
+        if self.config.serial:
+            async with self.bus:
+                return await self.respond(slave, function, type_, start, count)
+        return await self.respond(slave, function, type_, start, count)
+
+    async def respond(self, slave: VirtualSlave, function: int, type_: OHPollerType, start: int, count: int) -> bytes:
+        delay = max(0.0, self.config.latency + self.rng.uniform(-self.config.jitter, self.config.jitter))
+        if self.rng.random() < slave.failure_rate:
+            # an unresponsive slave behind a gateway: the gateway gives up after its own timeout
+            self.failures += 1
+            await asyncio.sleep(delay * 10)
+            return bytes((function | 0x80, GATEWAY_TARGET_FAILED))
+        await asyncio.sleep(delay)
+
+        values = slave.read(type_, start, count, time.time(), self.config.null_rate)
+        if type_ in ("coil", "discrete"):
+            data = bytearray((count + 7) // 8)
+            for i, bit in enumerate(values):
+                if bit:
+                    data[i // 8] |= 1 << (i % 8)
+            return bytes((function, len(data))) + bytes(data)
+        return bytes((function, 2 * count)) + struct.pack(f">{count}H", *values)
+
+
+def loopback_address(index: int) -> str:
+    """
+    Returns a distinct loopback address for each master
+
+    >>> loopback_address(0)
+    '127.0.1.1'
+    >>> loopback_address(250)
+    '127.0.2.1'
+    """
+    return f"127.0.{index // 250 + 1}.{index % 250 + 1}"
+
+
+def build_gateways(files: dict[str, list[ModbusMaster]], config: SimConfig) -> list[VirtualGateway]:
+    """
+    Creates a simulated gateway for every Modbus master of the inventory
+    """
+    rng = random.Random(config.seed)
+    gateways = []
+    for file, masters in files.items():
+        resolve_ids(file, masters)
+        for master in masters:
+            index = len(gateways)
+            if config.loopback:
+                host, port = loopback_address(index), config.port
+            else:
+                host, port = config.host, config.port + index
+            gateways.append(VirtualGateway(master, host, port, config, rng))
+    return gateways
+
+
+async def run(gateways: list[VirtualGateway], report_every: float = 10):
+    servers = [await gw.start() for gw in gateways]
+    try:
+        while True:
+            await asyncio.sleep(report_every)
+            requests = sum(gw.requests for gw in gateways)
+            failures = sum(gw.failures for gw in gateways)
+            print(f"{requests} requests served, {failures} simulated failures")
+    finally:
+        for server in servers:
+            server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m openhab.simulator",
+                                     description="Simulates the Modbus TCP masters and slaves of the inventory")
+    parser.add_argument("--inventory", type=Path, default=DEFAULT_INVENTORY, help="inventory script defining `files`")
+    parser.add_argument("--host", default=SimConfig.host, help="address to listen on")
+    parser.add_argument("--port", type=int, default=SimConfig.port, help="port of the first master")
+    parser.add_argument("--loopback", action="store_true", help="one loopback address per master instead of one port")
+    parser.add_argument("--latency", type=float, default=SimConfig.latency, help="mean slave response time (s)")
+    parser.add_argument("--jitter", type=float, default=SimConfig.jitter, help="response time deviation (s)")
+    parser.add_argument("--failure-rate", type=float, default=SimConfig.failure_rate, help="probability of a slave not answering")
+    parser.add_argument("--fail", action="append", default=[], metavar="ID[=RATE]",
+                        help="failure probability of a specific slave (default: always fails)")
+    parser.add_argument("--null-rate", type=float, default=SimConfig.null_rate, help="probability of returning null sentinels")
+    parser.add_argument("--no-serial", dest="serial", action="store_false", help="answer requests to a master concurrently")
+    parser.add_argument("--seed", type=int, help="random seed")
+    parser.add_argument("--map", type=Path, help="write the master IP to host/port mapping to this JSON file")
+    args = parser.parse_args(argv)
+
+    failing = {}
+    for spec in args.fail:
+        id_, _, rate = spec.partition("=")
+        failing[id_] = float(rate) if rate else 1.0
+    config = SimConfig(args.host, args.port, args.loopback, args.latency, args.jitter, args.failure_rate, failing,
+                       args.null_rate, args.serial, args.seed)
+
+    files, ignore = load_inventory(args.inventory)
+    gateways = build_gateways({f: m for f, m in files.items() if f not in ignore}, config)
+    mapping = {gw.master.ip: {"host": gw.host, "port": gw.port} for gw in gateways}
+    if args.map:
+        args.map.write_text(json.dumps(mapping, indent=2))
+    for gw in gateways:
+        print(f"{gw.master.ip} -> {gw.host}:{gw.port} ({len(gw.slaves)} slaves)")
+
+    try:
+        asyncio.run(run(gateways))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import struct
 from dataclasses import dataclass, replace
 from typing import Optional
 
@@ -30,6 +31,56 @@ class ValType:
         else:
             return self.openhab
 
+    def raw_range(self) -> Optional[tuple[int, int]]:
+        """
+        Range of the raw values of an integer type (None for floating-point types and bits)
+
+        >>> I16.raw_range()
+        (-32768, 32767)
+        >>> U32.raw_range()
+        (0, 4294967295)
+        >>> F32.raw_range() is None
+        True
+        """
+        fmt = STRUCT_FORMATS.get(self.openhab, "f")
+        if fmt in "fd":
+            return None
+        bits = 8 * struct.calcsize(fmt)
+        return (0, 2 ** bits - 1) if fmt.isupper() else (-2 ** (bits - 1), 2 ** (bits - 1) - 1)
+
+    def to_registers(self, raw: float) -> list[int]:
+        """
+        Encodes a raw value (as sent by the equipment, i.e. before scaling) into Modbus registers
+
+        >>> U32.to_registers(65536 + 2)
+        [1, 2]
+        >>> U32s.to_registers(65536 + 2)
+        [2, 1]
+        >>> BIT.to_registers(True)
+        [1]
+        """
+        if self.openhab == "bit":
+            return [1 if raw else 0]
+        fmt = STRUCT_FORMATS[self.openhab]
+        if (bounds := self.raw_range()) is not None:
+            raw = min(max(int(round(raw)), bounds[0]), bounds[1])
+        registers = list(struct.unpack(f">{self.size}H", struct.pack(f">{fmt}", raw)))
+        if self.swap:
+            registers.reverse()
+        return registers
+
+
+STRUCT_FORMATS = {
+    "uint16": "H",
+    "int16": "h",
+    "uint32": "I",
+    "int32": "i",
+    "uint64": "Q",
+    "int64": "q",
+    "float32": "f",
+    "float64": "d",
+}
+"""`struct` format character of each base openHAB Modbus data type"""
 
 # cf https://www.openhab.org/addons/bindings/modbus/#value-types-on-read-and-write
 U16 = ValType("uint16", 1)
@@ -42,6 +93,8 @@ I32 = ValType("int32", 2)
 I32s = I32(swap=True)
 I64 = ValType("int64", 4)
 F32 = ValType("float32", 2)
+BIT = ValType("bit", 1)
+"""Single coil or discrete input (the bits of registers are read with `StatusWord`)"""
 
 OHIcon = str
 OHQuantity = str
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Ping check runner: pings the Modbus masters listed in the manifest generated by `openhab.ping_check`, and enables or
+disables their bridges in openHAB. The manifest is reloaded whenever it changes, without restarting.
+"""
+
+from multiping import multi_ping
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+import requests
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+def get_env(key):
+    if val := os.getenv(key):
+        return val
+    else:
+        raise ValueError(f"Environment variable {key} not set")
+
+OH_ROOT = get_env("OPENHAB_URL")
+OH_TOKEN = get_env("OPENHAB_TOKEN")
+
+MANIFEST_PATH = Path(os.getenv("PING_MANIFEST", Path(__file__).parent / "generated" / "manifest.json"))
+DEFAULT_SETTINGS = {"interval": 5, "timeout": 0.2, "retry": 0}  # overridden by the `settings` of the manifest
+OPENHAB_TIMEOUT = 5
+
+# Prometheus metrics and health check
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+HEALTHY_WITHIN = 3  # /healthz fails when no cycle completed for this many intervals
+
+# telemetry, disabled when INFLUX_URL is not set
+INFLUX_URL = os.getenv("INFLUX_URL")
+INFLUX_BUCKET = os.getenv("INFLUX_PING_BUCKET", "demobucket")
+BATCH_SIZE = 5000  # lines per write
+FLUSH_INTERVAL = 10  # seconds between writes of an incomplete batch
+QUEUE_SIZE = 50000  # lines kept while InfluxDB is slow or down (queued or in the pending batch), newer ones are dropped beyond
+WRITE_TIMEOUT = 10
+
+
+def log(message: str):
+    print(f"[{datetime.now()}] {message}")
+
+
+class Manifest:
+    # targets (bridge IDs by IP address) and probe settings, reloaded when the file changes; the generator replaces
+    # the file atomically, so it is never read half-written
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.stamp = None
+        self.ips = {}
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.reloads = 0
+
+    def reload(self) -> bool:
+        try:
+            stat = self.path.stat()
+            stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self.stamp:
+            return False
+        if stamp is None:
+            log(f"{self.path} not found, waiting for it")
+            self.stamp = None
+            return False
+        try:
+            data = json.loads(self.path.read_text())
+            ips = {ip: list(ids) for ip, ids in data["targets"].items()}
+            settings = {**DEFAULT_SETTINGS, **data.get("settings", {})}
+        except (OSError, ValueError, KeyError, AttributeError, TypeError) as e:
+            # keep probing the previous targets until the next change
+            log(f"Invalid manifest {self.path}, keeping the previous one: {e!r}")
+            self.stamp = stamp
+            return False
+        added = ips.keys() - self.ips.keys()
+        removed = self.ips.keys() - ips.keys()
+        changed = {ip for ip in ips.keys() & self.ips.keys() if ips[ip] != self.ips[ip]}
+        log(f"Loaded {self.path}: {len(ips)} IPs ({len(added)} added, {len(removed)} removed, {len(changed)} changed)")
+        self.stamp = stamp
+        self.ips = ips
+        self.settings = settings
+        self.reloads += 1
+        forget(removed, {id for ids in ips.values() for id in ids})
+        return True
+
+
+def forget(removed_ips: set, ids: set):
+    # state of the targets that left the manifest; the unchanged ones keep theirs
+    for id in list(cache):
+        if id not in ids:
+            del cache[id]
+    if telemetry:
+        telemetry.forget(removed_ips)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def render(self, name: str) -> list:
+        lines = [f'{name}_bucket{{le="{bound}"}} {count}' for bound, count in zip(self.buckets, self.counts)]
+        return lines + [f'{name}_bucket{{le="+Inf"}} {self.count}', f"{name}_sum {self.sum:.6f}", f"{name}_count {self.count}"]
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cycle = Histogram([0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30])
+        self.openhab = Histogram([0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5])
+        self.lag = 0.0
+        self.cycles = 0
+        self.overruns = 0
+        self.probes = 0
+        self.openhab_errors = 0
+        self.cycle_errors = 0
+        self.last_cycle = 0.0
+        self.last_success = 0.0
+
+    def render(self) -> str:
+        with self.lock:
+            lines = [
+                "# TYPE ping_check_cycle_seconds histogram", *self.cycle.render("ping_check_cycle_seconds"),
+                "# TYPE ping_check_lag_seconds gauge", f"ping_check_lag_seconds {self.lag:.6f}",
+                "# TYPE ping_check_cycles_total counter", f"ping_check_cycles_total {self.cycles}",
+                "# TYPE ping_check_overruns_total counter", f"ping_check_overruns_total {self.overruns}",
+                "# TYPE ping_check_cycle_errors_total counter", f"ping_check_cycle_errors_total {self.cycle_errors}",
+                "# TYPE ping_check_probes_total counter", f"ping_check_probes_total {self.probes}",
+                "# TYPE ping_check_targets gauge", f"ping_check_targets {len(manifest.ips)}",
+                "# TYPE ping_check_manifest_reloads_total counter", f"ping_check_manifest_reloads_total {manifest.reloads}",
+                "# TYPE ping_check_openhab_request_seconds histogram", *self.openhab.render("ping_check_openhab_request_seconds"),
+                "# TYPE ping_check_openhab_errors_total counter", f"ping_check_openhab_errors_total {self.openhab_errors}",
+                "# TYPE ping_check_cache_entries gauge", f"ping_check_cache_entries {len(cache)}",
+                "# TYPE ping_check_last_cycle_timestamp_seconds gauge", f"ping_check_last_cycle_timestamp_seconds {self.last_cycle:.3f}",
+                "# TYPE ping_check_last_success_timestamp_seconds gauge", f"ping_check_last_success_timestamp_seconds {self.last_success:.3f}",
+            ]
+            if telemetry:
+                lines += [
+                    "# TYPE ping_check_telemetry_queued gauge", f"ping_check_telemetry_queued {telemetry.lines.qsize()}",
+                    "# TYPE ping_check_telemetry_dropped_total counter", f"ping_check_telemetry_dropped_total {telemetry.dropped_total}",
+                ]
+        return "\n".join(lines) + "\n"
+
+    def healthy(self) -> bool:
+        return time.time() - self.last_cycle < HEALTHY_WITHIN * manifest.settings["interval"]
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            status, body, content_type = 200, metrics.render(), "text/plain; version=0.0.4"
+        elif self.path == "/healthz":
+            healthy = metrics.healthy()
+            status, body, content_type = (200, "ok\n", "text/plain") if healthy else (503, "stalled\n", "text/plain")
+        else:
+            status, body, content_type = 404, "", "text/plain"
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+cache = {}
+metrics = Metrics()
+openhab = requests.Session()
+openhab.headers["Authorization"] = f"Bearer {OH_TOKEN}"
+
+
+def send_openhab(id: str, val: bool) -> bool:
+    if cache.get(id) == val:
+        return True
+    url = f"{OH_ROOT}/rest/things/modbus:tcp:{id}/enable"
+    (payload, message) = ("true", "Enabling") if val else ("false", "Disabling")
+    log(f"{message} {id}")
+    start = time.monotonic()
+    try:
+        response = openhab.put(url, data=payload, headers={"Content-Type": "text/plain"}, timeout=OPENHAB_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        # not cached, so that it's sent again on the next cycle
+        log(f"{message} {id} failed: {e}")
+        with metrics.lock:
+            metrics.openhab_errors += 1
+        return False
+    finally:
+        with metrics.lock:
+            metrics.openhab.observe(time.monotonic() - start)
+    cache[id] = val
+    return True
+
+
+def escape_tag(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+class Telemetry:
+    # RTT, loss and state transitions of each IP, written to InfluxDB in batches by a background thread, so that a
+    # slow InfluxDB never delays the probes
+
+    def __init__(self):
+        # the writer holds up to BATCH_SIZE lines besides the queue
+        self.lines = queue.Queue(QUEUE_SIZE - BATCH_SIZE)
+        # the dropped counters are updated by the pinger and the writer
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.dropped_total = 0
+        self.up = {}
+        self.since = {}
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Token {get_env('INFLUX_TOKEN')}"
+        self.params = {"org": get_env("INFLUX_ORG"), "bucket": INFLUX_BUCKET, "precision": "ms"}
+        threading.Thread(target=self.writer, daemon=True).start()
+
+    def add(self, line: str):
+        try:
+            self.lines.put_nowait(line)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+                self.dropped_total += 1
+
+    def record(self, ip: str, rtt, now: float):
+        # the bridges behind an IP only depend on the IP, so they add no series; sorted so that they don't depend on the
+        # order of the manifest
+        tags = f"ip={escape_tag(ip)}"
+        if things := ",".join(sorted(manifest.ips.get(ip, ()))):
+            tags += f",things={escape_tag(things)}"
+        timestamp = int(now * 1000)
+        up = rtt is not None
+        fields = f"up={str(up).lower()},loss={int(not up)}i" + (f",rtt={rtt * 1000:.3f}" if up else "")
+        self.add(f"ping,{tags} {fields} {timestamp}")
+        if self.up.get(ip) != up:
+            # duration of the previous state (0 for the first probe)
+            duration = now - self.since.get(ip, now)
+            self.add(f"ping_state,{tags} up={str(up).lower()},previous_duration={duration:.1f} {timestamp}")
+            self.up[ip] = up
+            self.since[ip] = now
+
+    def forget(self, ips: set):
+        for ip in ips:
+            self.up.pop(ip, None)
+            self.since.pop(ip, None)
+
+    def write(self, batch: list) -> bool:
+        try:
+            response = self.session.post(f"{INFLUX_URL}/api/v2/write", params=self.params,
+                                         data="\n".join(batch).encode(), timeout=WRITE_TIMEOUT)
+            response.raise_for_status()
+            return True
+        except requests.RequestException as e:
+            log(f"Telemetry write of {len(batch)} lines failed: {e}")
+            return False
+
+    def writer(self):
+        batch = []
+        failing = False
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            if len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.lines.get(timeout=timeout))
+                except queue.Empty:
+                    pass
+            else:
+                # the lines beyond a full batch wait in the queue
+                time.sleep(timeout)
+            # after a failed write, wait for the deadline even if the batch is full
+            if (len(batch) < BATCH_SIZE or failing) and time.monotonic() < deadline:
+                continue
+            if batch:
+                failing = not self.write(batch)
+                if not failing:
+                    batch = []
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            with self.lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                log(f"{dropped} telemetry lines dropped")
+
+
+def cycle() -> bool:
+    manifest.reload()
+    ips = manifest.ips
+    if not ips:
+        return True
+    good, bad = multi_ping(ips.keys(), timeout=manifest.settings["timeout"], retry=manifest.settings["retry"])
+    now = time.time()
+    with metrics.lock:
+        metrics.probes += len(ips)
+    if telemetry:
+        for ip, rtt in good.items():
+            telemetry.record(ip, rtt, now)
+        for ip in bad:
+            telemetry.record(ip, None, now)
+    ok = True
+    for ip in good:
+        for id in ips[ip]:
+            ok &= send_openhab(id, True)
+    for ip in bad:
+        for id in ips[ip]:
+            ok &= send_openhab(id, False)
+    return ok
+
+
+manifest = Manifest(MANIFEST_PATH)
+telemetry = Telemetry() if INFLUX_URL else None
+
+
+def main():
+    server = ThreadingHTTPServer(("", METRICS_PORT), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # cycles start every `interval` seconds; when one overruns, the next one starts right away
+    scheduled = time.monotonic()
+    while True:
+        start = time.monotonic()
+        try:
+            ok = cycle()
+        except Exception:
+            traceback.print_exc()
+            ok = False
+        end = time.monotonic()
+        interval = manifest.settings["interval"]
+        with metrics.lock:
+            metrics.cycle.observe(end - start)
+            # how late the cycle ended relative to the start of the next one
+            metrics.lag = max(0.0, end - (scheduled + interval))
+            metrics.cycles += 1
+            metrics.last_cycle = time.time()
+            if ok:
+                metrics.last_success = metrics.last_cycle
+            else:
+                metrics.cycle_errors += 1
+            if metrics.lag > 0:
+                metrics.overruns += 1
+        scheduled = max(scheduled + interval, end)
+        time.sleep(max(0.0, scheduled - time.monotonic()))
+
+
+if __name__ == "__main__":
+    main()
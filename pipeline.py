@@ -0,0 +1,97 @@
+import argparse
+from pathlib import Path
+from typing import Iterable, Optional
+
+from gen_conf import CONF_PATH, Sharding, ShardWriter, resolve_bridge, resolve_ids, shard_name, update_manifest, \
+    write_items, write_things
+from influxdb.config import GEN_PATH, TASK_PATH, push_tasks, task_entries, write_tasks
+from openhab.modbus import ModbusMaster
+from openhab.ping_check import MANIFEST_PATH, write_manifest
+from utils.inventory import DEFAULT_INVENTORY, load_inventory
+from utils.profile import profiler
+from utils.spool import Spool
+from utils.stamps import Stamps
+
+
+def stream(files: dict[str, Iterable[ModbusMaster]], ignore: set[str] = frozenset(), conf_path: Path = CONF_PATH,
+           gen_dir: Path = GEN_PATH, manifest_path: Path = MANIFEST_PATH, sharding: Optional[Sharding] = None) -> list[str]:
+    """
+    Generates the openHAB configuration, the Flux tasks and the ping check manifest in a single pass over the
+    inventory. The masters of each file are iterated once (they can be produced by a generator), and each slave group
+    is resolved, written to its shard and dropped before the next one. The entries of the Flux templates and the ping
+    targets are spooled to disk during the pass, then written out one at a time. Memory therefore depends on the
+    largest slave group, not on the size of the site.
+
+    The generated files are the same as with `gen_conf`, `gen_tasks` and `gen_ping_check`.
+
+    :param files: The Modbus masters of each file
+    :param ignore: The files generated with `.unused`, and left out of the ping check
+    :return: the files that were written or removed
+    """
+    report = []
+    with Spool() as spool:
+        class_alerts = {}
+        for file, masters in files.items():
+            unused = file in ignore
+            shards = ShardWriter(conf_path, ".unused" if unused else "")
+            with profiler.stage("gen_conf"):
+                if sharding is None:
+                    # an empty file still gets its (empty) configuration files
+                    shards.open(file)
+                for logger in masters:
+                    resolve_ids(file, [logger])
+                    for id_s, slave_group in logger.slaves.items():
+                        bridge = resolve_bridge(file, logger, id_s, slave_group)
+                        things, items = shards.open(shard_name(file, logger, slave_group, sharding))
+                        write_things(things, bridge)
+                        write_items(items, bridge)
+                        for slave in slave_group.slaves:
+                            deadman, alerts = task_entries(slave, class_alerts)
+                            spool.append("deadman", deadman)
+                            for alert in alerts:
+                                spool.append("alerts", alert)
+                    if not unused:
+                        spool.append("targets", [group.effective_id for group in logger.slaves.values()], key=logger.ip)
+                generated, changed = shards.close()
+                removed = update_manifest(conf_path, file, generated)
+            report += [f"written {conf_path / path}" for path in changed]
+            report += [f"removed {conf_path / path}" for path in removed]
+
+        with profiler.stage("gen_tasks"):
+            written = write_tasks({"deadman": spool.rows("deadman"), "alerts": spool.rows("alerts")}, gen_dir)
+            report += [f"written {gen_dir / file}" for file, replaced in written.items() if replaced]
+
+        with profiler.stage("gen_ping_check"):
+            targets = ((ip, [bridge for ids in group for bridge in ids]) for ip, group in spool.groups("targets"))
+            if write_manifest(targets, manifest_path):
+                report.append(f"written {manifest_path}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pipeline",
+                                     description="Generates everything in a single streaming pass over the inventory, "
+                                                 "in bounded memory")
+    parser.add_argument("--inventory", type=Path, default=DEFAULT_INVENTORY,
+                        help="inventory script defining `files` (lists of masters, or iterables producing them)")
+    parser.add_argument("--shard", choices=("master", "location"), help="one pair of files per master or per location")
+    parser.add_argument("-t", "--no-tasks", action="store_true", help="don't synchronize the tasks with InfluxDB")
+    args = parser.parse_args(argv)
+
+    files, ignore = load_inventory(args.inventory)
+    for line in stream(files, ignore, sharding=args.shard):
+        print(line)
+
+    stamps = Stamps.load()
+    # the inputs of the configuration files are not digested (that would need the whole inventory): the next
+    # incremental build regenerates them
+    stamps.forget("conf:")
+    if not args.no_tasks:
+        # the task API takes the Flux code of each task as a whole, so it is read back from the generated files
+        push_tasks({path.name: (GEN_PATH / path.name).read_text(encoding="utf-8")
+                    for path in sorted(TASK_PATH.glob("*.flux"))}, stamps)
+    stamps.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+from typing import ClassVar
+
+import numpy as np
+
+from golden.cases import GapDevice
+from influxdb.backtest import ALERTS_EVERY, NS, alert_measures, backtest, count_triggers, load_series
+from influxdb.types import RangeAlert
+from openhab.modbus import ModbusMaster
+
+LINE_PROTOCOL = """\
+# exported with influx query
+edge_g1_c,host=a value=20.5 60000000000
+edge_g1_c,host=a value=70,unit="C" 90000000000
+edge_g1_a,host=a count=3i,value=12i 60000000000
+edge_g1_a value=13u 120000000000
+edge_g1_c,host=a other=1 150000000000
+
+edge_g1_c,host=a value=-20 180000000000"""
+
+ANNOTATED_CSV = """\
+#group,false,false,true,false,false,true
+#datatype,string,long,dateTime:RFC3339,double,string,string
+#default,_result,,,,,
+,result,table,_time,_value,_field,_measurement
+,,0,1970-01-01T00:01:00Z,20.5,value,edge_g1_c
+,,0,1970-01-01T00:01:30Z,70,value,edge_g1_c
+,,0,1970-01-01T00:01:30Z,1,other,edge_g1_c
+
+#group,false,false,true,false,false,true
+#datatype,string,long,dateTime:RFC3339,double,string,string
+#default,_result,,,,,
+,result,table,_time,_value,_field,_measurement
+,,1,1970-01-01T00:01:00Z,12,value,edge_g1_a
+,,1,1970-01-01T00:02:00Z,13,value,edge_g1_a
+"""
+
+SIMPLE_CSV = """\
+time,measurement,value
+60000000000,edge_g1_c,20.5
+90000000000,edge_g1_c,70
+60000000000,edge_g1_a,12
+"""
+
+
+class TwoRanges(GapDevice):
+    """
+    Device with a low and a high alert on the same field
+    """
+
+    alerts: ClassVar = [
+        RangeAlert("c", None, 50),
+        RangeAlert("c", -10, None),
+    ]
+
+
+def inventory() -> dict[str, list[ModbusMaster]]:
+    return {"edge": [ModbusMaster("10.0.0.1", "G", {1: TwoRanges("Two ranges", "A1")})]}
+
+
+def test_read_line_protocol(tmp_path):
+    path = tmp_path / "export.lp"
+    path.write_text(LINE_PROTOCOL)
+    series = load_series([path])
+    assert series.keys() == {"edge_g1_c", "edge_g1_a"}
+    # the points without a `value` field are skipped
+    assert series["edge_g1_c"].times.tolist() == [60 * NS, 90 * NS, 180 * NS]
+    assert series["edge_g1_c"].values.tolist() == [20.5, 70, -20]
+    assert series["edge_g1_a"].values.tolist() == [12, 13]
+
+    path.write_text("edge_g1_c value=1 60\n")
+    assert load_series([path], precision="s")["edge_g1_c"].times.tolist() == [60 * NS]
+    assert load_series([path], {"other"}) == {}
+
+
+def test_read_csv(tmp_path):
+    for name, text in (("annotated.csv", ANNOTATED_CSV), ("simple.csv", SIMPLE_CSV)):
+        path = tmp_path / name
+        path.write_text(text)
+        series = load_series([path])
+        assert series["edge_g1_c"].times.tolist() == [60 * NS, 90 * NS]
+        assert series["edge_g1_c"].values.tolist() == [20.5, 70]
+        assert series["edge_g1_a"].values[0] == 12
+
+
+def test_count_triggers():
+    assert count_triggers(np.array([], bool)) == 0
+    assert count_triggers(np.array([True, True, False, True, False, False, True])) == 3
+    assert count_triggers(np.array([False, True, True])) == 1
+
+
+def test_alerts_on_the_same_field(tmp_path):
+    measures = alert_measures(inventory())
+    assert [alert.flux() for _, alert in measures["edge_g1_c"]] == ["r.value > 50", "r.value < -10"]
+
+    # one point per task run: normal, too high, too high, normal, too low
+    path = tmp_path / "export.lp"
+    path.write_text("".join(f"edge_g1_c value={value} {(i + 1) * ALERTS_EVERY - NS}\n"
+                            for i, value in enumerate([20, 70, 80, 20, -20])))
+    results = {result.alert: result for result in backtest(inventory(), [path])}
+    assert results["r.value > 50"].triggers == 1 and results["r.value > 50"].crit == 2
+    assert results["r.value < -10"].triggers == 1
+
+    # an override replaces both ranges by a single one
+    results = backtest(inventory(), [path], overrides=["c=0:75"])
+    assert [(result.alert, result.triggers) for result in results] == [("r.value < 0.0 or r.value > 75.0", 2)]
@@ -0,0 +1,49 @@
+import pytest
+
+from golden.cases import GapDevice, WideDevice
+from influxdb.capacity import (ALERTS_EVERY, DATA_BUCKET, DAY, DEADMAN_EVERY, MONITORING_BUCKET, PlannerConfig,
+                               check_tags, line_size, plan, totals)
+from openhab.modbus import ModbusMaster
+
+
+def inventory() -> dict[str, list[ModbusMaster]]:
+    # 5 + 12 properties; the gap device has a deadman, the wide one a deadman and 2 alerts
+    return {"edge": [ModbusMaster("10.0.0.1", "G", {1: GapDevice("Gap", "A1"), 2: WideDevice("Wide", "A2")})]}
+
+
+def test_data_load():
+    config = PlannerConfig()
+    data = plan(inventory(), config)["edge"][DATA_BUCKET]
+    assert data.series == 17
+    assert data.points_per_s == pytest.approx(17 * config.change_ratio / config.poll_interval)
+    assert data.storage == pytest.approx(data.points_per_s * DAY * 365 * config.bytes_per_point + 17 * config.bytes_per_series)
+
+    every_minute = plan(inventory(), PlannerConfig(persist_interval=60))["edge"][DATA_BUCKET]
+    assert every_minute.points_per_s == pytest.approx(17 / 60)
+
+
+def test_status_load():
+    config = PlannerConfig()
+    monitoring = plan(inventory(), config)["edge"][MONITORING_BUCKET]
+    # `ok` and `crit` series for each field of each check
+    assert monitoring.series == 4 * 2 * config.status_fields
+    assert monitoring.points_per_s == pytest.approx(config.status_fields * (2 / DEADMAN_EVERY + 2 / ALERTS_EVERY))
+
+
+def test_status_check_names():
+    # the deadman statuses are written by global_deadman.flux, under its own check name
+    assert check_tags("global_deadman.flux")["_check_name"] == "Global deadman"
+    assert check_tags("custom_alerts.flux")["_check_name"] == "Python alerts"
+
+    monitoring = plan({"edge": [ModbusMaster("10.0.0.1", "G", {1: GapDevice("Gap", "A1")})]}, PlannerConfig())["edge"][MONITORING_BUCKET]
+    tags = {"_check_id": "0" * 16, "_check_name": "Global deadman", "_level": "crit", "_source_measurement": "edge_g1_a",
+            "_type": "deadman", "deadman": "deadman", "location": "A1"}
+    assert monitoring.bytes_per_day == DAY / DEADMAN_EVERY * line_size("statuses", tags, {"_message": f'"{"x" * 100}"', "value": "0"})
+
+
+def test_totals():
+    loads = plan({**inventory(), "other": inventory()["edge"]}, PlannerConfig())
+    total = totals(loads)
+    for bucket in (DATA_BUCKET, MONITORING_BUCKET):
+        assert total[bucket].series == 2 * loads["edge"][bucket].series
+        assert total[bucket].storage == pytest.approx(2 * loads["edge"][bucket].storage)
@@ -0,0 +1,49 @@
+import pytest
+
+from gen_conf import resolve_ids
+from golden.cases import WideDevice
+from openhab.decode import slave_plans, verify_capture
+from openhab.modbus import ModbusMaster
+
+
+@pytest.fixture
+def slave() -> WideDevice:
+    slave = WideDevice("Wide", "W1")
+    resolve_ids("edge", [ModbusMaster("10.0.0.1", "W", {1: slave})])
+    return slave
+
+
+def capture(slave: WideDevice, shift: int = 0) -> dict:
+    """
+    Capture of the `Wide` poller, with distinct values encoded by `to_registers`, read `shift` registers after the
+    start of the poller but labelled with the start of the poller
+    """
+    [poller] = [p for p in slave_plans(slave) if p.id.endswith("_Wide")]
+    registers, expected = {}, {}
+    for column, prop in enumerate(poller.plan.props):
+        address = slave.register_address(slave.props, prop)
+        raw = 1000 + 37 * column
+        registers.update(zip(range(address, address + prop.valtype.size), prop.valtype.to_registers(raw)))
+        # the properties on the edges are cut off by a shifted capture
+        if poller.start < address and address + prop.valtype.size < poller.start + poller.length:
+            expected[prop.id] = raw / prop.valtype.scale
+    dump = [registers.get(address, 0) for address in range(poller.start + shift, poller.start + shift + poller.length)]
+    return {"poller": poller.id, "start": poller.start, "registers": "".join(f"{r:04x}" for r in dump),
+            "expected": expected}
+
+
+def test_round_trip(slave):
+    assert verify_capture(slave, capture(slave)) == []
+
+
+@pytest.mark.parametrize("shift", [-1, 1])
+def test_shifted_capture(slave, shift):
+    # a capture starting one register early matches once the decoding window moves one register forward, and vice versa
+    problems = verify_capture(slave, capture(slave, shift))
+    assert len(problems) == 2
+    assert problems[0].startswith("EDGE_W1_Wide: wrong values for ")
+    assert problems[1] == f"EDGE_W1_Wide: values match with the start shifted by {-shift:+d} register"
+
+
+def test_unknown_poller(slave):
+    assert verify_capture(slave, {"poller": "EDGE_W1_Nope"})[0].startswith("EDGE_W1_Nope: no such poller")
@@ -0,0 +1,48 @@
+import pytest
+
+from golden.cases import GapDevice, InputDevice, StatusDevice, WideDevice
+from openhab.modbus import ModbusMaster
+from openhab.partition import EPSILON, assign, gateways, weights, write_instances
+
+DEVICES = [GapDevice, WideDevice, InputDevice, StatusDevice]
+
+
+def inventory() -> dict[str, list[ModbusMaster]]:
+    """
+    40 masters of 1 to 3 slaves, in 4 files
+    """
+    return {f"f{f}": [ModbusMaster(f"10.0.{f}.{i}", "M", {s: DEVICES[(f + i + s) % 4](f"D{s}", "A1") for s in range(1, i % 3 + 2)})
+                      for i in range(1, 11)] for f in range(4)}
+
+
+@pytest.mark.parametrize("count", [2, 3, 5])
+def test_load_cap(count):
+    site = gateways(inventory())
+    weight = weights(site)
+    instances = [f"oh{i}" for i in range(1, count + 1)]
+    assignment = assign(site, instances)
+    capacity = max((1 + EPSILON) / count, *weight.values())
+    for instance in instances:
+        assert sum(weight[ip] for ip, mine in assignment.items() if mine == instance) <= capacity + 1e-9
+
+
+@pytest.mark.parametrize("count", [2, 3, 5])
+def test_adding_an_instance(count):
+    site = gateways(inventory())
+    instances = [f"oh{i}" for i in range(1, count + 1)]
+    before, after = assign(site, instances), assign(site, instances + ["new"])
+    moved = [ip for ip in before if before[ip] != after[ip]]
+    # mostly the share of the new instance, and a few gateways pushed by the capacity bound
+    assert len(moved) <= 2 * len(site) / (count + 1)
+    assert sum(after[ip] != "new" for ip in moved) <= len(moved) / 2
+
+
+def test_ignored_files_are_assigned(tmp_path):
+    files = {**inventory(), "spare": [ModbusMaster("10.0.9.1", "S", {1: GapDevice("Spare", "Z1")})]}
+    site = gateways(files, {"spare"})
+    assert weights(site)["10.0.9.1"] == 0
+    assignment = assign(site, ["oh1", "oh2"])
+    write_instances(files, {"spare"}, assignment, ["oh1", "oh2"], tmp_path)
+    instance = tmp_path / assignment["10.0.9.1"]
+    assert (instance / "conf" / "things" / "spare.things.unused").exists()
+    assert "10.0.9.1" not in (instance / "ping_check" / "manifest.json").read_text()
@@ -0,0 +1,50 @@
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "ping_check"))
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    for key in ("OPENHAB_URL", "OPENHAB_TOKEN", "INFLUX_TOKEN", "INFLUX_ORG"):
+        monkeypatch.setenv(key, "test")
+    monkeypatch.delenv("INFLUX_URL", raising=False)
+    return importlib.import_module("ping_check_runner")
+
+
+@pytest.fixture
+def recorder(runner, monkeypatch):
+    """
+    A `Telemetry`, with the list of the lines it records (the background writer never gets them)
+    """
+    monkeypatch.setattr(runner.manifest, "ips", {"10.0.0.1": ["SOL_Y2", "SOL_Y1"], "10.0.0.2": ["EV 1=A,B"]})
+    telemetry = runner.Telemetry()
+    lines = []
+    monkeypatch.setattr(telemetry, "add", lines.append)
+    return telemetry, lines
+
+
+def test_line_protocol(recorder):
+    telemetry, lines = recorder
+    telemetry.record("10.0.0.1", 0.0123, 1000.5)
+    telemetry.record("10.0.0.1", None, 1010.5)
+    assert lines == [
+        "ping,ip=10.0.0.1,things=SOL_Y1\\,SOL_Y2 up=true,loss=0i,rtt=12.300 1000500",
+        "ping_state,ip=10.0.0.1,things=SOL_Y1\\,SOL_Y2 up=true,previous_duration=0.0 1000500",
+        "ping,ip=10.0.0.1,things=SOL_Y1\\,SOL_Y2 up=false,loss=1i 1010500",
+        "ping_state,ip=10.0.0.1,things=SOL_Y1\\,SOL_Y2 up=false,previous_duration=10.0 1010500",
+    ]
+
+
+def test_escaped_tags(recorder):
+    telemetry, lines = recorder
+    telemetry.record("10.0.0.2", 0.001, 1)
+    telemetry.record("10.0.0.3", 0.001, 1)
+    assert lines[::2] == [
+        "ping,ip=10.0.0.2,things=EV\\ 1\\=A\\,B up=true,loss=0i,rtt=1.000 1000",
+        # an IP missing from the manifest (removed meanwhile) has no `things` tag
+        "ping,ip=10.0.0.3 up=true,loss=0i,rtt=1.000 1000",
+    ]
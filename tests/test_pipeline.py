@@ -0,0 +1,49 @@
+from pathlib import Path
+
+import pytest
+
+from bench.site import stream_site, synthetic_site
+from gen_conf import gen_conf
+from golden.cases import edge_cases
+from influxdb.config import gen_tasks
+from openhab.ping_check import gen_ping_check
+from pipeline import stream
+from utils.inventory import load_inventory
+
+
+def batch(files, ignore, out: Path, sharding):
+    """
+    Generates everything like `__main__.py` does
+    """
+    for file, masters in files.items():
+        gen_conf(file, masters, file in ignore, out, sharding)
+    gen_tasks(files, dry_run=True, gen_dir=out / "flux")
+    gen_ping_check({file: masters for file, masters in files.items() if file not in ignore}, out / "manifest.json")
+
+
+def generated(out: Path) -> dict[str, bytes]:
+    return {str(path.relative_to(out)): path.read_bytes() for path in sorted(out.rglob("*")) if path.is_file()}
+
+
+def output_dir(path: Path) -> Path:
+    for directory in ("things", "items", "flux"):
+        (path / directory).mkdir(parents=True)
+    return path
+
+
+INVENTORIES = {
+    "reference": lambda: (load_inventory(), load_inventory()),
+    "edge": lambda: ((edge_cases(), set()), (edge_cases(), set())),
+    # the streaming pipeline iterates the masters of the synthetic site as they are built
+    "synthetic": lambda: ((synthetic_site(300), set()), (stream_site(300), set())),
+}
+
+
+@pytest.mark.parametrize("sharding", [None, "master", "location"])
+@pytest.mark.parametrize("inventory", INVENTORIES)
+def test_stream_matches_batch(tmp_path, inventory, sharding):
+    (files, ignore), (streamed, streamed_ignore) = INVENTORIES[inventory]()
+    batch(files, ignore, output_dir(tmp_path / "batch"), sharding)
+    out = output_dir(tmp_path / "stream")
+    stream(streamed, streamed_ignore, out, out / "flux", out / "manifest.json", sharding)
+    assert generated(out) == generated(tmp_path / "batch")
@@ -0,0 +1,90 @@
+from dataclasses import replace
+
+import pytest
+
+from devices.powidian import PowiDian
+from openhab.rest import RestClient, desired_state, provision
+from openhab.rest_standin import StandInServer
+from utils.inventory import load_inventory
+
+
+@pytest.fixture
+def server():
+    server = StandInServer()
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def provision_reference(server: StandInServer, change=None):
+    """
+    Provisions the reference inventory, after applying `change` to its files
+    """
+    files, ignore = load_inventory()
+    if change:
+        change(files)
+    server.registry.requests.clear()
+    return provision(RestClient(server.url), files, ignore), desired_state(*load_inventory())
+
+
+def test_first_provision_creates_everything(server):
+    plan, desired = provision_reference(server)
+    registry = server.registry
+    assert plan.changes and all(change.action == "add" for change in plan.changes)
+    assert registry.things.keys() == desired.things.keys()
+    assert registry.items.keys() == desired.items.keys()
+    assert len(registry.links) == len(desired.links)
+    assert sum(map(len, registry.metadata.values())) == len(desired.metadata)
+    assert registry.requests["PUT /rest/items"] < len(desired.items)
+
+
+def test_second_provision_is_a_noop(server):
+    provision_reference(server)
+    plan, _ = provision_reference(server)
+    assert plan.changes == [] and plan.readonly == []
+    assert all(pattern.startswith("GET ") for pattern in server.registry.requests)
+
+
+def test_changed_thing_is_updated(server):
+    provision_reference(server)
+    ip = load_inventory()[0]["h2"][0].ip
+    uid = next(uid for uid, thing in server.registry.things.items() if thing["configuration"].get("host") == ip)
+
+    def move(files):
+        files["h2"][0].ip = "10.99.0.1"
+
+    plan, _ = provision_reference(server, move)
+    assert [str(change) for change in plan.changes] == [f"~ things {uid}"]
+    assert server.registry.things[uid]["configuration"]["host"] == "10.99.0.1"
+    # the default parameters added by openHAB are kept
+    assert server.registry.things[uid]["configuration"]["port"] == 502
+
+
+def test_removed_parameter_is_cleared(server, monkeypatch):
+    provision_reference(server)
+    [uid] = [uid for uid in server.registry.things if uid.endswith("_el_rate_h2")]
+    assert server.registry.things[uid]["configuration"]["readTransform"] == "JS:null.js?when=65535"
+
+    def drop_null(files):
+        prop = next(p for p in PowiDian.props.props if p.id == "el_rate_h2")
+        monkeypatch.setattr(prop, "valtype", replace(prop.valtype, null=None))
+
+    plan, _ = provision_reference(server, drop_null)
+    assert [str(change) for change in plan.changes] == [f"~ things {uid}"]
+    assert "readTransform" not in server.registry.things[uid]["configuration"]
+    plan, _ = provision_reference(server, drop_null)
+    assert plan.changes == []
+
+
+def test_removed_thing_is_deleted(server):
+    _, desired = provision_reference(server)
+
+    def remove(files):
+        del files["h2"][0]
+
+    plan, _ = provision_reference(server, remove)
+    removed = {change.key for change in plan.changes if change.registry == "things"}
+    assert removed and all(change.action == "remove" for change in plan.changes)
+    assert server.registry.things.keys() == desired.things.keys() - removed
+    assert not any(link["channelUID"].startswith(tuple(removed)) for link in server.registry.links.values())
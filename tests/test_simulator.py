@@ -0,0 +1,91 @@
+import asyncio
+import random
+import struct
+import time
+
+from golden.cases import WideDevice
+from openhab.modbus import ModbusMaster, ModbusProp
+from openhab.simulator import FUNCTION_CODES, MAX_READ_REGISTERS, PropModel, SimConfig, build_gateways
+from openhab.types import I16, POWER, TEMP
+
+POLLER_FUNCTIONS = {type_: function for function, type_ in FUNCTION_CODES.items()}
+
+
+async def read_block(port: int, unit: int, function: int, start: int, count: int) -> list[int]:
+    """
+    Reads registers with a minimal Modbus TCP client
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(struct.pack(">HHHBBHH", 1, 0, 6, unit, function, start, count))
+        await writer.drain()
+        transaction, protocol, length, unit_ = struct.unpack(">HHHB", await reader.readexactly(7))
+        pdu = await reader.readexactly(length - 1)
+        assert (transaction, unit_, pdu[0]) == (1, unit, function)
+        return list(struct.unpack(f">{pdu[1] // 2}H", pdu[2:]))
+    finally:
+        writer.close()
+
+
+async def serve(config: SimConfig, coroutine):
+    """
+    Starts the gateway of the test master on a free loopback port and runs `coroutine(gateway, port)` against it
+    """
+    [gateway] = build_gateways({"edge": [ModbusMaster("10.0.0.1", "W", {1: WideDevice("Wide", "W1")})]}, config)
+    gateway.port = 0
+    server = await gateway.start()
+    try:
+        return await coroutine(gateway, server.sockets[0].getsockname()[1])
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_read_matches_encoding(monkeypatch):
+    # freeze the values, so that the expected registers don't depend on the time of the read
+    monkeypatch.setattr(PropModel, "value", lambda self, now: self.mean)
+
+    async def check(gateway, port):
+        [(unit, virtual)] = gateway.slaves.items()
+        [(type_, models)] = virtual.registers.items()
+        # split into blocks like the pollers, so that the gaps between the properties read as 0
+        blocks = []
+        for address, model in models:
+            if not blocks or address + model.prop.valtype.size - blocks[-1][0][0] > MAX_READ_REGISTERS:
+                blocks.append([])
+            blocks[-1].append((address, model))
+        for block in blocks:
+            start = block[0][0]
+            end = max(address + model.prop.valtype.size for address, model in block)
+            registers = await read_block(port, unit, POLLER_FUNCTIONS[type_], start, end - start)
+            expected = [0] * (end - start)
+            for address, model in block:
+                valtype = model.prop.valtype
+                expected[address - start:address - start + valtype.size] = valtype.to_registers(model.mean * valtype.scale)
+            assert registers == expected
+
+    asyncio.run(serve(SimConfig(latency=0, jitter=0, seed=1), check))
+
+
+def test_serial_bus():
+    latency = 0.2
+
+    async def concurrent_reads(gateway, port):
+        [unit] = gateway.slaves
+        begin = time.perf_counter()
+        await asyncio.gather(*(read_block(port, unit, 3, 1000, 4) for _ in range(2)))
+        return time.perf_counter() - begin
+
+    # a serial bus answers one request at a time, while a TCP slave answers both at once
+    assert asyncio.run(serve(SimConfig(latency=latency, jitter=0, serial=True), concurrent_reads)) >= 2 * latency
+    assert asyncio.run(serve(SimConfig(latency=latency, jitter=0, serial=False), concurrent_reads)) < 2 * latency
+
+
+def test_values_fit_the_register():
+    rng = random.Random(1)
+    for quantity in (POWER, TEMP):
+        # an int16 register with a scale of 100 only holds +/-327.68, less than the typical power in W
+        model = PropModel(ModbusProp(0, I16(scale=100), None, "p", "P", quantity, "%.2f", None), rng)
+        low, high = model.prop.valtype.raw_range()
+        raws = [struct.unpack(">h", struct.pack(">H", *model.registers(t, 0)))[0] for t in range(0, 7200, 10)]
+        assert low < min(raws) and max(raws) < high
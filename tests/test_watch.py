@@ -0,0 +1,52 @@
+from pathlib import Path
+
+from gen_conf import gen_conf
+from utils.inventory import load_inventory
+from watch import Watcher
+
+INVENTORY = """
+from devices import BlueLogInverter, BlueLogSensor
+from openhab.modbus import ModbusMaster
+
+files = {{
+    "sol": [
+        ModbusMaster("10.0.0.1", "A", {{1: BlueLogInverter("Inverter", "A1"), 2: BlueLogSensor("Sensor", "A1")}}),
+        # same IP and slave IDs as the master above
+        ModbusMaster("10.0.0.1", "B", {{1: BlueLogInverter("Inverter", "B1"), 2: BlueLogSensor("Sensor", "B1")}},
+                     {offset}),
+    ],
+}}
+"""
+
+
+def generated(conf_path: Path) -> dict[str, str]:
+    return {str(path.relative_to(conf_path)): path.read_text(encoding="utf-8")
+            for path in sorted(conf_path.glob("*/*")) if path.is_file()}
+
+
+def cold_run(inventory: Path, conf_path: Path) -> dict[str, str]:
+    for directory in ("things", "items"):
+        (conf_path / directory).mkdir(parents=True)
+    files, ignore = load_inventory(inventory)
+    for file, masters in files.items():
+        gen_conf(file, masters, file in ignore, conf_path)
+    return generated(conf_path)
+
+
+def test_masters_sharing_an_ip(tmp_path):
+    inventory = tmp_path / "inventory.py"
+    watched = tmp_path / "watch"
+    for directory in (watched / "things", watched / "items", tmp_path / "flux"):
+        directory.mkdir(parents=True)
+    watcher = Watcher(inventory, watched, tmp_path / "flux", manifest_path=tmp_path / "manifest.json")
+
+    inventory.write_text(INVENTORY.format(offset=100))
+    watcher.regenerate({inventory})
+    assert generated(watched) == cold_run(inventory, tmp_path / "cold")
+    assert watcher.cache.misses == 4
+
+    # only the second master changes
+    inventory.write_text(INVENTORY.format(offset=0))
+    watcher.regenerate({inventory})
+    assert generated(watched) == cold_run(inventory, tmp_path / "cold_changed")
+    assert watcher.cache.misses == 6 and watcher.cache.hits == 2
@@ -0,0 +1,16 @@
+import runpy
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).parent.parent
+DEFAULT_INVENTORY = ROOT_PATH / "__main__.py"
+
+
+def load_inventory(path=DEFAULT_INVENTORY) -> tuple[dict, set]:
+    """
+    Loads an inventory script (by default, the `__main__.py` file) without running its generation code
+
+    :param path: Path of a Python file defining `files` and optionally `ignore`
+    :return: the `files` and `ignore` variables defined in the script
+    """
+    scope = runpy.run_path(str(path), run_name="inventory")
+    return scope["files"], scope.get("ignore", set())
@@ -0,0 +1,115 @@
+import json
+import time
+import tracemalloc
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+DISABLED_STAGE = nullcontext()
+"""Context manager of all the stages while profiling is disabled (reusable, so that nothing is created per call)"""
+
+
+@dataclass
+class StageStats:
+    """
+    Aggregated measurements of a stage, over all its calls
+    """
+    path: str
+    """Stage names from the outermost stage, joined with `;` (example: `gen_conf;sol;split_props`)"""
+    calls: int = 0
+    time: float = 0
+    """Total wall time, in seconds"""
+    self_time: float = 0
+    """Wall time not spent in child stages, in seconds"""
+    peak: int = 0
+    """Highest peak of traced memory allocations during a call, above the memory in use when the call started, in bytes"""
+
+
+class Profiler:
+    """
+    Records the wall time and memory peak of nested generation stages, as well as counters.
+
+    Disabled by default: stages and counters then cost (almost) nothing.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stages: dict[str, StageStats] = {}
+        self.counters: dict[str, int] = {}
+        self.stack: list[list] = []
+        """Running stages, as [path, start time, child time, peak memory, start memory] lists"""
+
+    def start(self):
+        self.enabled = True
+        tracemalloc.start()
+
+    def stage(self, name: str) -> AbstractContextManager:
+        if not self.enabled:
+            return DISABLED_STAGE
+        return self.timed_stage(name)
+
+    @contextmanager
+    def timed_stage(self, name: str):
+        """
+        Measures a stage, nested in the running one
+        """
+        parent = self.stack[-1] if self.stack else None
+        if parent:
+            # the peak is reset for this stage, so save what the parent reached until now
+            parent[3] = max(parent[3], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        path = f"{parent[0]};{name}" if parent else name
+        # created on entry, so that parents are listed before their children
+        stats = self.stages.setdefault(path, StageStats(path))
+        frame = [path, time.perf_counter(), 0.0, current, current]
+        self.stack.append(frame)
+        try:
+            yield
+        finally:
+            self.stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            peak = max(frame[3], tracemalloc.get_traced_memory()[1])
+            stats.calls += 1
+            stats.time += elapsed
+            stats.self_time += elapsed - frame[2]
+            stats.peak = max(stats.peak, peak - frame[4])
+            if parent:
+                parent[2] += elapsed
+                parent[3] = max(parent[3], peak)
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self) -> dict:
+        return {
+            "stages": [asdict(s) for s in self.stages.values()],
+            "counters": self.counters,
+        }
+
+    def folded(self) -> str:
+        """
+        Returns the self time of the stages in the "folded stacks" format (in microseconds), which flame graph tools
+        (flamegraph.pl, speedscope, inferno...) can read
+        """
+        return "".join(f"{s.path} {round(s.self_time * 1e6)}\n" for s in self.stages.values())
+
+    def save(self, path: Path):
+        """
+        Writes the JSON report to `path` and the folded stacks next to it (with the `.folded` extension)
+        """
+        path.write_text(json.dumps(self.report(), indent=2) + "\n")
+        path.with_suffix(".folded").write_text(self.folded())
+
+    def summary(self) -> str:
+        lines = [f"{'stage':<40} {'calls':>7} {'time (ms)':>10} {'self (ms)':>10} {'peak (KiB)':>11}"]
+        for s in self.stages.values():
+            name = "  " * s.path.count(";") + s.path.rsplit(";", 1)[-1]
+            lines.append(f"{name:<40} {s.calls:>7} {s.time * 1000:>10.1f} {s.self_time * 1000:>10.1f} {s.peak / 1024:>11.1f}")
+        lines += [f"{name}: {value}" for name, value in self.counters.items()]
+        return "\n".join(lines)
+
+
+profiler = Profiler()
+"""Profiler of the current run, enabled by the `--profile` option"""
@@ -0,0 +1,72 @@
+import json
+import sqlite3
+from itertools import groupby
+from typing import Iterator, Optional
+
+
+class SpoolRows:
+    """
+    Rows of a stream of a spool, that can be iterated several times (each iteration reads them again from the spool)
+    """
+
+    def __init__(self, spool: "Spool", stream: str):
+        self.spool = spool
+        self.stream = stream
+
+    def __iter__(self) -> Iterator[list]:
+        cursor = self.spool.db.execute("SELECT value FROM rows WHERE stream = ? ORDER BY id", (self.stream,))
+        return (json.loads(value) for value, in cursor)
+
+
+class Spool:
+    """
+    Rows appended to named streams during a single pass over the inventory, and read back once the pass is over. They
+    are kept in a temporary SQLite database on disk, of which only a bounded page cache stays in memory, so the memory
+    used doesn't depend on the number of rows.
+
+    >>> with Spool() as spool:
+    ...     spool.append("targets", ["A1", "A2"], key="10.0.0.1")
+    ...     spool.append("targets", ["B1"], key="10.0.0.2")
+    ...     spool.append("targets", ["A3"], key="10.0.0.1")
+    ...     list(spool.groups("targets"))
+    [('10.0.0.1', [['A1', 'A2'], ['A3']]), ('10.0.0.2', [['B1']])]
+    """
+
+    def __init__(self):
+        # an empty file name is a private database in a temporary file, deleted when it is closed
+        self.db = sqlite3.connect("")
+        self.db.execute("CREATE TABLE rows (id INTEGER PRIMARY KEY, stream TEXT NOT NULL, key TEXT, value TEXT NOT NULL)")
+        self.db.execute("CREATE INDEX rows_stream ON rows (stream, key)")
+
+    def __enter__(self) -> "Spool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.db.close()
+
+    def append(self, stream: str, row: list, key: Optional[str] = None):
+        """
+        Appends a row (a list of JSON values) to a stream
+
+        :param key: Key the rows are grouped by in `groups`
+        """
+        self.db.execute("INSERT INTO rows (stream, key, value) VALUES (?, ?, ?)", (stream, key, json.dumps(row)))
+
+    def rows(self, stream: str) -> SpoolRows:
+        """
+        Returns the rows of a stream, in the order they were appended
+        """
+        return SpoolRows(self, stream)
+
+    def groups(self, stream: str) -> Iterator[tuple[str, list[list]]]:
+        """
+        Returns the rows of a stream grouped by key, in the order each key was first appended (only the rows of a
+        single key are in memory at a time)
+        """
+        cursor = self.db.execute("""
+            SELECT rows.key, value FROM rows
+            JOIN (SELECT key, min(id) AS first FROM rows WHERE stream = ? GROUP BY key) AS keys ON rows.key = keys.key
+            WHERE stream = ? ORDER BY keys.first, rows.id
+        """, (stream, stream))
+        for key, group in groupby(cursor, key=lambda row: row[0]):
+            yield key, [json.loads(value) for _, value in group]
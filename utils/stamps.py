@@ -0,0 +1,111 @@
+import hashlib
+import inspect
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+from utils.inventory import ROOT_PATH
+
+STAMPS_PATH = ROOT_PATH / ".stamps.json"
+"""Digests of the inputs of each artifact, as of its last build"""
+
+
+def digest(*parts) -> str:
+    """
+    Returns a digest of strings, bytes or values with a stable `repr`
+
+    >>> digest("a", 1) == digest("a", 1) != digest("a", 2)
+    True
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else part.encode() if isinstance(part, str) else repr(part).encode()
+        # the length avoids ambiguities between ("ab", "c") and ("a", "bc")
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+_file_digests: dict[Path, tuple[tuple, str]] = {}
+
+
+def file_digest(path: Path) -> str:
+    """
+    Returns the digest of the content of a file (memoized as long as its size and modification time don't change)
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _file_digests.get(path)
+    if cached is None or cached[0] != key:
+        cached = _file_digests[path] = (key, digest(path.read_bytes()))
+    return cached[1]
+
+
+def source_digest(objects: Iterable) -> str:
+    """
+    Returns the digest of the source files of modules or classes (for classes, of every module of their hierarchy)
+    """
+    files = set()
+    for obj in objects:
+        for item in inspect.getmro(obj) if inspect.isclass(obj) else (obj,):
+            try:
+                files.add(Path(inspect.getfile(item)).resolve())
+            except TypeError:
+                pass  # built-in
+    return digest(*((str(f), file_digest(f)) for f in sorted(files)))
+
+
+@dataclass
+class Stamps:
+    """
+    Content-addressed build graph: each artifact records the digest of its inputs when it is built, and is only built
+    again when that digest changes (or when its outputs are missing). Inputs can be source files, rendered content, or
+    the digest of another artifact, which chains the artifacts.
+    """
+    path: Path = STAMPS_PATH
+    stamps: dict[str, str] = field(default_factory=dict)
+    """Digest of the inputs of each artifact, by name (example: `conf:sol`, `task:custom_alerts.flux`)"""
+
+    @classmethod
+    def load(cls, path: Path = STAMPS_PATH) -> "Stamps":
+        try:
+            return cls(path, json.loads(path.read_text()))
+        except (FileNotFoundError, ValueError):
+            return cls(path)
+
+    def fresh(self, artifact: str, inputs: str, outputs: Iterable[Path] = ()) -> bool:
+        """
+        Returns whether an artifact was built from the same inputs and all its outputs still exist
+        """
+        return self.stamps.get(artifact) == inputs and all(Path(p).exists() for p in outputs)
+
+    def record(self, artifact: str, inputs: str):
+        """
+        Records that an artifact was built from the given inputs
+        """
+        self.stamps[artifact] = inputs
+
+    def names(self, prefix: str) -> set[str]:
+        """
+        Returns the recorded artifacts whose name starts with `prefix`
+        """
+        return {name for name in self.stamps if name.startswith(prefix)}
+
+    def forget(self, prefix: str, keep: Iterable[str] = ()) -> set[str]:
+        """
+        Removes the artifacts whose name starts with `prefix`, except `keep`
+
+        :return: the removed artifacts
+        """
+        removed = self.names(prefix) - set(keep)
+        for name in removed:
+            del self.stamps[name]
+        return removed
+
+    def save(self):
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        tmp.write_text(json.dumps(self.stamps, indent=2, sort_keys=True) + "\n")
+        os.replace(tmp, self.path)
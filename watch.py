@@ -0,0 +1,140 @@
+import sys
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from gen_conf import CONF_PATH, RenderCache, Sharding, gen_conf, update_manifest
+from influxdb.config import GEN_PATH, TASK_PATH, render_tasks, sync_tasks
+from openhab.ping_check import MANIFEST_PATH, gen_ping_check
+from utils.inventory import DEFAULT_INVENTORY, ROOT_PATH, load_inventory
+from utils.profile import profiler
+
+DEVICES_PATH = ROOT_PATH / "devices"
+
+INTERVAL = 0.2
+"""Polling interval of the watched files, in seconds"""
+
+
+def snapshot(inventory: Path) -> dict[Path, int]:
+    """
+    Returns the modification time of the watched files: the device modules, the inventory and the Flux templates
+    """
+    mtimes = {}
+    for path in (inventory, *DEVICES_PATH.glob("*.py"), *TASK_PATH.glob("*.flux")):
+        try:
+            mtimes[path.resolve()] = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            pass
+    return mtimes
+
+
+def unload_devices(changed: set[Path]) -> list[str]:
+    """
+    Removes the changed device modules, and the device modules importing classes from them, from `sys.modules`, so that
+    the inventory imports them again. The other device modules keep their classes, so the slave groups using them are
+    taken from the render cache.
+
+    :return: the names of the removed modules
+    """
+    modules = {name: module for name, module in sys.modules.items() if name.startswith("devices.")}
+    stale = {name for name, module in modules.items()
+             if getattr(module, "__file__", None) and Path(module.__file__).resolve() in changed}
+    while dependent := {name for name, module in modules.items() if name not in stale
+                        and any(getattr(value, "__module__", None) in stale for value in vars(module).values())}:
+        stale |= dependent
+    for name in stale:
+        del sys.modules[name]
+    return sorted(stale)
+
+
+class Watcher:
+    """
+    Keeps the inventory, the rendered slave groups and the rendered tasks in memory, and regenerates what changed
+    """
+
+    def __init__(self, inventory: Path = DEFAULT_INVENTORY, conf_path: Path = CONF_PATH, gen_dir: Path = GEN_PATH,
+                 sharding: Optional[Sharding] = None, push_tasks: bool = False, manifest_path: Path = MANIFEST_PATH):
+        """
+        :param push_tasks: Synchronize the changed tasks with InfluxDB
+        :param manifest_path: Path of the generated ping check manifest
+        """
+        self.inventory = inventory.resolve()
+        self.conf_path = conf_path
+        self.gen_dir = gen_dir
+        self.manifest_path = manifest_path
+        self.sharding = sharding
+        self.push_tasks = push_tasks
+        self.cache = RenderCache()
+        self.files: dict[str, list] = {}
+        self.tasks: dict[str, str] = {}
+
+    def regenerate(self, changed: set[Path]) -> list[str]:
+        """
+        Regenerates the outputs depending on the changed files. Only the changed slave groups are resolved again, and
+        only the changed files are written.
+
+        :return: a description of the applied changes
+        """
+        report = []
+        if any(path.suffix != ".flux" for path in changed):
+            report += [f"reloaded {name}" for name in unload_devices(changed)]
+            with profiler.stage("inventory"):
+                files, ignore = load_inventory(self.inventory)
+
+            with profiler.stage("gen_conf"):
+                for file, masters in files.items():
+                    written, removed = gen_conf(file, masters, file in ignore, self.conf_path, self.sharding, self.cache)
+                    report += [f"written conf/{path}" for path in written] + [f"removed conf/{path}" for path in removed]
+                for file in self.files.keys() - files.keys():
+                    report += [f"removed conf/{path}" for path in update_manifest(self.conf_path, file, [])]
+                    self.cache.files.pop(file, None)
+
+            with profiler.stage("gen_ping_check"):
+                if gen_ping_check({f: m for f, m in files.items() if f not in ignore}, self.manifest_path):
+                    report.append(f"written {self.manifest_path}")
+            self.files = files
+
+        with profiler.stage("gen_tasks"):
+            tasks = render_tasks(self.files)
+            for file, flux in tasks.items():
+                if self.tasks.get(file) != flux:
+                    (self.gen_dir / file).write_text(flux, encoding="utf-8")
+                    report.append(f"written influxdb/generated/{file}")
+            if self.push_tasks and tasks != self.tasks:
+                for action, names in sync_tasks(tasks).items():
+                    report += [f"task {action}: {name}" for name in names]
+            self.tasks = tasks
+        return report
+
+
+def watch(inventory: Path = DEFAULT_INVENTORY, sharding: Optional[Sharding] = None, push_tasks: bool = False,
+          interval: float = INTERVAL):
+    """
+    Generates everything, then polls the device modules, the inventory and the Flux templates, and regenerates what
+    depends on them whenever they change
+    """
+    watcher = Watcher(inventory, sharding=sharding, push_tasks=push_tasks)
+    mtimes = snapshot(watcher.inventory)
+    changed = set(mtimes)
+    print(f"Watching {DEVICES_PATH}, {watcher.inventory} and {TASK_PATH}")
+    while True:
+        if changed:
+            start = time.perf_counter()
+            try:
+                report = watcher.regenerate(changed)
+            except Exception:
+                # for example a syntax error in a device module: keep watching, the next save will be retried
+                traceback.print_exc()
+            else:
+                for line in report:
+                    print(f"  {line}")
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"[{datetime.now():%H:%M:%S}] {len(changed)} file(s) changed, regenerated in {elapsed:.0f} ms "
+                      f"({watcher.cache.hits} slave groups cached, {watcher.cache.misses} rendered)")
+                watcher.cache.hits = watcher.cache.misses = 0
+        time.sleep(interval)
+        current = snapshot(watcher.inventory)
+        changed = {path for path in current.keys() | mtimes.keys() if current.get(path) != mtimes.get(path)}
+        mtimes = current